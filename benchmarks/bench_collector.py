@@ -0,0 +1,170 @@
+"""Per-event cost of the client pool event handlers.
+
+Compares the state table used by
+:class:`sqlalchemy_collectd.client.collector.CollectionTarget` against the
+earlier approach of tracking each DBAPI connection by ``id()`` in a set
+per state.  Handlers are invoked directly with stand-in connection and
+record objects so that only the bookkeeping itself is measured.
+
+Usage::
+
+    python benchmarks/bench_collector.py
+
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import timeit
+from unittest import mock
+
+from sqlalchemy_collectd.client import collector
+from sqlalchemy_collectd.client import worker
+
+
+class _Record:
+    __slots__ = ("info",)
+
+    def __init__(self):
+        self.info = {}
+
+
+class _DBAPIConnection:
+    __slots__ = ()
+
+
+class SetBasedCollector:
+    """The id() / set implementation used prior to the state table."""
+
+    def __init__(self):
+        self.connections = set()
+        self.checkedin = set()
+        self.invalidated = set()
+        self.detached = set()
+        self.transactions = set()
+        self.checkedout = 0
+        self.total_checkouts = 0
+        self.total_connects = 0
+        self.total_disconnects = 0
+
+    def is_checkedout(self, id_):
+        return (
+            id_ in self.connections
+            and id_ not in self.checkedin
+            and id_ not in self.invalidated
+            and id_ not in self.detached
+        )
+
+    def _connect_evt(self, dbapi_conn, connection_rec):
+        id_ = id(dbapi_conn)
+        self.total_connects += 1
+        self.connections.add(id_)
+        self.checkedin.add(id_)
+
+    def _checkout_evt(self, dbapi_conn, connection_rec, connection_proxy):
+        id_ = id(dbapi_conn)
+        self.total_checkouts += 1
+        self.checkedin.remove(id_)
+        if self.is_checkedout(id_):
+            self.checkedout += 1
+
+    def _checkin_evt(self, dbapi_conn, connection_rec):
+        id_ = id(dbapi_conn)
+        if self.is_checkedout(id_):
+            self.checkedout -= 1
+        self.checkedin.add(id_)
+
+    def _reset_evt(self, dbapi_conn, connection_rec):
+        self.transactions.discard(id(dbapi_conn))
+
+    def _close_evt(self, dbapi_conn, connection_rec):
+        id_ = id(dbapi_conn)
+        if self.is_checkedout(id_):
+            self.checkedout -= 1
+        self.transactions.discard(id_)
+        self.invalidated.discard(id_)
+        self.checkedin.discard(id_)
+        self.connections.remove(id_)
+        self.detached.discard(id_)
+        self.total_disconnects += 1
+
+
+def _state_table_collector():
+    engine = mock.Mock(logging_name=None)
+    with mock.patch.object(collector, "event"):
+        return collector.EngineCollector(
+            collector.CollectionTarget("bench"), engine
+        )
+
+
+def _memory(impl):
+    if isinstance(impl, SetBasedCollector):
+        return sum(
+            sys.getsizeof(s)
+            for s in (
+                impl.connections,
+                impl.checkedin,
+                impl.invalidated,
+                impl.detached,
+                impl.transactions,
+            )
+        )
+    else:
+        target = impl.collection_target
+        return sys.getsizeof(target.states) + sys.getsizeof(target._free_slots)
+
+
+def run(pool_size, number):
+    results = {}
+    for name, impl in [
+        ("sets", SetBasedCollector()),
+        ("state table", _state_table_collector()),
+    ]:
+        conns = [(_DBAPIConnection(), _Record()) for i in range(pool_size)]
+        with mock.patch.object(worker, "_check_threads_started"):
+            for dbapi_conn, rec in conns:
+                impl._connect_evt(dbapi_conn, rec)
+
+        checkout = impl._checkout_evt
+        checkin = impl._checkin_evt
+        reset = impl._reset_evt
+
+        def cycle():
+            for dbapi_conn, rec in conns:
+                checkout(dbapi_conn, rec, None)
+            for dbapi_conn, rec in conns:
+                reset(dbapi_conn, rec)
+                checkin(dbapi_conn, rec)
+
+        events = 3 * pool_size * number
+        elapsed = min(timeit.repeat(cycle, number=number, repeat=5))
+        results[name] = (elapsed / events * 1e9, _memory(impl))
+
+        for dbapi_conn, rec in conns:
+            impl._close_evt(dbapi_conn, rec)
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--events",
+        type=int,
+        default=300000,
+        help="approximate number of events timed per pool size",
+    )
+    options = parser.parse_args(argv)
+
+    print(
+        "%10s  %-12s %12s %14s"
+        % ("pool size", "impl", "ns / event", "memory (bytes)")
+    )
+    for pool_size in (10, 100, 1000, 10000):
+        number = max(1, options.events // (3 * pool_size))
+        for name, (ns, memory) in run(pool_size, number).items():
+            print("%10d  %-12s %12.1f %14d" % (pool_size, name, ns, memory))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Per-value cost of dispatching values to collectd from the server plugin.
+
+Dispatches the values reported for a fleet of hosts and program names to
+a stand-in for the ``collectd`` module, whose Values objects do nothing on
+dispatch.  :class:`sqlalchemy_collectd.server.dispatcher.CollectdDispatcher`,
+which sets fields on one reused collectd.Values per host and program name,
+is compared against ``Values.send_to_collectd()``, which constructs a
+collectd.Values for each value.
+
+The stand-in is a plain Python class, so this measures the work on the
+Python side only; a real collectd.Values is a C extension type.
+
+Usage::
+
+    python benchmarks/bench_dispatch.py [--hosts 1000] [--prognames 10]
+
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import timeit
+
+from sqlalchemy_collectd import protocol
+from sqlalchemy_collectd.server import dispatcher
+
+
+class FakeCollectd:
+    class Values:
+        def __init__(
+            self,
+            type="",
+            type_instance="",
+            plugin="",
+            plugin_instance="",
+            host="",
+            time=0,
+            interval=0,
+            values=(),
+        ):
+            self.type = type
+            self.type_instance = type_instance
+            self.plugin = plugin
+            self.plugin_instance = plugin_instance
+            self.host = host
+            self.time = time
+            self.interval = interval
+            self.values = values
+
+        def dispatch(self):
+            pass
+
+
+def _summary(hosts, prognames):
+    return [
+        protocol.Values(
+            type="count",
+            type_instance=type_instance,
+            plugin="sqlalchemy",
+            plugin_instance=plugin_instance,
+            host="host%d" % host,
+            time=1517607042,
+            interval=10,
+            values=[5],
+        )
+        for host in range(hosts)
+        for plugin_instance in ["prog%d" % i for i in range(prognames)]
+        + ["host"]
+        for type_instance in (
+            "numpools",
+            "checkedout",
+            "checkedin",
+            "detached",
+            "connections",
+        )
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hosts", type=int, default=1000)
+    parser.add_argument("--prognames", type=int, default=10)
+    options = parser.parse_args(argv)
+
+    values = _summary(options.hosts, options.prognames)
+    collectd = FakeCollectd()
+    log = logging.getLogger("bench")
+    dispatcher_ = dispatcher.CollectdDispatcher(collectd, log)
+
+    def send_to_collectd():
+        for values_obj in values:
+            values_obj.send_to_collectd(collectd, log)
+
+    def dispatch_all():
+        dispatcher_.dispatch_all(values)
+
+    print("%d values per read" % len(values))
+    for name, fn in [
+        ("send_to_collectd", send_to_collectd),
+        ("dispatcher", dispatch_all),
+    ]:
+        elapsed = min(timeit.repeat(fn, number=1, repeat=5))
+        print(
+            "%-18s %8.1f ms  (%.2f usec / value)"
+            % (name, elapsed * 1000, elapsed / len(values) * 1e6)
+        )
+
+
+if __name__ == "__main__":
+    main()
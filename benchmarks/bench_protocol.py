@@ -0,0 +1,276 @@
+"""Per-message cost of packing and unpacking collectd messages.
+
+Compares :class:`sqlalchemy_collectd.protocol.MessagePacker`, which packs
+each value block with precompiled structs into a reused buffer and caches
+encoded header parts, against the earlier implementation that built each
+message by concatenating ``bytes`` objects, packing each value with its own
+struct and encoding each string part for every message.
+
+Also compares :class:`sqlalchemy_collectd.protocol.MessageUnpacker`, which
+decodes in place from a memoryview of the packet, against the earlier
+implementation that passed a copy of the remainder of the packet to the
+decoder for each part, for packets of known types and of unknown types.
+
+The Values packed are those the client plugin sends for one interval.
+
+Usage::
+
+    python benchmarks/bench_protocol.py
+
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import struct
+import timeit
+from unittest import mock
+
+from sqlalchemy_collectd import collectd_types
+from sqlalchemy_collectd import protocol
+from sqlalchemy_collectd.client import sender
+
+
+class ConcatenatingMessagePacker:
+    """The bytes concatenation implementation used prior to the
+    precompiled structs."""
+
+    def __init__(self, types):
+        self._types = {type_.name: type_ for type_ in types}
+
+    def pack_values(self, values_obj):
+        type_obj = self._types[values_obj.type]
+
+        _pack_string = self._pack_string
+        header_ = (
+            _pack_string(protocol.TYPE_HOST, values_obj.host)
+            + protocol.header.pack(protocol.TYPE_TIME, 12)
+            + protocol.long_.pack(int(values_obj.time))
+            + _pack_string(protocol.TYPE_PLUGIN, values_obj.plugin)
+            + _pack_string(
+                protocol.TYPE_PLUGIN_INSTANCE, values_obj.plugin_instance
+            )
+            + _pack_string(protocol.TYPE_TYPE, type_obj.name)
+            + struct.pack(
+                "!HHq", protocol.TYPE_INTERVAL, 12, int(values_obj.interval)
+            )
+            + _pack_string(
+                protocol.TYPE_TYPE_INSTANCE, values_obj.type_instance
+            )
+        )
+
+        msg = type_obj._message_template
+        for format_, dsvalue in zip(
+            type_obj._value_formats, values_obj.values
+        ):
+            msg += format_.pack(dsvalue)
+
+        return header_ + msg
+
+    def _pack_string(self, typecode, value):
+        value = value or ""
+        return (
+            protocol.header.pack(typecode, 5 + len(value))
+            + value.encode("ascii")
+            + b"\0"
+        )
+
+
+class SlicingMessageUnpacker:
+    """The unpacker used prior to decoding from a memoryview, extended to
+    decode any number of values parts."""
+
+    def __init__(self, types):
+        self._receivers = {
+            protocol.TYPE_HOST: self._unpack_string,
+            protocol.TYPE_TIME: self._unpack_long,
+            protocol.TYPE_PLUGIN: self._unpack_string,
+            protocol.TYPE_PLUGIN_INSTANCE: self._unpack_string,
+            protocol.TYPE_TYPE: self._unpack_string,
+            protocol.TYPE_TYPE_INSTANCE: self._unpack_string,
+            protocol.TYPE_VALUES: self._unpack_values,
+            protocol.TYPE_INTERVAL: self._unpack_long,
+            protocol.TYPE_TIME_HR: self._unpack_hr,
+            protocol.TYPE_INTERVAL_HR: self._unpack_hr,
+        }
+        self._types = {type_.name: type_ for type_ in types}
+
+    def unpack_all(self, buf):
+        pos = 0
+        length = len(buf)
+        result = {}
+        values = []
+        while pos < length:
+            type_, len_ = protocol.header.unpack_from(buf, pos)
+            value = self._receivers[type_](type_, len_, buf[pos:])
+            if type_ == protocol.TYPE_TIME_HR:
+                type_ = protocol.TYPE_TIME
+            elif type_ == protocol.TYPE_INTERVAL_HR:
+                type_ = protocol.TYPE_INTERVAL
+            result[type_] = value
+            if (
+                type_ == protocol.TYPE_VALUES
+                and result[protocol.TYPE_TYPE] in self._types
+            ):
+                values.append(
+                    protocol.Values(
+                        host=result[protocol.TYPE_HOST],
+                        time=result[protocol.TYPE_TIME],
+                        plugin=result[protocol.TYPE_PLUGIN],
+                        plugin_instance=result[protocol.TYPE_PLUGIN_INSTANCE],
+                        type=result[protocol.TYPE_TYPE],
+                        type_instance=result[protocol.TYPE_TYPE_INSTANCE],
+                        values=result[protocol.TYPE_VALUES],
+                        interval=result[protocol.TYPE_INTERVAL],
+                    )
+                )
+            pos += len_
+        return values
+
+    def _unpack_long(self, type_, length, buf):
+        return protocol.long_.unpack_from(buf, protocol.header.size)[0]
+
+    def _unpack_hr(self, type_, length, buf):
+        return (
+            protocol._hr.unpack_from(buf, protocol.header.size)[0]
+            / protocol.HR_UNITS_PER_SECOND
+        )
+
+    def _unpack_string(self, type_, length, buf):
+        return buf[protocol.header.size : length - 1].decode("ascii")
+
+    def _unpack_values(self, type_, length, buf):
+        num = protocol.short.unpack_from(buf, protocol.header.size)[0]
+        types_start = protocol.header.size + protocol.short.size
+        values_pos = types_start + num * protocol.char.size
+        result = []
+        for pos in range(0, num * protocol.char.size, protocol.char.size):
+            value_type = protocol.char.unpack_from(buf, types_start + pos)[0]
+            struct_ = protocol._value_formats[value_type]
+            result.append(struct_.unpack_from(buf, values_pos)[0])
+            values_pos += struct_.size
+        return result
+
+
+def _interval_values():
+    target = mock.Mock(
+        num_pools=1,
+        num_checkedout=5,
+        num_checkedin=15,
+        num_detached=0,
+        num_connections=20,
+        total_checkouts=12345,
+        total_invalidated=0,
+        total_connects=30,
+        total_disconnects=10,
+        total_transactions=5000,
+        total_commits=4900,
+        total_rollbacks=100,
+        total_waits=3,
+        total_wait_time=0.25,
+        total_timeouts=0,
+        track_statements=False,
+    )
+    target.checkout_time.snapshot_and_reset.return_value = [
+        float(i) for i in range(24)
+    ]
+    snd = sender.Sender.__new__(sender.Sender)
+    snd.hostname = "somehost.example.com"
+    snd.stats_name = "my_application"
+    snd.plugin = collectd_types.COLLECTD_PLUGIN_NAME
+    return snd.collect(target, 1517607042, 10, "12345:a1b2c3")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--number", type=int, default=20000, help="intervals packed per run"
+    )
+    options = parser.parse_args(argv)
+
+    values = _interval_values()
+    types = [protocol_type for protocol_type, fn in sender.senders]
+
+    old = ConcatenatingMessagePacker(types)
+    new = protocol.MessagePacker(types, mock.Mock())
+
+    # both implementations must produce the same values; the current one
+    # uses high resolution time and interval parts
+    unpacker = protocol.MessageUnpacker(types, mock.Mock())
+    for values_obj in values:
+        assert unpacker.unpack_bytes(
+            old.pack_values(values_obj)
+        ) == unpacker.unpack_bytes(new.pack_values(values_obj))
+
+    def run_old():
+        for values_obj in values:
+            old.pack_values(values_obj)
+
+    def run_new():
+        for values_obj in values:
+            new.pack_values(values_obj)
+
+    def run_new_many():
+        for packet in new.pack_many(values):
+            pass
+
+    print("%-32s %12s" % ("pack", "usec / value"))
+    _report(
+        [
+            ("concatenation", run_old),
+            ("precompiled, one per message", run_new),
+            ("precompiled, pack_many", run_new_many),
+        ],
+        options.number,
+        len(values),
+    )
+
+    # a full packet's worth of values, as sent by a host with several
+    # program names
+    many_values = [
+        values_obj.build(plugin_instance="program%d" % i)
+        for i in range(10)
+        for values_obj in values
+    ]
+    packet = next(new.pack_many(many_values))
+    num_values = len(
+        protocol.MessageUnpacker(types, mock.Mock()).unpack_all(packet)
+    )
+
+    # the server logs a warning for each values part of an unknown type;
+    # this is quiet when that's not enabled
+    log = logging.getLogger("bench_protocol")
+    log.setLevel(logging.ERROR)
+
+    old_unpacker = SlicingMessageUnpacker(types)
+    new_unpacker = protocol.MessageUnpacker(types, log)
+    unknown_unpacker = protocol.MessageUnpacker([], log)
+    assert old_unpacker.unpack_all(packet) == new_unpacker.unpack_all(packet)
+
+    print()
+    print(
+        "%-32s %12s   (%d values in a %d byte packet)"
+        % ("unpack", "usec / value", num_values, len(packet))
+    )
+    _report(
+        [
+            ("slicing", lambda: old_unpacker.unpack_all(packet)),
+            ("memoryview", lambda: new_unpacker.unpack_all(packet)),
+            (
+                "memoryview, unknown types",
+                lambda: unknown_unpacker.unpack_all(packet),
+            ),
+        ],
+        options.number // 10,
+        num_values,
+    )
+
+
+def _report(fns, number, num_values):
+    for name, fn in fns:
+        elapsed = min(timeit.repeat(fn, number=number, repeat=5))
+        print("%-32s %12.2f" % (name, elapsed / (number * num_values) * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Maximum sustained packet rate of the server receive loop.
+
+Sends packets over the loopback interface to a
+:class:`sqlalchemy_collectd.networking.UDPServerReceiver` at a fixed rate
+from a separate thread, and reports whether the receiver took in every
+packet.  The rate is doubled until packets are dropped, then bisected to
+find the highest rate received with no drops.
+
+The batched loop, which takes all the datagrams that have arrived at each
+wakeup with ``receive_batch_async()``, is compared against the earlier
+loop that awaited each packet with ``receive_values_async()``.
+
+Each packet carries the Values the client plugin sends for one interval.
+
+Usage::
+
+    python benchmarks/bench_receiver.py [--seconds 2]
+
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import socket
+import time
+from unittest import mock
+
+from sqlalchemy_collectd import collectd_types
+from sqlalchemy_collectd import networking
+from sqlalchemy_collectd import protocol
+from sqlalchemy_collectd.client import sender
+
+
+def _packet(types):
+    target = mock.Mock(
+        num_pools=1,
+        num_checkedout=5,
+        num_checkedin=15,
+        num_detached=0,
+        num_connections=20,
+        total_checkouts=12345,
+        total_invalidated=0,
+        total_connects=30,
+        total_disconnects=10,
+        total_transactions=5000,
+        total_commits=4900,
+        total_rollbacks=100,
+        total_waits=3,
+        total_wait_time=0.25,
+        total_timeouts=0,
+        track_statements=False,
+    )
+    target.checkout_time.snapshot_and_reset.return_value = [
+        float(i) for i in range(24)
+    ]
+    snd = sender.Sender.__new__(sender.Sender)
+    snd.hostname = "somehost.example.com"
+    snd.stats_name = "my_application"
+    snd.plugin = collectd_types.COLLECTD_PLUGIN_NAME
+    packer = protocol.MessagePacker(types, mock.Mock())
+    (packet,) = packer.pack_many(
+        snd.collect(target, 1517607042, 10, "12345:a1b2c3")
+    )
+    return packet
+
+
+async def batched(receiver):
+    return len(await receiver.receive_batch_async())
+
+
+async def per_packet(receiver):
+    return len(list(await receiver.receive_values_async()))
+
+
+def _send(addr, packet, rate, seconds):
+    count = int(rate * seconds)
+    start = time.perf_counter()
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for i in range(count):
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            sock.sendto(packet, addr)
+    return count
+
+
+async def _run(receive, types, packet, rate, seconds):
+    connection = await networking.UDPServerReceiver.receive_from_send_clients(
+        "127.0.0.1", 0, logging.getLogger("bench")
+    )
+    receiver = networking.AsyncNetworkReceiver(connection, types)
+    values_per_packet = len(list(receiver.iter_values(packet)))
+    addr = connection._transport.get_extra_info("sockname")
+
+    loop = asyncio.get_running_loop()
+    sent = loop.run_in_executor(None, _send, addr, packet, rate, seconds)
+
+    received = 0
+    try:
+        while True:
+            try:
+                received += await asyncio.wait_for(receive(receiver), 0.5)
+            except asyncio.TimeoutError:
+                if sent.done():
+                    break
+    finally:
+        connection._transport.close()
+
+    return await sent, received // values_per_packet
+
+
+def sustained(receive, types, packet, rate, seconds):
+    """Return True if every packet sent at ``rate`` was received."""
+    sent, received = asyncio.run(_run(receive, types, packet, rate, seconds))
+    return received == sent
+
+
+def max_rate(receive, types, packet, seconds, start=1000):
+    low, high = 0, start
+    while sustained(receive, types, packet, high, seconds):
+        low, high = high, high * 2
+        if high > 1000000:
+            return low
+
+    while high - low > max(low // 20, 100):
+        mid = (low + high) // 2
+        if sustained(receive, types, packet, mid, seconds):
+            low = mid
+        else:
+            high = mid
+    return low
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--seconds", type=float, default=2, help="time to send at each rate"
+    )
+    options = parser.parse_args(argv)
+
+    types = [protocol_type for protocol_type, fn in sender.senders]
+    packet = _packet(types)
+
+    print("%-12s %20s" % ("loop", "max packets / sec"))
+    for name, receive in [("per packet", per_packet), ("batched", batched)]:
+        print(
+            "%-12s %20d"
+            % (name, max_rate(receive, types, packet, options.seconds))
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Checkout throughput of the client event handlers at several sample rates.
+
+Each checkout is a checkout / reset / checkin cycle of the pool event
+handlers, plus one statement through the cursor execute handlers when
+``--statements`` is given.  Handlers are invoked directly with stand-in
+connection and record objects, as in ``bench_collector.py``, so that the
+numbers reflect only what the plugin adds to each checkout.
+
+Usage::
+
+    python benchmarks/bench_sampling.py [--statements]
+
+"""
+from __future__ import annotations
+
+import argparse
+import timeit
+from unittest import mock
+
+from sqlalchemy_collectd.client import collector
+from sqlalchemy_collectd.client import worker
+
+
+class _Record:
+    __slots__ = ("info",)
+
+    def __init__(self):
+        self.info = {}
+
+
+class _Connection:
+    __slots__ = ("info",)
+
+    def __init__(self):
+        self.info = {}
+
+
+class _DBAPIConnection:
+    __slots__ = ()
+
+
+STATEMENT = "SELECT t.id, t.data FROM t WHERE t.id = ?"
+
+
+def run(sample_rate, pool_size, number, statements):
+    engine = mock.Mock(logging_name=None)
+    with mock.patch.object(collector, "event"):
+        impl = collector.EngineCollector(
+            collector.CollectionTarget("bench"),
+            engine,
+            track_statements=statements,
+            sample_rate=sample_rate,
+        )
+
+    conns = [
+        (_DBAPIConnection(), _Record(), _Connection())
+        for i in range(pool_size)
+    ]
+    with mock.patch.object(worker, "_check_threads_started"):
+        for dbapi_conn, rec, conn in conns:
+            impl._connect_evt(dbapi_conn, rec)
+
+    checkout = impl._checkout_evt
+    checkin = impl._checkin_evt
+    reset = impl._reset_evt
+    before_execute = impl._before_cursor_execute_evt
+    after_execute = impl._after_cursor_execute_evt
+
+    if statements:
+
+        def cycle():
+            for dbapi_conn, rec, conn in conns:
+                checkout(dbapi_conn, rec, None)
+                before_execute(conn, None, STATEMENT, (), None, False)
+                after_execute(conn, None, STATEMENT, (), None, False)
+            for dbapi_conn, rec, conn in conns:
+                reset(dbapi_conn, rec)
+                checkin(dbapi_conn, rec)
+
+    else:
+
+        def cycle():
+            for dbapi_conn, rec, conn in conns:
+                checkout(dbapi_conn, rec, None)
+            for dbapi_conn, rec, conn in conns:
+                reset(dbapi_conn, rec)
+                checkin(dbapi_conn, rec)
+
+    elapsed = min(timeit.repeat(cycle, number=number, repeat=5))
+    return pool_size * number / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--checkouts",
+        type=int,
+        default=200000,
+        help="number of checkouts timed per sample rate",
+    )
+    parser.add_argument(
+        "--statements",
+        action="store_true",
+        help="track statements, executing one statement per checkout",
+    )
+    options = parser.parse_args(argv)
+
+    pool_size = 100
+    number = max(1, options.checkouts // pool_size)
+
+    print("%12s %18s" % ("sample rate", "checkouts / sec"))
+    for sample_rate in (1.0, 0.1, 0.01):
+        print(
+            "%12.2f %18.0f"
+            % (
+                sample_rate,
+                run(sample_rate, pool_size, number, options.statements),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Cost of the server plugin's summarize() for a large number of processes.
+
+Fills a :class:`sqlalchemy_collectd.server.receiver.Receiver` with one
+interval's worth of records from a synthetic fleet of client processes,
+spread across a number of hosts and program names, then times a call to
+``summarize()``, which aggregates the records of each host / program name
+and translates them into the "external" types reported to collectd.
+
+The Receiver, which keeps running sums per host / program name and per
+host as records are stored, and rebuilds the external values of only the
+groups that changed, is compared against the earlier implementation that
+sorted and grouped every record, summed each group and built its external
+values on every call.  summarize() is also timed after records from a
+fraction of the processes are received again.
+
+Usage::
+
+    python benchmarks/bench_summarize.py [--hosts 1000] [--processes 50000]
+        [--churn 0.01]
+
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import random
+import time
+import timeit
+
+from sqlalchemy_collectd import collectd_types
+from sqlalchemy_collectd import histogram
+from sqlalchemy_collectd import protocol
+from sqlalchemy_collectd.server import receiver
+
+
+class SortingReceiver(receiver.Receiver):
+    """The implementation used prior to the running sums, which sorts
+    every record on each call."""
+
+    def summarize(self, timestamp):
+        for type_ in self.collectd_types:
+            if type_ is collectd_types.statement_internal:
+                yield from self.get_top_statements(timestamp)
+                continue
+
+            for values_obj in self.get_stats_by_progname(
+                type_.name, timestamp
+            ):
+                yield from self.translator.break_into_individual_values(
+                    values_obj
+                )
+
+            for values_obj in self.get_stats_by_hostname(
+                type_.name, timestamp
+            ):
+                yield from self.translator.break_into_individual_values(
+                    values_obj
+                )
+
+        yield from self.get_self_stats(timestamp)
+
+    def get_stats_by_progname(self, bucket_name, timestamp):
+        records = self.buckets[bucket_name].get_data(timestamp)
+        for _, keys in itertools.groupby(
+            sorted(records), key=lambda rec: (rec[0], rec[1], rec[2])
+        ):
+            recs = [records[key] for key in keys]
+            interval = recs[0].interval
+            yield protocol.Values.sum(recs).build(
+                time=timestamp, interval=interval
+            )
+
+    def get_stats_by_hostname(self, bucket_name, timestamp):
+        records = self.buckets[bucket_name].get_data(timestamp)
+        for _, keys in itertools.groupby(
+            sorted(records), key=lambda rec: (rec[0], rec[1])
+        ):
+            recs = [records[key] for key in keys]
+            interval = recs[0].interval
+            yield protocol.Values.sum(recs).build(
+                plugin_instance="host", time=timestamp, interval=interval
+            )
+
+
+def _fill(receiver_, processes, hosts, prognames, timestamp):
+    """Store one interval's worth of messages from each of the given
+    processes."""
+    rand = random.Random(5)
+    interval = 10
+    messages = 0
+    for proc in processes:
+        host = "host%d" % (proc % hosts)
+        progname = "prog%d" % (proc % prognames)
+        process_token = "%d:abcdef" % proc
+        values = protocol.Values(
+            host=host,
+            plugin=collectd_types.COLLECTD_PLUGIN_NAME,
+            plugin_instance=progname,
+            type_instance=process_token,
+            interval=interval,
+            time=timestamp,
+        )
+        checkout_time = [0] * histogram.NUM_BUCKETS
+        for i in range(50):
+            checkout_time[rand.randrange(histogram.NUM_BUCKETS)] += 1
+        for type_, values_ in [
+            (
+                collectd_types.pool_internal,
+                [1, rand.randint(0, 10), rand.randint(0, 10), 0, 20],
+            ),
+            (
+                collectd_types.totals_internal,
+                [rand.randint(0, 10000), 0, 30, 10],
+            ),
+            (collectd_types.pool_wait_internal, [3, 1500, 0]),
+            (collectd_types.transactions_internal, [4900, 100, 5000]),
+            (collectd_types.checkout_time_internal, checkout_time),
+        ]:
+            receiver_._set_stats(values.build(type=type_.name, values=values_))
+            messages += 1
+    return messages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", type=int, default=50000)
+    parser.add_argument("--hosts", type=int, default=1000)
+    parser.add_argument("--prognames", type=int, default=10)
+    parser.add_argument(
+        "--churn",
+        type=float,
+        default=0.01,
+        help="fraction of processes received again between summarize calls",
+    )
+    options = parser.parse_args(argv)
+
+    timestamp = time.time()
+    churned = random.Random(10).sample(
+        range(options.processes), int(options.processes * options.churn)
+    )
+
+    print(
+        "%d processes on %d hosts, %d program names"
+        % (options.processes, options.hosts, options.prognames)
+    )
+    for name, receiver_cls in [
+        ("sorting", SortingReceiver),
+        ("running sums", receiver.Receiver),
+    ]:
+        receiver_ = receiver_cls(None)
+
+        start = time.perf_counter()
+        messages = _fill(
+            receiver_,
+            range(options.processes),
+            options.hosts,
+            options.prognames,
+            timestamp,
+        )
+        fill_time = time.perf_counter() - start
+
+        def run():
+            return sum(1 for values_obj in receiver_.summarize(timestamp + 1))
+
+        reported = run()
+        elapsed = min(timeit.repeat(run, number=1, repeat=5))
+
+        churn_elapsed = []
+        for i in range(5):
+            _fill(
+                receiver_,
+                churned,
+                options.hosts,
+                options.prognames,
+                timestamp,
+            )
+            churn_elapsed.append(timeit.timeit(run, number=1))
+
+        print("%s:" % name)
+        print(
+            "    store:     %8.1f ms  (%.2f usec / message)"
+            % (fill_time * 1000, fill_time / messages * 1e6)
+        )
+        print(
+            "    summarize: %8.1f ms  (%d values reported)"
+            % (elapsed * 1000, reported)
+        )
+        print(
+            "    summarize after %d processes received: %8.1f ms"
+            % (len(churned), min(churn_elapsed) * 1000)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Per-message cost of storing records in a stream.TimeBucket.
+
+Stores one record per message for a fleet of client processes, each
+reporting once per interval, the way the server plugin's Receiver does for
+every message received.  :class:`sqlalchemy_collectd.stream.TimeBucket`,
+which expires records from a heap ordered by expiry time, is compared
+against the earlier implementation that checked every stored record for
+expiry on each call.
+
+Usage::
+
+    python benchmarks/bench_time_bucket.py [--processes 10000]
+
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+from sqlalchemy_collectd import stream
+
+
+class ScanningTimeBucket(stream.TimeBucket):
+    """The implementation used prior to the expiry heap, which checks
+    every record on each call."""
+
+    __slots__ = ()
+
+    def _get_bucket(self, timestamp, interval):
+        if interval is not None:
+            self.last_interval = interval
+
+        for k in list(self.bucket):
+            ts, b_interval, value = self.bucket[k]
+            if ts < timestamp - b_interval * self.interval_factor:
+                del self.bucket[k]
+
+        self.last_timestamp = timestamp
+        return stream.DictFacade(timestamp, interval, self.bucket)
+
+
+def run(bucket_cls, processes, intervals, interval=10):
+    bucket = bucket_cls()
+    start = time.perf_counter()
+    messages = 0
+    for n in range(intervals):
+        # each process reports once per interval, at its own offset
+        base = n * interval
+        for proc in range(processes):
+            timestamp = base + interval * proc / processes
+            records = bucket.get_data(timestamp, interval=interval * 2)
+            records[("host", "prog", proc)] = messages
+            messages += 1
+    return (time.perf_counter() - start) / messages * 1e6, len(bucket.bucket)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", type=int, default=10000)
+    parser.add_argument("--intervals", type=int, default=3)
+    options = parser.parse_args(argv)
+
+    print("%-10s %18s %12s" % ("bucket", "usec / message", "records"))
+    for name, bucket_cls in [
+        ("scan", ScanningTimeBucket),
+        ("heap", stream.TimeBucket),
+    ]:
+        usec, records = run(bucket_cls, options.processes, options.intervals)
+        print("%-10s %18.2f %12d" % (name, usec, records))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Idle cost of the client worker thread.
+
+Runs the worker thread with a target whose sender does nothing, and
+reports how often the thread wakes up and how much CPU time the process
+uses while the main thread sleeps.  The deadline scheduler in
+:mod:`sqlalchemy_collectd.client.worker` is compared against the earlier
+loop that polled every target each 0.2 seconds.
+
+Usage::
+
+    python benchmarks/bench_worker_idle.py [--seconds 10] [--interval 2]
+
+"""
+from __future__ import annotations
+
+import argparse
+import threading
+import time
+from unittest import mock
+
+from sqlalchemy_collectd.client import worker
+
+
+class _Sender:
+    def send(self, collection_target, now, interval, process_token):
+        pass
+
+
+class _CountingCondition:
+    """Wraps a Condition, counting calls to wait()."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.waits = 0
+
+    def __enter__(self):
+        return self.condition.__enter__()
+
+    def __exit__(self, *arg):
+        return self.condition.__exit__(*arg)
+
+    def notify(self):
+        self.condition.notify()
+
+    def wait(self, timeout=None):
+        self.waits += 1
+        return self.condition.wait(timeout)
+
+
+def polling(seconds, interval):
+    """The 0.2 second polling loop used prior to the deadline scheduler."""
+    targets = {("bench", _Sender()): [0]}
+    wakeups = 0
+    end = time.time() + seconds
+    while time.time() < end:
+        now = time.time()
+        for (collection_target, sender), last_called in targets.items():
+            if now - last_called[0] > interval:
+                last_called[0] = now
+                sender.send(collection_target, now, interval, "bench")
+        wakeups += 1
+        time.sleep(0.2)
+    return wakeups
+
+
+def scheduler(seconds, interval):
+    condition = _CountingCondition()
+    with mock.patch.object(
+        worker, "_schedule_condition", condition
+    ), mock.patch.object(worker, "_WORKER_THREAD", None), mock.patch.object(
+        worker, "_collection_targets", {}
+    ), mock.patch.object(
+        worker, "_schedule", []
+    ):
+        worker.add_target("bench", _Sender(), interval=interval)
+        time.sleep(seconds)
+    return condition.waits
+
+
+def measure(fn, seconds, interval):
+    if fn is polling:
+        thread_result = []
+        thread = threading.Thread(
+            target=lambda: thread_result.append(fn(seconds, interval)),
+            daemon=True,
+        )
+        start_cpu = time.process_time()
+        thread.start()
+        thread.join()
+        wakeups = thread_result[0]
+    else:
+        start_cpu = time.process_time()
+        wakeups = fn(seconds, interval)
+    cpu = time.process_time() - start_cpu
+    return wakeups / seconds, cpu / seconds * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--seconds", type=float, default=10, help="time to run each loop"
+    )
+    parser.add_argument(
+        "--interval", type=float, default=2, help="reporting interval"
+    )
+    options = parser.parse_args(argv)
+
+    print("%-12s %14s %18s" % ("loop", "wakeups / sec", "cpu usec / sec"))
+    for name, fn in [("polling", polling), ("scheduler", scheduler)]:
+        wakeups, cpu = measure(fn, options.seconds, options.interval)
+        print("%-12s %14.2f %18.1f" % (name, wakeups, cpu))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Packet throughput of the server plugin with worker processes.
+
+Starts a synthetic fleet of client processes which send packets over the
+loopback interface as fast as they can, each from several sockets so that
+the kernel spreads them over the ``SO_REUSEPORT`` sockets of the workers.
+With no workers, one thread receives and decodes everything, as the server
+plugin does by default; otherwise that number of worker processes decode
+and forward Values to that thread, as with the server plugin's ``Workers``
+option.  Reports the number of client packets whose Values are stored per
+second by the :class:`sqlalchemy_collectd.server.receiver.Receiver`.
+
+Each packet carries the Values the client plugin sends for one interval,
+and each comes from a distinct process token, so that a worker doesn't
+merge packets it receives within a forwarding interval; in practice a
+client process sends only once per interval.  Throughput scales with the
+workers only up to the number of cores not taken by the clients.
+
+Usage::
+
+    python benchmarks/bench_workers.py [--seconds 5] [--clients 4]
+        [--workers 0 1 2 4]
+
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import threading
+import time
+from unittest import mock
+
+from sqlalchemy_collectd import collectd_types
+from sqlalchemy_collectd import networking
+from sqlalchemy_collectd import protocol
+from sqlalchemy_collectd.client import sender
+from sqlalchemy_collectd.server import receiver
+from sqlalchemy_collectd.server import workers
+
+# process tokens are replaced in the packet, so they're all the same length
+_TOKEN = "%05d:%06d"
+
+
+def _packet(types):
+    target = mock.Mock(
+        num_pools=1,
+        num_checkedout=5,
+        num_checkedin=15,
+        num_detached=0,
+        num_connections=20,
+        total_checkouts=12345,
+        total_invalidated=0,
+        total_connects=30,
+        total_disconnects=10,
+        total_transactions=5000,
+        total_commits=4900,
+        total_rollbacks=100,
+        total_waits=3,
+        total_wait_time=0.25,
+        total_timeouts=0,
+        track_statements=False,
+    )
+    target.checkout_time.snapshot_and_reset.return_value = [
+        float(i) for i in range(24)
+    ]
+    snd = sender.Sender.__new__(sender.Sender)
+    snd.hostname = "somehost.example.com"
+    snd.stats_name = "my_application"
+    snd.plugin = collectd_types.COLLECTD_PLUGIN_NAME
+    packer = protocol.MessagePacker(types, mock.Mock())
+    (packet,) = packer.pack_many(
+        snd.collect(target, time.time(), 10, _TOKEN % (0, 0))
+    )
+    return packet
+
+
+class CountingReceiver(receiver.Receiver):
+    num_received = 0
+
+    def _set_stats(self, values):
+        self.num_received += 1
+        super()._set_stats(values)
+
+
+def _client(client, packet, num_packets, addr, num_sockets, stop):
+    token = (_TOKEN % (0, 0)).encode("ascii")
+    packets = [
+        packet.replace(token, (_TOKEN % (client, i)).encode("ascii"))
+        for i in range(num_packets)
+    ]
+    socks = [
+        socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for i in range(num_sockets)
+    ]
+    while not stop.is_set():
+        for i in range(0, num_packets, num_sockets):
+            for sock, packet in zip(socks, packets[i : i + num_sockets]):
+                sock.sendto(packet, addr)
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _server(receiver_, types, port, num_workers, started, stop):
+    async def run():
+        if num_workers:
+            network_receiver = workers.WorkerNetworkReceiver.start(
+                "127.0.0.1", port, mock.Mock(), types, num_workers
+            )
+        else:
+            network_receiver = networking.AsyncNetworkReceiver(
+                await networking.UDPServerReceiver.receive_from_send_clients(
+                    "127.0.0.1", port, mock.Mock()
+                ),
+                types,
+            )
+        receiver_.network_receiver = network_receiver
+        started.set()
+        while not stop.is_set():
+            await receiver_.receive()
+        if num_workers:
+            network_receiver.close()
+
+    asyncio.run(run())
+
+
+def run(num_workers, num_clients, num_packets, seconds):
+    types = receiver.Receiver.collectd_types
+    packet = _packet(types)
+    values_per_packet = len(
+        list(protocol.MessageUnpacker(types, mock.Mock()).iter_values(packet))
+    )
+
+    port = _free_port()
+    receiver_ = CountingReceiver(None)
+    started = threading.Event()
+    stop_server = threading.Event()
+    server = threading.Thread(
+        target=_server,
+        args=(receiver_, types, port, num_workers, started, stop_server),
+        daemon=True,
+    )
+    server.start()
+    started.wait()
+
+    stop = multiprocessing.Event()
+    clients = [
+        multiprocessing.Process(
+            target=_client,
+            args=(i, packet, num_packets, ("127.0.0.1", port), 8, stop),
+        )
+        for i in range(num_clients)
+    ]
+    for client in clients:
+        client.start()
+
+    # let the workers start and the receive buffers fill up before
+    # measuring
+    time.sleep(2)
+    start_count = receiver_.num_received
+    time.sleep(seconds)
+    received = receiver_.num_received - start_count
+
+    stop.set()
+    for client in clients:
+        client.join()
+    stop_server.set()
+
+    return received / values_per_packet / seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--seconds", type=float, default=5, help="time to measure each run"
+    )
+    parser.add_argument(
+        "--clients", type=int, default=4, help="number of client processes"
+    )
+    parser.add_argument(
+        "--packets",
+        type=int,
+        default=20000,
+        help="number of distinct packets each client sends in turn",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[0, 1, 2, 4],
+        help="numbers of worker processes to run; 0 receives in-process",
+    )
+    options = parser.parse_args(argv)
+
+    print("%-8s %16s" % ("workers", "packets / sec"))
+    for num_workers in options.workers:
+        rate = run(
+            num_workers, options.clients, options.packets, options.seconds
+        )
+        print("%-8d %16d" % (num_workers, rate))
+
+
+if __name__ == "__main__":
+    main()
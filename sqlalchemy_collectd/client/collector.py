@@ -1,48 +1,114 @@
 from __future__ import annotations
 
+import array
 import logging
+import random
 import threading
+import time
+from typing import Any
 from typing import Dict
+from typing import List
 import weakref
 
 from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.util import queue as sqla_queue
 
 from . import worker
+from .. import histogram
+from .. import sketch
+
+# state flags stored for each connection slot in CollectionTarget.states.
+# a connection is "checked out" when it is connected and none of
+# checkedin, invalidated or detached are set.
+CONNECTED = 0x01
+CHECKEDIN = 0x02
+
+# not clear if this is useful yet.  only "soft" invalidated
+# will actually be present.  still counting them so that
+# we can return an accurate checkout count.
+INVALIDATED = 0x04
+
+DETACHED = 0x08
+
+# connections where we've seen begin().
+# doesn't include DBAPI implicit transactions
+TRANSACTION = 0x10
+
+_STATE_FLAGS = (CONNECTED, CHECKEDIN, INVALIDATED, DETACHED, TRANSACTION)
+_CHECKEDOUT_MASK = CONNECTED | CHECKEDIN | INVALIDATED | DETACHED
+
+_random = random.random
+
+# key within connection_record.info where the slot number is stored
+_SLOT_KEY = "sqlalchemy_collectd_slot"
+
+# key within Connection.info where the start time of the statement
+# being executed is stored
+_STATEMENT_START_KEY = "sqlalchemy_collectd_statement_start"
 
 
 class CollectionTarget:
     targets: Dict[str, CollectionTarget] = {}
     create_mutex = threading.Lock()
 
+    # when True, reading num_checkedout compares the running counts against
+    # those computed from the state table.  intended for test suites only.
+    consistency_check = False
+
+    states: array.array[int]
+    checkout_times: array.array[float]
+    tallies: List[int]
+
     def __init__(self, name):
         self.name = name
 
         self.collectors = weakref.WeakSet()
 
-        # all identifiers for known DBAPI connections
-        self.connections = set()
+        # one byte of state flags for each DBAPI connection, indexed by
+        # a slot number that's stored in the connection record's info
+        # dictionary.  slots for closed connections are reused.
+        self.states = array.array("B")
+
+        # time.perf_counter() at which each checked out connection was
+        # checked out, or zero, indexed by slot
+        self.checkout_times = array.array("d")
 
-        # identifers for connections that have not been checked out
-        # or were checked in
-        self.checkedin = set()
+        self._free_slots = []
+        self._slot_mutex = threading.Lock()
 
-        # not clear if this is useful yet.  only "soft" invalidated
-        # will actually be present.  still counting them so that
-        # we can return an accurate checkout count.
-        self.invalidated = set()
+        # running count of slots having each state flag, indexed by flag
+        self.tallies = [0] * (max(_STATE_FLAGS) + 1)
 
-        # detached connections.
-        self.detached = set()
+        # running count of connections that are checked out
+        self.checkedout = 0
 
-        # identifiers for connections where we've seen begin().
-        # doesn't include DBAPI implicit transactions
-        self.transactions = set()
+        # durations between checkout and checkin over the current interval
+        self.checkout_time = histogram.Histogram()
 
         self.total_checkouts = 0
         self.total_invalidated = 0
         self.total_connects = 0
         self.total_disconnects = 0
 
+        # waits for a connection from an exhausted QueuePool, total seconds
+        # spent waiting, and waits that ended in a pool timeout
+        self.total_waits = 0
+        self.total_wait_time = 0.0
+        self.total_timeouts = 0
+
+        self.total_transactions = 0
+        self.total_commits = 0
+        self.total_rollbacks = 0
+
+        # set to True by an EngineCollector that tracks statements
+        self.track_statements = False
+
+        # execution time of statements over the current interval, and
+        # the fingerprints that took the most time
+        self.statement_time = histogram.Histogram()
+        self.statements = sketch.SpaceSaving()
+
     @classmethod
     def collection_for_name(cls, name):
         cls.create_mutex.acquire()
@@ -55,46 +121,150 @@ class CollectionTarget:
         finally:
             cls.create_mutex.release()
 
+    def allocate_slot(self) -> int:
+        """Return a slot for a new connection, in the checked in state."""
+
+        self._slot_mutex.acquire()
+        try:
+            if self._free_slots:
+                slot = self._free_slots.pop()
+                self.states[slot] = CONNECTED | CHECKEDIN
+            else:
+                slot = len(self.states)
+                self.states.append(CONNECTED | CHECKEDIN)
+                self.checkout_times.append(0.0)
+        finally:
+            self._slot_mutex.release()
+
+        tallies = self.tallies
+        tallies[CONNECTED] += 1
+        tallies[CHECKEDIN] += 1
+        return slot
+
+    def release_slot(self, slot: int) -> None:
+        """Remove a connection from the table, making its slot available."""
+
+        state = self.states[slot]
+        if state & _CHECKEDOUT_MASK == CONNECTED:
+            self.checkedout -= 1
+
+        tallies = self.tallies
+        for flag in _STATE_FLAGS:
+            if state & flag:
+                tallies[flag] -= 1
+
+        self.states[slot] = 0
+        self.checkout_times[slot] = 0.0
+
+        self._slot_mutex.acquire()
+        try:
+            self._free_slots.append(slot)
+        finally:
+            self._slot_mutex.release()
+
+    def set_flag(self, slot: int, flag: int) -> None:
+        states = self.states
+        state = states[slot]
+        if not state & flag:
+            if state & _CHECKEDOUT_MASK == CONNECTED:
+                self.checkedout -= 1
+            states[slot] = state | flag
+            self.tallies[flag] += 1
+
+    def clear_flag(self, slot: int, flag: int) -> None:
+        states = self.states
+        state = states[slot]
+        if state & flag:
+            state &= ~flag
+            states[slot] = state
+            self.tallies[flag] -= 1
+            if state & _CHECKEDOUT_MASK == CONNECTED:
+                self.checkedout += 1
+
+    def has_flag(self, slot: int, flag: int) -> bool:
+        return bool(self.states[slot] & flag)
+
     @property
     def num_pools(self):
         return len(self.collectors)
 
     @property
     def num_checkedout(self):
-        checkedout = (
-            self.connections.difference(self.detached)
-            .difference(self.invalidated)
-            .difference(self.checkedin)
-        )
-        return len(checkedout)
+        if self.consistency_check:
+            self._check_tallies()
+        return self.checkedout
+
+    def _check_tallies(self):
+        tallies = [0] * len(self.tallies)
+        checkedout = 0
+        for state in self.states:
+            for flag in _STATE_FLAGS:
+                if state & flag:
+                    tallies[flag] += 1
+            if state & _CHECKEDOUT_MASK == CONNECTED:
+                checkedout += 1
+
+        if tallies != self.tallies or checkedout != self.checkedout:
+            raise AssertionError(
+                "running counts %r / %d checked out for target %r do "
+                "not match counts %r / %d from the state table"
+                % (
+                    self.tallies,
+                    self.checkedout,
+                    self.name,
+                    tallies,
+                    checkedout,
+                )
+            )
 
     @property
     def num_checkedin(self):
-        return len(self.checkedin)
+        return self.tallies[CHECKEDIN]
 
     @property
     def num_detached(self):
-        return len(self.detached)
+        return self.tallies[DETACHED]
 
     @property
     def num_invalidated(self):
-        return len(self.invalidated)
+        return self.tallies[INVALIDATED]
 
     @property
     def num_connections(self):
-        return len(self.connections)
+        return self.tallies[CONNECTED]
 
     @property
     def num_transactions(self):
-        return len(self.transactions)
+        return self.tallies[TRANSACTION]
 
 
 class EngineCollector:
-    def __init__(self, collection_target, engine):
+    def __init__(
+        self,
+        collection_target,
+        engine,
+        track_statements=False,
+        sample_rate=1.0,
+    ):
         self.collection_target = collection_target
         self.engine = engine
         collection_target.collectors.add(self)
 
+        if not 0 < sample_rate <= 1:
+            raise ValueError(
+                "sample_rate must be greater than 0 and at most 1; got %r"
+                % (sample_rate,)
+            )
+
+        # timing of checkouts and statements takes place for this fraction
+        # of events, chosen at random.  the counts recorded for the
+        # timings are scaled by the sample weight so that totals come
+        # out as though every event were timed.  counts of connections,
+        # checkouts etc. are exact and don't make use of sampling.
+        self.sample_rate = sample_rate
+        self.sample_weight = 1 / sample_rate
+        self._sampling = sample_rate < 1
+
         eng = engine
         event.listen(eng, "connect", self._connect_evt)
         event.listen(eng, "checkout", self._checkout_evt)
@@ -105,59 +275,212 @@ class EngineCollector:
         event.listen(eng, "close", self._close_evt)
         event.listen(eng, "detach", self._detach_evt)
         event.listen(eng, "close_detached", self._close_detached_evt)
-
-        self.connections = collection_target.connections
-        self.checkedin = collection_target.checkedin
-        self.transactions = collection_target.transactions
-        self.invalidated = collection_target.invalidated
-        self.detached = collection_target.detached
+        event.listen(eng, "engine_disposed", self._engine_disposed_evt)
+        event.listen(eng, "begin", self._begin_evt)
+        event.listen(eng, "commit", self._commit_evt)
+        event.listen(eng, "rollback", self._rollback_evt)
+
+        if track_statements:
+            collection_target.track_statements = True
+            event.listen(
+                eng, "before_cursor_execute", self._before_cursor_execute_evt
+            )
+            event.listen(
+                eng, "after_cursor_execute", self._after_cursor_execute_evt
+            )
+
+        self._instrument_pool(eng.pool)
+
+        # the connection record is no longer available once a
+        # connection is detached, so detached slots are tracked by the
+        # identity of the DBAPI connection.
+        self.detached_slots: Dict[int, int] = {}
+
+        # statement digests per SQLAlchemy compiled construct
+        self._compiled_digests: weakref.WeakKeyDictionary[
+            Any, str
+        ] = weakref.WeakKeyDictionary()
         self.logger = logging.getLogger("%s.%s" % (__name__, eng.logging_name))
 
-    def conn_ident(self, dbapi_connection):
-        return id(dbapi_connection)
+    def _instrument_pool(self, pool):
+        """Time waits for a connection within a QueuePool.
+
+        QueuePool checks out connections from a queue, blocking for up to
+        the pool timeout only once the overflow is exhausted.  The queue's
+        get() method is replaced with one that times the call only when
+        it may block on an empty queue, so that an uncontended pool pays
+        for no more than an additional function call.
+
+        """
+        if not isinstance(pool, QueuePool):
+            return
+
+        queue = pool._pool
+        collection_target = self.collection_target
+        queue_get = queue.get
+        queue_empty = queue.empty
+        perf_counter = time.perf_counter
+
+        def get(block=True, timeout=None):
+            if not block or not queue_empty():
+                return queue_get(block, timeout)
+
+            start = perf_counter()
+            try:
+                return queue_get(block, timeout)
+            except sqla_queue.Empty:
+                # QueuePool raises TimeoutError for this
+                collection_target.total_timeouts += 1
+                raise
+            finally:
+                collection_target.total_waits += 1
+                collection_target.total_wait_time += perf_counter() - start
+
+        queue.get = get
+
+    def _engine_disposed_evt(self, engine):
+        # Engine.dispose() replaces the pool with a new one
+        self._instrument_pool(engine.pool)
+
+    def _begin_evt(self, conn):
+        self.collection_target.total_transactions += 1
+
+    def _commit_evt(self, conn):
+        self.collection_target.total_commits += 1
+
+    def _rollback_evt(self, conn):
+        self.collection_target.total_rollbacks += 1
+
+    def _before_cursor_execute_evt(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        if not self._sampling or _random() < self.sample_rate:
+            conn.info[_STATEMENT_START_KEY] = time.perf_counter()
+        else:
+            # a sampled statement that raised leaves its start time
+            # behind, as there's no after_cursor_execute event for it
+            conn.info.pop(_STATEMENT_START_KEY, None)
+
+    def _after_cursor_execute_evt(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        start = conn.info.pop(_STATEMENT_START_KEY, None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+
+        # an exception raised here would be raised by the application's
+        # call to execute()
+        try:
+            collection_target = self.collection_target
+            weight = self.sample_weight
+            collection_target.statement_time.record(elapsed, weight)
+            collection_target.statements.add(
+                self._digest_for_statement(statement, context), elapsed, weight
+            )
+        except Exception:
+            self.logger.error("error tracking statement", exc_info=True)
+
+    def _digest_for_statement(self, statement, context):
+        # a compiled construct gives many SQL strings that have one
+        # fingerprint, e.g. with IN lists of different lengths, so its
+        # digest is kept for as long as SQLAlchemy keeps it
+        compiled = context.compiled if context is not None else None
+        if compiled is None:
+            return sketch.digest_for_statement(statement)
+
+        digests = self._compiled_digests
+        digest = digests.get(compiled)
+        if digest is None:
+            digest = digests[compiled] = sketch.digest_for_statement(statement)
+        return digest
 
     def _connect_evt(self, dbapi_conn, connection_rec):
         worker._check_threads_started()
-        id_ = self.conn_ident(dbapi_conn)
-        self.collection_target.total_connects += 1
-        self.connections.add(id_)
-        self.checkedin.add(id_)
+        collection_target = self.collection_target
+        collection_target.total_connects += 1
+
+        info = connection_rec.info
+        if _SLOT_KEY in info:
+            # shouldn't be there; the pool clears the info dictionary
+            # before connecting
+            collection_target.release_slot(info[_SLOT_KEY])
+        info[_SLOT_KEY] = collection_target.allocate_slot()
+
+    # checkout / checkin are the most frequent events, so the
+    # CollectionTarget.clear_flag() / set_flag() logic is inlined for them
 
     def _checkout_evt(self, dbapi_conn, connection_rec, connection_proxy):
-        id_ = self.conn_ident(dbapi_conn)
-        self.collection_target.total_checkouts += 1
-        self.checkedin.remove(id_)
+        collection_target = self.collection_target
+        collection_target.total_checkouts += 1
+        try:
+            slot = connection_rec.info[_SLOT_KEY]
+        except KeyError:
+            return
+        states = collection_target.states
+        state = states[slot]
+        if state & CHECKEDIN:
+            state ^= CHECKEDIN
+            states[slot] = state
+            collection_target.tallies[CHECKEDIN] -= 1
+            if state & _CHECKEDOUT_MASK == CONNECTED:
+                collection_target.checkedout += 1
+        if not self._sampling or _random() < self.sample_rate:
+            collection_target.checkout_times[slot] = time.perf_counter()
 
     def _checkin_evt(self, dbapi_conn, connection_rec):
-        id_ = self.conn_ident(dbapi_conn)
-        self.checkedin.add(id_)
+        try:
+            slot = connection_rec.info[_SLOT_KEY]
+        except KeyError:
+            return
+        collection_target = self.collection_target
+        states = collection_target.states
+        state = states[slot]
+        if not state & CHECKEDIN:
+            if state & _CHECKEDOUT_MASK == CONNECTED:
+                collection_target.checkedout -= 1
+            states[slot] = state | CHECKEDIN
+            collection_target.tallies[CHECKEDIN] += 1
+
+        checkout_times = collection_target.checkout_times
+        checkout_time = checkout_times[slot]
+        if checkout_time:
+            collection_target.checkout_time.record(
+                time.perf_counter() - checkout_time, self.sample_weight
+            )
+            checkout_times[slot] = 0.0
 
     def _invalidate_evt(self, dbapi_conn, connection_rec, exc):
-        id_ = self.conn_ident(dbapi_conn)
-        self.collection_target.total_invalidated += 1
-        self.invalidated.add(id_)
+        collection_target = self.collection_target
+        collection_target.total_invalidated += 1
+        slot = connection_rec.info.get(_SLOT_KEY)
+        if slot is not None:
+            collection_target.set_flag(slot, INVALIDATED)
 
     def _reset_evt(self, dbapi_conn, connection_rec):
-        id_ = self.conn_ident(dbapi_conn)
-        # may or may not have been part of "transactions"
-        self.transactions.discard(id_)
+        # may or may not have been part of "transactions".
+        # connection_rec is None for a detached connection
+        if connection_rec is None:
+            slot = self.detached_slots.get(id(dbapi_conn))
+        else:
+            slot = connection_rec.info.get(_SLOT_KEY)
+        if slot is not None:
+            self.collection_target.clear_flag(slot, TRANSACTION)
 
     def _close_evt(self, dbapi_conn, connection_rec):
-        id_ = self.conn_ident(dbapi_conn)
-        self.transactions.discard(id_)
-        self.invalidated.discard(id_)
-        self.checkedin.discard(id_)
-
-        try:
-            self.connections.remove(id_)
-            self.collection_target.total_disconnects += 1
-        except KeyError:
+        slot = connection_rec.info.pop(_SLOT_KEY, None)
+        if slot is None:
             self._warn_missing_connection(dbapi_conn)
+            return
+
+        collection_target = self.collection_target
 
         # this shouldn't be there
-        if id_ in self.detached:
+        if collection_target.has_flag(slot, DETACHED):
             self._warn("shouldn't have detached")
-        self.detached.discard(id_)
+
+        collection_target.release_slot(slot)
+        collection_target.total_disconnects += 1
 
     def _warn_missing_connection(self, dbapi_conn):
         self._warn(
@@ -169,19 +492,18 @@ class EngineCollector:
         self.logger.warn(msg)
 
     def _detach_evt(self, dbapi_conn, connection_rec):
-        id_ = self.conn_ident(dbapi_conn)
-        self.detached.add(id_)
+        # the record will be reused for a new connection, so the slot
+        # moves from the record to the detached_slots dictionary
+        slot = connection_rec.info.pop(_SLOT_KEY, None)
+        if slot is not None:
+            self.detached_slots[id(dbapi_conn)] = slot
+            self.collection_target.set_flag(slot, DETACHED)
 
     def _close_detached_evt(self, dbapi_conn):
-        id_ = self.conn_ident(dbapi_conn)
-
-        self.transactions.discard(id_)
-        self.invalidated.discard(id_)
-        self.checkedin.discard(id_)
-        self.detached.discard(id_)
-
-        try:
-            self.connections.remove(id_)
-            self.collection_target.total_disconnects += 1
-        except KeyError:
+        slot = self.detached_slots.pop(id(dbapi_conn), None)
+        if slot is None:
             self._warn_missing_connection(dbapi_conn)
+            return
+
+        self.collection_target.release_slot(slot)
+        self.collection_target.total_disconnects += 1
@@ -9,6 +9,7 @@ from typing import Dict
 from typing import TYPE_CHECKING
 
 from sqlalchemy.engine import CreateEnginePlugin
+from sqlalchemy.util import asbool
 
 from . import collector
 from . import sender
@@ -41,6 +42,25 @@ class Plugin(CreateEnginePlugin):
         self._get_argument(
             "collectd_program_name", "progname", self.config, url, kwargs
         )
+        self._get_argument(
+            "collectd_track_statements",
+            "track_statements",
+            self.config,
+            url,
+            kwargs,
+            asbool,
+        )
+        self._get_argument(
+            "collectd_sample_rate",
+            "sample_rate",
+            self.config,
+            url,
+            kwargs,
+            float,
+        )
+        self._get_argument(
+            "collectd_interval", "interval", self.config, url, kwargs, float
+        )
 
     def _get_argument(self, name, dest_name, dest, url, kwargs, coerce_=None):
         # favor the URL but pop the name from both
@@ -66,6 +86,9 @@ class Plugin(CreateEnginePlugin):
                 "collectd_port",
                 "collectd_report_host",
                 "collectd_program_name",
+                "collectd_track_statements",
+                "collectd_sample_rate",
+                "collectd_interval",
             ]
         )
 
@@ -94,7 +117,15 @@ def start_plugin(
     progname: str | None = None,
     collectd_host: str = "localhost",
     collectd_port: int = 25827,
+    track_statements: bool = False,
+    sample_rate: float = 1.0,
+    interval: float = worker.DEFAULT_INTERVAL,
 ) -> None:
+    if interval <= 0:
+        raise ValueError(
+            "collectd interval must be greater than zero; got %r" % (interval,)
+        )
+
     if hostname is None:
         hostname = socket.gethostname()
 
@@ -107,7 +138,12 @@ def start_plugin(
     )
 
     # unique per Engine
-    collector.EngineCollector(collection_target, engine)
+    collector.EngineCollector(
+        collection_target,
+        engine,
+        track_statements=track_statements,
+        sample_rate=sample_rate,
+    )
 
     # registry on host/prog/host/port
     sender_ = sender.Sender.get_sender(
@@ -115,4 +151,4 @@ def start_plugin(
     )
 
     # registry on collection_target / sender
-    worker.add_target(collection_target, sender_)
+    worker.add_target(collection_target, sender_, interval)
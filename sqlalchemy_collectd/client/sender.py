@@ -2,10 +2,12 @@ from __future__ import annotations
 
 import threading
 from typing import Dict
+from typing import Iterable
 from typing import List
 from typing import Protocol
 from typing import Tuple
 from typing import TYPE_CHECKING
+from typing import Union
 
 from .. import collectd_types
 from .. import networking
@@ -18,9 +20,12 @@ if TYPE_CHECKING:
 
 
 class _SenderFunction(Protocol):
+    """Return the Values to send for a type, which may also be
+    any number of Values, or None to send nothing."""
+
     def __call__(
         self, values: protocol.Values, collection_target: CollectionTarget
-    ) -> protocol.Values:
+    ) -> Union[protocol.Values, Iterable[protocol.Values], None]:
         ...
 
 
@@ -61,7 +66,16 @@ class Sender:
             [protocol_type for protocol_type, sender in senders],
         )
 
-    def send(self, collection_target, timestamp, interval, process_token):
+    @property
+    def connection(self) -> networking.SyncSender:
+        """The connection that messages are sent on, which is shared by
+        all Sender objects with the same destination."""
+        return self.message_sender.connection
+
+    def collect(
+        self, collection_target, timestamp, interval, process_token
+    ) -> List[protocol.Values]:
+        """Return the Values to send for a collection target."""
         values = protocol.Values(
             host=self.hostname,
             plugin=self.plugin,
@@ -70,8 +84,26 @@ class Sender:
             interval=interval,
             time=timestamp,
         )
+        collected = []
         for protocol_type, sender in senders:
-            self.message_sender.send(sender(values, collection_target))
+            result = sender(values, collection_target)
+            if result is None:
+                continue
+            elif isinstance(result, protocol.Values):
+                collected.append(result)
+            else:
+                collected.extend(result)
+        return collected
+
+    def send(self, collection_target, timestamp, interval, process_token):
+        self.send_many(
+            self.collect(collection_target, timestamp, interval, process_token)
+        )
+
+    def send_many(self, values: Iterable[protocol.Values]) -> None:
+        """Send any number of Values to this Sender's destination, packed
+        into as few packets as possible."""
+        self.message_sender.send_many(values)
 
     @classmethod
     def get_sender(
@@ -123,3 +155,65 @@ def _send_connection_totals(values, collection_target):
             collection_target.total_disconnects,
         ],
     )
+
+
+@sends(collectd_types.transactions_internal)
+def _send_transactions(values, collection_target):
+    return values.build(
+        type=collectd_types.transactions_internal.name,
+        values=[
+            collection_target.total_commits,
+            collection_target.total_rollbacks,
+            collection_target.total_transactions,
+        ],
+    )
+
+
+@sends(collectd_types.pool_wait_internal)
+def _send_pool_wait(values, collection_target):
+    return values.build(
+        type=collectd_types.pool_wait_internal.name,
+        values=[
+            collection_target.total_waits,
+            int(collection_target.total_wait_time * 1000000),
+            collection_target.total_timeouts,
+        ],
+    )
+
+
+@sends(collectd_types.checkout_time_internal)
+def _send_checkout_time(values, collection_target):
+    return values.build(
+        type=collectd_types.checkout_time_internal.name,
+        values=collection_target.checkout_time.snapshot_and_reset(),
+    )
+
+
+@sends(collectd_types.statement_time_internal)
+def _send_statement_time(values, collection_target):
+    if not collection_target.track_statements:
+        return None
+    return values.build(
+        type=collectd_types.statement_time_internal.name,
+        values=collection_target.statement_time.snapshot_and_reset(),
+    )
+
+
+@sends(collectd_types.statement_internal)
+def _send_statements(values, collection_target):
+    if not collection_target.track_statements:
+        return None
+    interval = values.interval
+    return [
+        values.build(
+            type=collectd_types.statement_internal.name,
+            type_instance="%s/%s" % (values.type_instance, digest),
+            values=[time / interval, count / interval],
+        )
+        for (
+            digest,
+            time,
+            count,
+            error,
+        ) in collection_target.statements.snapshot_and_reset()
+    ]
@@ -1,11 +1,20 @@
+import itertools
+import threading
 from unittest import mock
 
 import pytest
+from sqlalchemy import bindparam
 from sqlalchemy import create_engine
+from sqlalchemy import exc
+from sqlalchemy import pool
+from sqlalchemy import text
 
+from .. import collector
 from .. import worker
 from ..collector import CollectionTarget
 from ..collector import EngineCollector
+from ... import histogram
+from ... import sketch
 from ... import testing
 
 
@@ -20,11 +29,13 @@ class CollectorTest(testing.TestBase):
         engine = create_engine("sqlite://")
         collection_target = CollectionTarget("some_target")
         engine_collector = EngineCollector(collection_target, engine)
-        self.assertEqual(collection_target.connections, set())
-        self.assertEqual(collection_target.checkedin, set())
+        self.assertEqual(collection_target.num_connections, 0)
+        self.assertEqual(collection_target.num_checkedin, 0)
         self.assertEqual(collection_target.total_connects, 0)
 
-        with mock.patch.object(worker, "_check_threads_started"):
+        with mock.patch.object(
+            worker, "_check_threads_started"
+        ), mock.patch.object(CollectionTarget, "consistency_check", True):
             yield collection_target, engine_collector, engine
 
         engine.dispose()
@@ -33,39 +44,434 @@ class CollectorTest(testing.TestBase):
         collection_target, engine_collector, engine = collector_fixture
 
         with engine.connect() as conn:
-            ident = id(conn.connection.connection)
+            slot = conn.connection.info[collector._SLOT_KEY]
 
-            self.assertEqual(collection_target.connections, {ident})
-            self.assertEqual(collection_target.checkedin, set())
+            self.assertEqual(collection_target.num_connections, 1)
+            self.assertEqual(collection_target.num_checkedin, 0)
             self.assertEqual(collection_target.total_connects, 1)
+            self.assertEqual(
+                collection_target.states[slot], collector.CONNECTED
+            )
 
-        self.assertEqual(collection_target.checkedin, {ident})
+        self.assertEqual(collection_target.num_checkedin, 1)
+        self.assertEqual(
+            collection_target.states[slot],
+            collector.CONNECTED | collector.CHECKEDIN,
+        )
 
-    @pytest.mark.parametrize("soft", [(True,), (False,)])
+    @pytest.mark.parametrize("soft", [True, False])
     def test_invalidate_event(self, collector_fixture, soft):
         """test #11"""
         collection_target, engine_collector, engine = collector_fixture
 
         with engine.connect() as conn:
-            ident = id(conn.connection.connection)
-
-            self.assertEqual(collection_target.connections, {ident})
-            self.assertEqual(collection_target.checkedin, set())
+            self.assertEqual(collection_target.num_connections, 1)
+            self.assertEqual(collection_target.num_checkedin, 0)
             self.assertEqual(collection_target.total_connects, 1)
             self.assertEqual(collection_target.total_invalidated, 0)
-            self.assertEqual(collection_target.invalidated, set())
+            self.assertEqual(collection_target.num_invalidated, 0)
 
             conn.connection.invalidate(soft=soft)
             self.assertEqual(collection_target.total_invalidated, 1)
 
             if soft:
-                self.assertEqual(collection_target.invalidated, {ident})
+                self.assertEqual(collection_target.num_invalidated, 1)
                 self.assertEqual(collection_target.total_disconnects, 0)
             else:
-                self.assertEqual(collection_target.invalidated, {})
+                self.assertEqual(collection_target.num_invalidated, 0)
                 self.assertEqual(collection_target.total_disconnects, 1)
 
         if soft:
-            self.assertEqual(collection_target.invalidated, {ident})
+            self.assertEqual(collection_target.num_invalidated, 1)
         else:
-            self.assertEqual(collection_target.invalidated, set())
+            self.assertEqual(collection_target.num_invalidated, 0)
+
+        with engine.connect():
+            # soft invalidated connection is replaced on next checkout
+            self.assertEqual(collection_target.num_invalidated, 0)
+            self.assertEqual(collection_target.num_connections, 1)
+            self.assertEqual(collection_target.total_connects, 2)
+
+    def test_checkedout_count(self, collector_fixture):
+        collection_target, engine_collector, engine = collector_fixture
+
+        self.assertEqual(collection_target.num_checkedout, 0)
+
+        with engine.connect():
+            self.assertEqual(collection_target.num_checkedout, 1)
+
+        self.assertEqual(collection_target.num_checkedout, 0)
+
+        with engine.connect():
+            self.assertEqual(collection_target.num_checkedout, 1)
+
+        self.assertEqual(collection_target.num_checkedout, 0)
+        self.assertEqual(collection_target.total_checkouts, 2)
+
+    def test_checkedout_count_invalidate(self, collector_fixture):
+        collection_target, engine_collector, engine = collector_fixture
+
+        with engine.connect() as conn:
+            self.assertEqual(collection_target.num_checkedout, 1)
+            conn.connection.invalidate(soft=True)
+            self.assertEqual(collection_target.num_checkedout, 0)
+
+        self.assertEqual(collection_target.num_checkedout, 0)
+
+        with engine.connect() as conn:
+            self.assertEqual(collection_target.num_checkedout, 1)
+            conn.connection.invalidate()
+            self.assertEqual(collection_target.num_checkedout, 0)
+
+        self.assertEqual(collection_target.num_checkedout, 0)
+        self.assertEqual(collection_target.num_connections, 0)
+
+    def test_checkedout_count_detach(self, collector_fixture):
+        collection_target, engine_collector, engine = collector_fixture
+
+        with engine.connect() as conn:
+            self.assertEqual(collection_target.num_checkedout, 1)
+            conn.connection.detach()
+            self.assertEqual(collection_target.num_checkedout, 0)
+            self.assertEqual(collection_target.num_detached, 1)
+
+        self.assertEqual(collection_target.num_checkedout, 0)
+        self.assertEqual(collection_target.num_detached, 0)
+        self.assertEqual(collection_target.num_connections, 0)
+
+    def test_checkedout_count_shared_target(self):
+        collection_target = CollectionTarget("some_target")
+        engines = [
+            create_engine("sqlite://", poolclass=pool.QueuePool)
+            for i in range(3)
+        ]
+        for engine in engines:
+            EngineCollector(collection_target, engine)
+
+        with mock.patch.object(
+            worker, "_check_threads_started"
+        ), mock.patch.object(CollectionTarget, "consistency_check", True):
+            conns = [engine.connect() for engine in engines for i in range(3)]
+            self.assertEqual(collection_target.num_checkedout, 9)
+
+            for conn in conns[0:4]:
+                conn.close()
+            self.assertEqual(collection_target.num_checkedout, 5)
+            self.assertEqual(collection_target.num_checkedin, 4)
+
+            for conn in conns[4:]:
+                conn.close()
+            self.assertEqual(collection_target.num_checkedout, 0)
+            self.assertEqual(collection_target.num_connections, 9)
+
+            for engine in engines:
+                engine.dispose()
+
+            self.assertEqual(collection_target.num_checkedout, 0)
+            self.assertEqual(collection_target.num_connections, 0)
+
+    def test_consistency_check(self, collector_fixture):
+        collection_target, engine_collector, engine = collector_fixture
+
+        with engine.connect():
+            collection_target.checkedout += 1
+            self.assertRaises(
+                AssertionError, getattr, collection_target, "num_checkedout"
+            )
+            collection_target.checkedout -= 1
+
+    def test_slots_reused(self, collector_fixture):
+        collection_target, engine_collector, engine = collector_fixture
+
+        with engine.connect() as conn:
+            conn.connection.invalidate()
+
+        with engine.connect() as conn:
+            conn.connection.invalidate()
+
+        with engine.connect():
+            pass
+
+        self.assertEqual(len(collection_target.states), 1)
+        self.assertEqual(collection_target.num_connections, 1)
+        self.assertEqual(collection_target.total_connects, 3)
+        self.assertEqual(collection_target.total_disconnects, 2)
+
+    def test_checkout_time(self, collector_fixture):
+        collection_target, engine_collector, engine = collector_fixture
+
+        with mock.patch.object(
+            collector.time, "perf_counter", side_effect=[10.0, 10.25]
+        ):
+            with engine.connect():
+                pass
+
+        counts = collection_target.checkout_time.snapshot_and_reset()
+        self.assertEqual(sum(counts), 1)
+        self.assertEqual(counts[histogram.bucket_for(0.25)], 1)
+        self.assertEqual(
+            sum(collection_target.checkout_time.snapshot_and_reset()), 0
+        )
+
+    def test_pool_wait_uncontended(self):
+        engine = create_engine("sqlite://", poolclass=pool.QueuePool)
+        collection_target = CollectionTarget("some_target")
+        EngineCollector(collection_target, engine)
+
+        with mock.patch.object(worker, "_check_threads_started"):
+            with engine.connect():
+                with engine.connect():
+                    pass
+            with engine.connect():
+                pass
+
+        self.assertEqual(collection_target.total_waits, 0)
+        self.assertEqual(collection_target.total_timeouts, 0)
+        self.assertEqual(collection_target.total_wait_time, 0)
+        engine.dispose()
+
+    def test_pool_wait_and_timeout(self):
+        engine = create_engine(
+            "sqlite://",
+            poolclass=pool.QueuePool,
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=0.05,
+        )
+        collection_target = CollectionTarget("some_target")
+        EngineCollector(collection_target, engine)
+
+        with mock.patch.object(worker, "_check_threads_started"):
+            with engine.connect():
+                self.assertRaises(exc.TimeoutError, engine.connect)
+
+            self.assertEqual(collection_target.total_waits, 1)
+            self.assertEqual(collection_target.total_timeouts, 1)
+            assert collection_target.total_wait_time >= 0.05
+
+            # connection available; no wait
+            with engine.connect():
+                pass
+            self.assertEqual(collection_target.total_waits, 1)
+
+            # pool is replaced on dispose and is instrumented again
+            engine.dispose()
+            with engine.connect():
+                self.assertRaises(exc.TimeoutError, engine.connect)
+
+            self.assertEqual(collection_target.total_waits, 2)
+            self.assertEqual(collection_target.total_timeouts, 2)
+        engine.dispose()
+
+    def test_pool_wait_no_timeout(self):
+        engine = create_engine(
+            "sqlite://",
+            poolclass=pool.QueuePool,
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=5,
+        )
+        collection_target = CollectionTarget("some_target")
+        EngineCollector(collection_target, engine)
+
+        with mock.patch.object(worker, "_check_threads_started"):
+            conn = engine.connect()
+            timer = threading.Timer(0.05, conn.close)
+            timer.start()
+            with engine.connect():
+                pass
+            timer.join()
+
+        self.assertEqual(collection_target.total_waits, 1)
+        self.assertEqual(collection_target.total_timeouts, 0)
+        assert collection_target.total_wait_time >= 0.04
+        engine.dispose()
+
+    def test_transactions(self, collector_fixture):
+        collection_target, engine_collector, engine = collector_fixture
+
+        with engine.begin():
+            pass
+
+        with engine.connect() as conn:
+            trans = conn.begin()
+            trans.rollback()
+
+            conn.begin()
+            # rolled back on close
+
+        self.assertEqual(collection_target.total_transactions, 3)
+        self.assertEqual(collection_target.total_commits, 1)
+        self.assertEqual(collection_target.total_rollbacks, 2)
+
+    def test_statements_not_tracked(self, collector_fixture):
+        collection_target, engine_collector, engine = collector_fixture
+
+        with engine.connect() as conn:
+            conn.exec_driver_sql("select 1")
+
+        self.assertEqual(collection_target.track_statements, False)
+        self.assertEqual(
+            sum(collection_target.statement_time.snapshot_and_reset()), 0
+        )
+        self.assertEqual(collection_target.statements.snapshot_and_reset(), [])
+
+    def test_statements_tracked(self):
+        engine = create_engine("sqlite://")
+        collection_target = CollectionTarget("some_target")
+        EngineCollector(collection_target, engine, track_statements=True)
+
+        with mock.patch.object(worker, "_check_threads_started"):
+            with engine.connect() as conn:
+                for i in range(5):
+                    conn.exec_driver_sql("select %d" % i)
+                conn.exec_driver_sql("select 'x'")
+        engine.dispose()
+
+        self.assertEqual(collection_target.track_statements, True)
+        self.assertEqual(
+            sum(collection_target.statement_time.snapshot_and_reset()), 6
+        )
+        statements = collection_target.statements.snapshot_and_reset()
+        self.assertEqual(
+            [(digest, count) for digest, time, count, error in statements],
+            [(sketch.digest_for_statement("select 1"), 6)],
+        )
+
+    def test_statements_compiled(self):
+        engine = create_engine("sqlite://")
+        collection_target = CollectionTarget("some_target")
+        EngineCollector(collection_target, engine, track_statements=True)
+        stmt = text("select :x in :y").bindparams(
+            bindparam("y", expanding=True)
+        )
+
+        with mock.patch.object(
+            worker, "_check_threads_started"
+        ), mock.patch.object(
+            sketch, "digest_for_statement", wraps=sketch.digest_for_statement
+        ) as digest_for_statement:
+            with engine.connect() as conn:
+                for i in range(1, 4):
+                    conn.execute(stmt, {"x": 1, "y": list(range(i))})
+        engine.dispose()
+
+        # the IN lists of different lengths are one compiled statement,
+        # fingerprinted once
+        self.assertEqual(len(digest_for_statement.mock_calls), 1)
+        statements = collection_target.statements.snapshot_and_reset()
+        self.assertEqual(
+            [(digest, count) for digest, time, count, error in statements],
+            [(sketch.digest_for_statement("select ? in (?)"), 3)],
+        )
+
+    def test_statement_tracking_failed(self):
+        engine = create_engine("sqlite://")
+        collection_target = CollectionTarget("some_target")
+        engine_collector = EngineCollector(
+            collection_target, engine, track_statements=True
+        )
+
+        with mock.patch.object(
+            worker, "_check_threads_started"
+        ), mock.patch.object(
+            collection_target,
+            "statements",
+            mock.Mock(add=mock.Mock(side_effect=KeyError("x"))),
+        ), mock.patch.object(
+            engine_collector, "logger"
+        ) as logger:
+            with engine.connect() as conn:
+                # not raised to the application
+                self.assertEqual(conn.exec_driver_sql("select 1").scalar(), 1)
+        engine.dispose()
+
+        self.assertEqual(
+            logger.mock_calls,
+            [mock.call.error("error tracking statement", exc_info=True)],
+        )
+
+    def test_sample_rate_invalid(self):
+        engine = create_engine("sqlite://")
+        collection_target = CollectionTarget("some_target")
+        for rate in (0, -0.5, 1.5):
+            self.assertRaises(
+                ValueError,
+                EngineCollector,
+                collection_target,
+                engine,
+                sample_rate=rate,
+            )
+
+    @pytest.mark.parametrize("sampled", [True, False])
+    def test_sampled(self, sampled):
+        engine = create_engine("sqlite://")
+        collection_target = CollectionTarget("some_target")
+        EngineCollector(
+            collection_target, engine, track_statements=True, sample_rate=0.25
+        )
+
+        with mock.patch.object(
+            worker, "_check_threads_started"
+        ), mock.patch.object(
+            collector, "_random", return_value=0.1 if sampled else 0.9
+        ):
+            for i in range(3):
+                with engine.connect() as conn:
+                    conn.exec_driver_sql("select 1")
+        engine.dispose()
+
+        # exact counts don't depend on sampling
+        self.assertEqual(collection_target.total_checkouts, 3)
+
+        # sampled timings are scaled up by the sample weight
+        self.assertEqual(
+            sum(collection_target.checkout_time.snapshot_and_reset()),
+            12 if sampled else 0,
+        )
+        self.assertEqual(
+            sum(collection_target.statement_time.snapshot_and_reset()),
+            12 if sampled else 0,
+        )
+        self.assertEqual(
+            [
+                count
+                for digest, time, count, error in (
+                    collection_target.statements.snapshot_and_reset()
+                )
+            ],
+            [12] if sampled else [],
+        )
+
+    def test_sampled_statement_failed(self):
+        engine = create_engine("sqlite://")
+        collection_target = CollectionTarget("some_target")
+        EngineCollector(
+            collection_target, engine, track_statements=True, sample_rate=0.25
+        )
+
+        with mock.patch.object(
+            worker, "_check_threads_started"
+        ), mock.patch.object(
+            collector,
+            "_random",
+            # checkout not sampled, the failed statement sampled, then
+            # nothing else
+            side_effect=itertools.chain([0.9, 0.1], itertools.repeat(0.9)),
+        ):
+            with engine.connect() as conn:
+                self.assertRaises(
+                    exc.OperationalError,
+                    conn.exec_driver_sql,
+                    "select * from nonexistent",
+                )
+            with engine.connect() as conn:
+                conn.exec_driver_sql("select 1")
+        engine.dispose()
+
+        # the unsampled statement didn't pick up the start time left
+        # behind by the failed one
+        self.assertEqual(
+            sum(collection_target.statement_time.snapshot_and_reset()), 0
+        )
+        self.assertEqual(collection_target.statements.snapshot_and_reset(), [])
@@ -1,4 +1,6 @@
+import collections
 import threading
+import time
 from unittest import mock
 
 from .. import worker
@@ -14,49 +16,50 @@ class WorkerTest(testing.TestBase):
         )
         sender2 = mock.Mock(collection=["one", "two", SystemExit()])
 
-        def send(sender, now, interval, pid):
-            obj = sender.collection.pop(0)
-            if isinstance(obj, BaseException):
-                raise obj
-            else:
-                canary.send(obj)
+        def collect(sender, now, interval, pid):
+            return [sender.collection.pop(0)]
 
-        the_time = [100]
+        def send_many(values):
+            for obj in values:
+                if isinstance(obj, BaseException):
+                    raise obj
+                else:
+                    canary.send(obj)
+
+        def send():
+            return mock.Mock(collect=collect, send_many=send_many)
 
-        mutex = threading.Lock()
+        the_time = [100]
 
-        # worker thread will call this at the top of its main loop.
-        def start_loop():
-            # still supporting Python 2, in Py3k only can instead use
-            # nonlocal for "the_time"
-            mutex.acquire()
-            try:
-                return the_time[0]
-            finally:
-                the_time[0] += 5
-                mutex.release()
+        # worker thread calls time.monotonic() each time it checks the
+        # schedule; moving ahead by more than the interval each time means
+        # the targets are always due and the worker never waits.
+        def advance_time():
+            the_time[0] += 5
+            return the_time[0]
 
         with mock.patch.object(
             worker, "log"
         ) as mock_logger, mock.patch.object(
-            worker.time, "time", mock.Mock(side_effect=start_loop)
+            worker.time, "monotonic", mock.Mock(side_effect=advance_time)
+        ), mock.patch.object(
+            worker, "_collection_targets", {}
         ), mock.patch.object(
-            worker.time, "sleep"
+            worker, "_schedule", []
+        ), mock.patch.object(
+            worker, "_WORKER_THREAD", None
         ):
-            mutex.acquire()
-            try:
+            with worker._schedule_condition:
                 # this adds the target and also starts the worker thread.
-                # however we have it blocked from doing anything via the
-                # mutex above...
-                worker.add_target(sender1, mock.Mock(send=send))
+                # however it's blocked from doing anything while we hold
+                # the condition...
+                worker.add_target(sender1, send())
 
                 # ...so that we can also add this target and get deterministic
                 # results
-                worker.add_target(sender2, mock.Mock(send=send))
-            finally:
-                # worker thread is unblocked
-                mutex.release()
+                worker.add_target(sender2, send())
 
+            # worker thread is unblocked
             # now wait, it will hit the SystemExit and exit.
             # if it times out, we failed.
             worker._WORKER_THREAD.join(5)
@@ -87,3 +90,94 @@ class WorkerTest(testing.TestBase):
             ],
             mock_logger.mock_calls,
         )
+
+    def test_per_target_interval(self):
+        sends = collections.defaultdict(list)
+        done = threading.Event()
+
+        def collect(collection_target, now, interval, pid):
+            sends[collection_target].append(interval)
+            if collection_target == "fast" and len(sends["fast"]) == 3:
+                done.set()
+                raise SystemExit()
+            return []
+
+        def send():
+            return mock.Mock(collect=collect)
+
+        with mock.patch.object(worker, "log"), mock.patch.object(
+            worker, "_collection_targets", {}
+        ), mock.patch.object(worker, "_schedule", []), mock.patch.object(
+            worker, "_WORKER_THREAD", None
+        ):
+            worker.add_target("slow", send(), interval=60)
+
+            # worker is now waiting a minute for "slow" to be due again;
+            # adding a target wakes it up to send the new one right away
+            time.sleep(0.05)
+            worker.add_target("fast", send(), interval=0.05)
+
+            worker._WORKER_THREAD.join(5)
+
+        assert done.is_set()
+        self.assertEqual(sends["slow"], [60])
+        self.assertEqual(sends["fast"], [0.05, 0.05, 0.05])
+
+    def test_add_target_shorter_interval(self):
+        with mock.patch.object(
+            worker, "_check_threads_started"
+        ), mock.patch.object(
+            worker, "_collection_targets", {}
+        ), mock.patch.object(
+            worker, "_schedule", []
+        ):
+            worker.add_target("target", "sender", interval=10)
+            worker.add_target("target", "sender", interval=30)
+            self.assertEqual(
+                worker._collection_targets[("target", "sender")][0], 10
+            )
+            self.assertEqual(len(worker._schedule), 1)
+
+            worker.add_target("target", "sender", interval=1)
+            interval, seq = worker._collection_targets[("target", "sender")]
+            self.assertEqual(interval, 1)
+
+            # the earlier entry is superseded
+            self.assertEqual(
+                [entry[1] == seq for entry in sorted(worker._schedule)],
+                [False, True],
+            )
+
+    def test_targets_grouped_by_connection(self):
+        connection = mock.Mock()
+
+        def sender(*values):
+            return mock.Mock(
+                connection=connection,
+                collect=mock.Mock(return_value=list(values)),
+            )
+
+        sender1 = sender("one", "two")
+        sender2 = sender("three")
+
+        # stops the worker the second time around
+        stop = mock.Mock(side_effect=[[], SystemExit()])
+
+        with mock.patch.object(worker, "log"), mock.patch.object(
+            worker, "_collection_targets", {}
+        ), mock.patch.object(worker, "_schedule", []), mock.patch.object(
+            worker, "_WORKER_THREAD", None
+        ):
+            with worker._schedule_condition:
+                worker.add_target("target1", sender1, interval=60)
+                worker.add_target("target2", sender2, interval=60)
+                worker.add_target(
+                    "target3", mock.Mock(collect=stop), interval=0.05
+                )
+            worker._WORKER_THREAD.join(5)
+
+        # sent in one go by the first sender for the connection
+        self.assertEqual(
+            sender1.send_many.mock_calls, [mock.call(["one", "two", "three"])]
+        )
+        self.assertEqual(sender2.send_many.mock_calls, [])
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import collections
+import heapq
+import itertools
 import logging
 import os
 import threading
@@ -17,23 +19,43 @@ log = logging.getLogger(__name__)
 _WORKER_THREAD: threading.Thread | None = None
 _PID = os.getpid()
 
+DEFAULT_INTERVAL = 2
+
+# reporting interval for each (CollectionTarget, Sender) pair, along with
+# the sequence number of its entry in _schedule
 _collection_targets: dict[
-    tuple[CollectionTarget, Sender], list[int | float]
+    tuple[CollectionTarget, Sender], tuple[int | float, int]
 ] = collections.OrderedDict()
 
+# heap of (deadline, sequence, (CollectionTarget, Sender)), where deadline
+# is in terms of time.monotonic().  sequence breaks ties between targets
+# due at the same time so that they're sent in the order they were added;
+# entries whose sequence no longer matches that of _collection_targets
+# have been superseded and are skipped.
+_schedule: list[tuple[float, int, tuple[CollectionTarget, Sender]]] = []
+_sequence = itertools.count()
+
+# guards _collection_targets and _schedule; notified when a target is
+# added so that the worker can recompute how long to wait
+_schedule_condition = threading.Condition()
+
 
 def _check_threads_started():
-    global _WORKER_THREAD, _PID
+    global _WORKER_THREAD, _PID, _schedule_condition
     ospid = os.getpid()
 
     if _WORKER_THREAD is None or _PID != ospid:
+        if _PID != ospid:
+            # we've been forked; the worker thread in the parent may have
+            # been holding the lock at the time
+            _schedule_condition = threading.Condition()
         _PID = ospid
-        _WORKER_THREAD = threading.Thread(target=_process, args=(2,))
+        _WORKER_THREAD = threading.Thread(target=_process)
         _WORKER_THREAD.daemon = True
         _WORKER_THREAD.start()
 
 
-def _process(interval):
+def _process():
     pid = os.getpid()
     process_token = "%s:%s" % (pid, str(uuid.uuid4())[0:6])
     log.info(
@@ -42,23 +64,58 @@ def _process(interval):
         process_token,
     )
 
+    condition = _schedule_condition
     try:
         while True:
-            now = time.time()
-            for (
-                (collection_target, sender),
-                last_called,
-            ) in _collection_targets.items():
-                if now - last_called[0] > interval:
-                    last_called[0] = now
-                    try:
-                        sender.send(
-                            collection_target, now, interval, process_token
+            due = []
+            with condition:
+                while not due:
+                    now = time.monotonic()
+                    while _schedule and _schedule[0][0] <= now:
+                        deadline, seq, key = heapq.heappop(_schedule)
+                        interval, current_seq = _collection_targets[key]
+                        if seq != current_seq:
+                            continue
+                        due.append((key, interval))
+
+                        # schedule from the previous deadline so that
+                        # sends don't drift later by the time it takes to
+                        # wake up; if we've fallen a whole interval
+                        # behind, start over from now
+                        deadline += interval
+                        if deadline <= now:
+                            deadline = now + interval
+                        seq = next(_sequence)
+                        _collection_targets[key] = (interval, seq)
+                        heapq.heappush(_schedule, (deadline, seq, key))
+
+                    if not due:
+                        condition.wait(
+                            _schedule[0][0] - now if _schedule else None
                         )
-                    except Exception:
-                        log.error("error sending stats", exc_info=True)
 
-            time.sleep(0.2)
+            now = time.time()
+
+            # targets going to the same host / port are sent together, so
+            # that their values are packed into as few packets as possible
+            by_connection = collections.OrderedDict()
+            for (collection_target, sender), interval in due:
+                try:
+                    values = sender.collect(
+                        collection_target, now, interval, process_token
+                    )
+                except Exception:
+                    log.error("error sending stats", exc_info=True)
+                else:
+                    by_connection.setdefault(sender.connection, (sender, []))[
+                        1
+                    ].extend(values)
+
+            for sender, values in by_connection.values():
+                try:
+                    sender.send_many(values)
+                except Exception:
+                    log.error("error sending stats", exc_info=True)
     except BaseException as be:
         log.info(
             "message sender thread caught %s exception, exiting"
@@ -66,7 +123,25 @@ def _process(interval):
         )
 
 
-def add_target(collection_target, sender):
-    if (collection_target, sender) not in _collection_targets:
-        _collection_targets[(collection_target, sender)] = [0]
+def add_target(collection_target, sender, interval=DEFAULT_INTERVAL):
+    """Schedule stats for collection_target to be sent by sender every
+    interval seconds.
+
+    If the pair is already scheduled, e.g. by another engine using the same
+    program name, it is sent at the shorter of the two intervals.
+
+    """
     _check_threads_started()
+
+    key = (collection_target, sender)
+    with _schedule_condition:
+        if key in _collection_targets:
+            current_interval, seq = _collection_targets[key]
+            if current_interval <= interval:
+                return
+
+        # due immediately
+        seq = next(_sequence)
+        _collection_targets[key] = (interval, seq)
+        heapq.heappush(_schedule, (0, seq, key))
+        _schedule_condition.notify()
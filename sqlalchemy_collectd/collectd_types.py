@@ -18,6 +18,7 @@ collectd "writer" systems such as logging, network and grafana.
 
 
 """
+from . import histogram
 from . import protocol
 
 
@@ -36,6 +37,28 @@ pool_internal = protocol.Type(
     ("connections", protocol.VALUE_GAUGE),
 )
 
+# durations that connections are held between checkout and checkin,
+# counted into log-scaled buckets over the most recent interval; see
+# histogram.py for the bucket boundaries.  The server merges the counts
+# across processes and reports the percentiles of
+# checkout_time_summary.
+checkout_time_internal = protocol.Type(
+    "sqlalchemy_checkout_time",
+    *[
+        ("bucket%02d" % idx, protocol.VALUE_GAUGE)
+        for idx in range(histogram.NUM_BUCKETS)
+    ],
+)
+
+# not passed by the client, calculated by the server-side aggregator
+# from checkout_time_internal.  values are in seconds.
+checkout_time_summary = protocol.Type(
+    "sqlalchemy_checkout_time_summary",
+    ("checkout_time_p50", protocol.VALUE_GAUGE),
+    ("checkout_time_p95", protocol.VALUE_GAUGE),
+    ("checkout_time_p99", protocol.VALUE_GAUGE),
+)
+
 # numprocs is not passed by the client, it's calculated by the
 # server-side aggregator
 process_internal = protocol.Type(
@@ -53,7 +76,20 @@ totals_internal = protocol.Type(
     ("disconnects", protocol.VALUE_DERIVE),
 )
 
-# transactions are not implemented yet :)
+# waits for a connection from an exhausted pool, total time spent waiting
+# in microseconds, and waits that ended with the pool timeout being reached.
+# as DERIVE, "wait_usec" is reported as microseconds spent waiting per
+# second, roughly the number of threads waiting at any moment times
+# one million.
+pool_wait_internal = protocol.Type(
+    "sqlalchemy_pool_wait",
+    ("waits", protocol.VALUE_DERIVE),
+    ("wait_usec", protocol.VALUE_DERIVE),
+    ("timeouts", protocol.VALUE_DERIVE),
+)
+
+# engine-level begin() / commit() / rollback() calls.  doesn't include
+# DBAPI implicit transactions
 transactions_internal = protocol.Type(
     "sqlalchemy_transactions",
     ("commits", protocol.VALUE_DERIVE),
@@ -61,6 +97,46 @@ transactions_internal = protocol.Type(
     ("transactions", protocol.VALUE_DERIVE),
 )
 
+# statement types are only sent when statement tracking is enabled
+# on the client.
+
+# execution time of SQL statements, bucketed the same way as
+# checkout_time_internal, reported as the percentiles of
+# statement_time_summary.
+statement_time_internal = protocol.Type(
+    "sqlalchemy_statement_time",
+    *[
+        ("bucket%02d" % idx, protocol.VALUE_GAUGE)
+        for idx in range(histogram.NUM_BUCKETS)
+    ],
+)
+
+statement_time_summary = protocol.Type(
+    "sqlalchemy_statement_time_summary",
+    ("statement_time_p50", protocol.VALUE_GAUGE),
+    ("statement_time_p95", protocol.VALUE_GAUGE),
+    ("statement_time_p99", protocol.VALUE_GAUGE),
+)
+
+# execution time in seconds per second and executions per second of a
+# single statement fingerprint in the heavy hitters of one process, over
+# the most recent interval.  one message is sent per fingerprint, with the
+# fingerprint digest appended to the process token in type_instance,
+# e.g. "1234:a1b2c3/f00dfeedbeef".  The server sums these per fingerprint
+# and reports those with the most time.
+statement_internal = protocol.Type(
+    "sqlalchemy_statement",
+    ("statement_time", protocol.VALUE_GAUGE),
+    ("statement_count", protocol.VALUE_GAUGE),
+)
+
+
+# histogram types and the percentile types they are reported as
+histogram_summaries = {
+    checkout_time_internal: checkout_time_summary,
+    statement_time_internal: statement_time_summary,
+}
+
 
 # external types "count" and "derive".
 count_external = protocol.Type("count", ("value", protocol.VALUE_GAUGE))
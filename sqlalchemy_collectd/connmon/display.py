@@ -213,7 +213,7 @@ class ProgStatsLayout(StatLayout):
     columns = [
         ("hostname\n(#R&[dis]#G&connected#d&)", "%s", 0.18, "L"),
         ("progname", "%s", 0.15, "L"),
-        ("last msg\nsecs / int", "%s/%3d", 0.10, "R"),
+        ("last msg\nsecs / int", "%s/%3g", 0.10, "R"),
         ("processes\ncurr / max", "%4d/%4d", 0.15, "R"),
         ("connections\ncurr / max / int", "%4d/%4d/%4d", 0.15, "R"),
         ("checkouts\ncurr / max / int", "%4d/%4d/%4d", 0.15, "R"),
@@ -34,9 +34,14 @@ class CollectdAsyncSenderQueue(AsyncWorker):
         self.queue = asyncio.Queue()
 
     async def _run_service_awaitable(self):
-        msg = await self.queue.get()
+        # send everything that's queued up together, so that it's packed
+        # into as few packets as possible
+        msgs = [await self.queue.get()]
+        while not self.queue.empty():
+            msgs.append(self.queue.get_nowait())
+
         for sender in self.senders:
-            await sender.send_async(msg)
+            await sender.send_many_async(msgs)
 
     def send(self, message):
         if self.loop is not None and self.loop.is_running():
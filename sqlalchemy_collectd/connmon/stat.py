@@ -16,7 +16,7 @@ if TYPE_CHECKING:
 
 
 class HostProg:
-    last_time: int
+    last_time: float
     hostname: str
     progname: str | None
     checkout_count: int | None
@@ -30,9 +30,9 @@ class HostProg:
     total_checkouts: int | None
     last_checkouts: int | None
     interval_checkouts: int | None
-    last_total_checkout_time: int | None
+    last_total_checkout_time: float | None
     checkouts_per_second: float | None
-    interval: int
+    interval: float
 
     def __init__(self, hostname: str, progname: str | None):
         self.last_time = 0
@@ -272,10 +272,10 @@ class Stat:
                 break
 
     async def _update(self) -> None:
-        values_obj = await self.receiver.receive_async()
-        if values_obj is None:
-            return
+        for values_obj in await self.receiver.receive_batch_async():
+            self._update_values(values_obj)
 
+    def _update_values(self, values_obj: Values) -> None:
         hostname = values_obj.host
         progname = values_obj.plugin_instance
 
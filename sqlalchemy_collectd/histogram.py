@@ -0,0 +1,114 @@
+"""Fixed-bucket, log-scaled histograms of durations.
+
+The client plugin records durations into a :class:`.Histogram` using a
+preallocated list of counters, and sends the counts for each interval as
+an "internal" type having one GAUGE value per bucket.   The server plugin
+sums these counts across processes and reports percentiles computed from
+the merged buckets using :func:`.percentiles`.
+
+Bucket zero holds durations less than :data:`.MIN_VALUE`; each following
+bucket covers twice the range of the one before it, so that bucket ``n``
+holds durations from ``MIN_VALUE * 2 ** (n - 1)`` up to
+``MIN_VALUE * 2 ** n``.  The last bucket holds everything larger.
+
+"""
+from __future__ import annotations
+
+import math
+from typing import List
+from typing import Sequence
+from typing import Union
+
+# 100 microseconds
+MIN_VALUE = 0.0001
+
+# the last bucket starts at MIN_VALUE * 2 ** 22, a bit under seven minutes
+NUM_BUCKETS = 24
+
+# upper bound of each bucket; the last bucket has no upper bound
+BUCKET_BOUNDS = [MIN_VALUE * 2**n for n in range(NUM_BUCKETS - 1)]
+
+DEFAULT_PERCENTILES = (0.5, 0.95, 0.99)
+
+_frexp = math.frexp
+
+
+def bucket_for(value: float) -> int:
+    """Return the bucket index for the given duration in seconds."""
+
+    if value < MIN_VALUE:
+        return 0
+    bucket = _frexp(value / MIN_VALUE)[1]
+    return bucket if bucket < NUM_BUCKETS else NUM_BUCKETS - 1
+
+
+class Histogram:
+    """Bucket counts for durations recorded within a process."""
+
+    __slots__ = ("counts",)
+
+    counts: List[Union[int, float]]
+
+    def __init__(self):
+        self.counts = [0] * NUM_BUCKETS
+
+    def record(self, value: float, weight: Union[int, float] = 1) -> None:
+        """Count a duration in seconds.
+
+        ``weight`` is the number of events the duration stands for, which
+        is greater than one when events are sampled.
+
+        """
+        self.counts[bucket_for(value)] += weight
+
+    def snapshot_and_reset(self) -> List[Union[int, float]]:
+        """Return the current counts and subtract them from the histogram.
+
+        Subtracting rather than zeroing the counters keeps any values
+        recorded by other threads while the snapshot is taken.
+
+        """
+        counts = self.counts
+        snapshot = list(counts)
+        for idx, count in enumerate(snapshot):
+            if count:
+                counts[idx] -= count
+        return snapshot
+
+
+def percentiles(
+    counts: Sequence[Union[int, float]],
+    quantiles: Sequence[float] = DEFAULT_PERCENTILES,
+) -> List[float]:
+    """Estimate percentiles from bucket counts.
+
+    Values are interpolated linearly within the bucket in which each
+    percentile falls; a percentile landing in the last, unbounded bucket
+    is reported as that bucket's lower bound.  An empty histogram, or one
+    whose counts don't add up to more than zero, reports zero for all
+    percentiles.
+
+    """
+    total = sum(counts)
+    if total <= 0:
+        return [0.0 for q in quantiles]
+
+    result = []
+    for quantile in quantiles:
+        target = quantile * total
+        cumulative = 0.0
+        for idx, count in enumerate(counts):
+            if count and cumulative + count >= target:
+                lower = BUCKET_BOUNDS[idx - 1] if idx else 0.0
+                if idx == NUM_BUCKETS - 1:
+                    result.append(lower)
+                else:
+                    upper = BUCKET_BOUNDS[idx]
+                    result.append(
+                        lower + (upper - lower) * (target - cumulative) / count
+                    )
+                break
+            cumulative += count
+        else:
+            result.append(BUCKET_BOUNDS[-1])
+    return result
@@ -5,12 +5,18 @@ connect straight to the network plugin.
 from __future__ import annotations
 
 import asyncio
+import collections
+import logging
 import os
 import socket
 import threading
 import time
 from typing import Any
 from typing import ClassVar
+from typing import Deque
+from typing import Iterable
+from typing import Iterator
+from typing import List
 from typing import Optional
 from typing import Sequence
 from typing import Tuple
@@ -25,6 +31,12 @@ if TYPE_CHECKING:
     from logging import Logger
 
 
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+DEFAULT_RECEIVE_BUFFER_SIZE = 10000
+
+
 class Connection:
     __slots__ = ("log", "host", "port")
 
@@ -65,6 +77,17 @@ class AsyncReceiver(Connection):
     async def receive_async(self) -> Tuple[bytes, str]:
         raise NotImplementedError()
 
+    async def receive_many_async(self) -> List[Tuple[bytes, str]]:
+        """Return all the messages that have been received, waiting for
+        at least one."""
+        return [await self.receive_async()]
+
+    @property
+    def num_dropped(self) -> int:
+        """Number of datagrams discarded because the receive buffer was
+        full."""
+        return 0
+
 
 class SyncReceiver(Connection):
     __slots__ = ()
@@ -98,6 +121,87 @@ class _UDPProtocol(asyncio.DatagramProtocol):
         self.transport = None
 
 
+class _ReceiverProtocol(_UDPProtocol):
+    """Buffers datagrams as the event loop delivers them, waking up
+    a waiting receiver only for the first one, so that the receiver
+    takes all of the datagrams that arrived in the meantime at once.
+
+    The buffer holds at most ``buffer_size`` datagrams.  When it's full,
+    the oldest datagram is discarded to make room for a new one if
+    ``drop_policy`` is :data:`.DROP_OLDEST`, or the new datagram is
+    discarded if it's :data:`.DROP_NEWEST`; either way ``num_dropped`` is
+    incremented.
+
+    """
+
+    _received: Deque[Tuple[bytes, str]]
+    _waiter: Optional[asyncio.Future[None]]
+
+    num_dropped: int
+
+    def __init__(
+        self,
+        log,
+        buffer_size: int = DEFAULT_RECEIVE_BUFFER_SIZE,
+        drop_policy: str = DROP_OLDEST,
+    ):
+        super().__init__(log)
+        if buffer_size < 1:
+            raise ValueError("buffer_size must be at least 1")
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(
+                "drop_policy must be one of %r or %r, got %r"
+                % (DROP_OLDEST, DROP_NEWEST, drop_policy)
+            )
+        self.buffer_size = buffer_size
+        self.drop_policy = drop_policy
+        self.num_dropped = 0
+        self._received = collections.deque()
+        self._waiter = None
+        self._closed = False
+
+    async def _wait_for_received(self) -> None:
+        while not self._received:
+            if self._closed:
+                # TODO: figure out what this should be
+                raise IOError("closed")
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+
+    def _wakeup(self) -> None:
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def recvfrom(self) -> Tuple[bytes, str]:
+        await self._wait_for_received()
+        return self._received.popleft()
+
+    async def recvfrom_many(self) -> List[Tuple[bytes, str]]:
+        await self._wait_for_received()
+        received = list(self._received)
+        self._received.clear()
+        return received
+
+    def datagram_received(self, data, addr):
+        received = self._received
+        if len(received) >= self.buffer_size:
+            self.num_dropped += 1
+            if self.drop_policy == DROP_NEWEST:
+                return
+            received.popleft()
+        received.append((data, str(addr)))
+        self._wakeup()
+
+    def connection_lost(self, exc):
+        self._closed = True
+        self._wakeup()
+        super().connection_lost(exc)
+
+
 class SyncOnlyUDPClientSender(SyncSender):
     """the network client used by the SQLAlchemy plugin.
 
@@ -165,13 +269,7 @@ class UDPClientReceiver(AsyncReceiver):
 
     log: Logger
 
-    class _ClientReceiverProtocol(_UDPProtocol):
-        _queue: asyncio.Queue[Optional[Tuple[bytes, str]]]
-
-        def __init__(self, log):
-            super().__init__(log)
-            self._queue = asyncio.Queue()
-
+    class _ClientReceiverProtocol(_ReceiverProtocol):
         def connection_made(self, transport):
             self.transport = transport
             self._send_helo_task = asyncio.create_task(self._send_helo())
@@ -181,21 +279,6 @@ class UDPClientReceiver(AsyncReceiver):
                 self.transport.sendto(b"HELO")
                 await asyncio.sleep(5)
 
-        async def recvfrom(self) -> Tuple[bytes, str]:
-            rec = await self._queue.get()
-            if rec is None:
-                # TODO: figure out what this should be
-                raise IOError("closed")
-
-            return rec
-
-        def datagram_received(self, data, addr):
-            self._queue.put_nowait((data, str(addr)))
-
-        def connection_lost(self, exc):
-            self._queue.put_nowait(None)
-            super().connection_lost(exc)
-
     def __init__(self, host: str, port: int, log: Logger):
         self.host = host
         self.port = port
@@ -204,11 +287,16 @@ class UDPClientReceiver(AsyncReceiver):
 
     @classmethod
     async def connect(
-        cls, host: str, port: int, log: Logger
+        cls,
+        host: str,
+        port: int,
+        log: Logger,
+        buffer_size: int = DEFAULT_RECEIVE_BUFFER_SIZE,
+        drop_policy: str = DROP_OLDEST,
     ) -> UDPClientReceiver:
         loop = asyncio.get_running_loop()
         transport, protocol = await loop.create_datagram_endpoint(
-            lambda: cls._ClientReceiverProtocol(log),
+            lambda: cls._ClientReceiverProtocol(log, buffer_size, drop_policy),
             remote_addr=(host, port),
         )
         connection = UDPClientReceiver(host, port, log)
@@ -219,6 +307,13 @@ class UDPClientReceiver(AsyncReceiver):
     async def receive_async(self) -> Tuple[bytes, str]:
         return await self._protocol.recvfrom()
 
+    async def receive_many_async(self) -> List[Tuple[bytes, str]]:
+        return await self._protocol.recvfrom_many()
+
+    @property
+    def num_dropped(self) -> int:
+        return self._protocol.num_dropped
+
 
 class UDPClientSender(AsyncSender):
     log: Logger
@@ -315,27 +410,8 @@ class UDPServerReceiver(AsyncReceiver):
     _protocol: _ServerReceiverProtocol
     _transport: asyncio.DatagramTransport
 
-    class _ServerReceiverProtocol(_UDPProtocol):
-        _queue: asyncio.Queue[Optional[Tuple[bytes, str]]]
-
-        def __init__(self, log):
-            super().__init__(log)
-            self._queue = asyncio.Queue()
-
-        async def recvfrom(self) -> Tuple[bytes, str]:
-            rec = await self._queue.get()
-            if rec is None:
-                # TODO: figure out what this should be
-                raise IOError("closed")
-
-            return rec
-
-        def datagram_received(self, data, addr):
-            self._queue.put_nowait((data, str(addr)))
-
-        def connection_lost(self, exc):
-            self._queue.put_nowait(None)
-            super().connection_lost(exc)
+    class _ServerReceiverProtocol(_ReceiverProtocol):
+        pass
 
     def __init__(self, host, port, log):
         self.host = host
@@ -344,12 +420,27 @@ class UDPServerReceiver(AsyncReceiver):
 
     @classmethod
     async def receive_from_send_clients(
-        cls, host, port, log
+        cls,
+        host,
+        port,
+        log,
+        buffer_size: int = DEFAULT_RECEIVE_BUFFER_SIZE,
+        drop_policy: str = DROP_OLDEST,
+        reuse_port: bool = False,
     ) -> UDPServerReceiver:
+        """Listen for clients on the given host and port.
+
+        :param reuse_port: set ``SO_REUSEPORT`` on the socket, so that
+         several receivers may listen on the same host and port, with the
+         kernel distributing the datagrams of different clients among them.
+
+        """
         connection = UDPServerReceiver(host, port, log)
         loop = asyncio.get_running_loop()
         transport, protocol = await loop.create_datagram_endpoint(
-            lambda: cls._ServerReceiverProtocol(log), local_addr=(host, port)
+            lambda: cls._ServerReceiverProtocol(log, buffer_size, drop_policy),
+            local_addr=(host, port),
+            reuse_port=reuse_port,
         )
         connection._transport = transport
         connection._protocol = protocol
@@ -358,21 +449,66 @@ class UDPServerReceiver(AsyncReceiver):
     async def receive_async(self) -> Tuple[bytes, str]:
         return await self._protocol.recvfrom()
 
+    async def receive_many_async(self) -> List[Tuple[bytes, str]]:
+        return await self._protocol.recvfrom_many()
+
+    @property
+    def num_dropped(self) -> int:
+        return self._protocol.num_dropped
+
 
 class AsyncNetworkReceiver(MessageUnpacker):
     def __init__(self, connection: AsyncReceiver, types: Sequence[Type]):
         self.connection = connection
+        self._pending: Deque[Values] = collections.deque()
         super().__init__(types, connection.log)
 
     async def receive_async(self) -> Optional[Values]:
-        connection = self.connection
-        buf, _ = await connection.receive_async()
+        """Return the next Values received.
 
-        value = self.unpack_bytes(buf)
-        if value is not None:
-            self.connection.debug_receive_message(value)
+        A packet may contain more than one Values; the remainder are
+        returned by subsequent calls before another packet is received.
+        None is returned for a packet that has no usable values.
 
-        return value
+        """
+        pending = self._pending
+        if not pending:
+            pending.extend(await self.receive_values_async())
+            if not pending:
+                return None
+
+        return pending.popleft()
+
+    async def receive_values_async(self) -> Iterator[Values]:
+        """Receive the next packet, returning an iterator of the Values it
+        contains."""
+        buf, _ = await self.connection.receive_async()
+        return self._iter_debug(self.iter_values(buf))
+
+    async def receive_batch_async(self) -> List[Values]:
+        """Receive all the packets that are waiting, returning a list of
+        the Values they contain.
+
+        Packets that arrive while the event loop is busy are decoded
+        together once it gets to the receiver, rather than with an event
+        loop round trip for each one.
+
+        """
+        iter_values = self.iter_values
+        batch: List[Values] = []
+        for buf, _ in await self.connection.receive_many_async():
+            batch.extend(iter_values(buf))
+
+        if self.log.isEnabledFor(logging.DEBUG):
+            for value in batch:
+                self.connection.debug_receive_message(value)
+        return batch
+
+    def _iter_debug(self, values: Iterator[Values]) -> Iterator[Values]:
+        debug_receive_message = self.connection.debug_receive_message
+        for value in values:
+            debug_receive_message(value)
+            yield value
 
 
 class NetworkSender(MessagePacker):
@@ -388,6 +524,18 @@ class NetworkSender(MessagePacker):
         self.connection.debug_send_message(values_obj)
         connection.send(message)
 
+    def send_many(self, values_objs: Iterable[Values]) -> None:
+        """Send any number of Values, packed into as few packets as
+        possible."""
+        connection = self.connection
+
+        values_objs = list(values_objs)
+        for values_obj in values_objs:
+            connection.debug_send_message(values_obj)
+
+        for message in self.pack_many(values_objs):
+            connection.send(message)
+
 
 class AsyncNetworkSender(MessagePacker):
     def __init__(self, connection: AsyncSender, types: Sequence[Type]):
@@ -401,3 +549,15 @@ class AsyncNetworkSender(MessagePacker):
 
         self.connection.debug_send_message(values_obj)
         await connection.send_async(message)
+
+    async def send_many_async(self, values_objs: Iterable[Values]) -> None:
+        """Send any number of Values, packed into as few packets as
+        possible."""
+        connection = self.connection
+
+        values_objs = list(values_objs)
+        for values_obj in values_objs:
+            connection.debug_send_message(values_obj)
+
+        for message in list(self.pack_many(values_objs)):
+            await connection.send_async(message)
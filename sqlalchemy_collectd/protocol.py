@@ -4,10 +4,17 @@ connect straight to the network plugin.
 """
 from __future__ import annotations
 
+import math
 import struct
 from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
 from typing import Optional
 from typing import Sequence
+from typing import Tuple
 from typing import TYPE_CHECKING
 from typing import Union
 
@@ -32,12 +39,37 @@ TYPE_TYPE = 0x0004
 TYPE_TYPE_INSTANCE = 0x0005
 TYPE_VALUES = 0x0006
 TYPE_INTERVAL = 0x0007
+TYPE_TIME_HR = 0x0008
+TYPE_INTERVAL_HR = 0x0009
+
+# high resolution time and interval parts are in units of 2 ** -30 seconds
+HR_UNITS_PER_SECOND = 2**30
 
 header = struct.Struct("!HH")
 short = struct.Struct("!H")
 char = struct.Struct("B")
 long_ = struct.Struct("!q")
 
+# a whole second time or interval part followed by the high resolution
+# part of the same; the whole second part is for servers of prior versions,
+# which skip the high resolution part
+_time_parts = struct.Struct("!HHqHHQ")
+
+_hr = struct.Struct("!Q")
+
+
+def _to_hr(seconds: float) -> int:
+    return int(round(seconds * HR_UNITS_PER_SECOND))
+
+
+def _pack_time(typecode: int, hr_typecode: int, seconds: float) -> bytes:
+    # a fractional interval is rounded up, so that it's never zero
+    whole = int(seconds) if typecode == TYPE_TIME else math.ceil(seconds)
+    return _time_parts.pack(
+        typecode, 12, whole, hr_typecode, 12, _to_hr(seconds)
+    )
+
+
 _value_formats = {
     VALUE_COUNTER: struct.Struct("!Q"),
     VALUE_GAUGE: struct.Struct("<d"),
@@ -69,12 +101,18 @@ class Type:
         "_value_formats",
         "_message_template",
         "_field_names",
+        "_value_runs",
+        "_values_struct",
+        "values_size",
     )
 
     name: str
     _field_names: Sequence[str]
     _value_types: Sequence[int]
     _value_formats: Sequence[struct.Struct]
+    _value_runs: Sequence[Tuple[int, struct.Struct, int, int]]
+    _values_struct: Optional[struct.Struct]
+    values_size: int
 
     def __init__(self, name, *db_template):
         """Contruct a new Type.
@@ -102,6 +140,41 @@ class Type:
         for value_type in self._value_types:
             self._message_template += char.pack(value_type)
 
+        # GAUGE values are little-endian while the others are big-endian,
+        # which can't be expressed in a single struct format; instead,
+        # values are packed with one struct per run of consecutive values
+        # having the same byte order.  For most types that's just one.
+        # each run is (offset within the message, struct, index of first
+        # value, index past the last value)
+        runs = []
+        offset = len(self._message_template)
+        for idx, format_ in enumerate(self._value_formats):
+            byteorder, code = format_.format[0], format_.format[1:]
+            if runs and runs[-1][0] == byteorder:
+                runs[-1][1].append(code)
+                runs[-1][3] = idx + 1
+            else:
+                runs.append([byteorder, [code], idx, idx + 1])
+        self._value_runs = []
+        for byteorder, codes, start, end in runs:
+            struct_ = struct.Struct(byteorder + "".join(codes))
+            self._value_runs.append((offset, struct_, start, end))
+            offset += struct_.size
+
+        self.values_size = offset
+
+        # when all values have the same byte order, as is usually the case
+        self._values_struct = (
+            self._value_runs[0][1] if len(self._value_runs) == 1 else None
+        )
+
+    def __reduce__(self):
+        # the structs built from the template don't pickle
+        return (
+            Type,
+            (self.name, *zip(self._field_names, self._value_types)),
+        )
+
     def get_stat_index(self, name):
         return self._field_names.index(name)
 
@@ -116,55 +189,150 @@ class Type:
     def _encode_values(self, *values):
         """Encode a series of values according to the type template."""
 
-        msg = self._message_template
-        for format_, dsvalue in zip(self._value_formats, values):
-            msg += format_.pack(dsvalue)
+        buf = bytearray(self.values_size)
+        self._pack_values_into(buf, 0, values)
+        return bytes(buf)
 
-        return msg
+    def _pack_values_into(
+        self, buf: bytearray, offset: int, values: Sequence[Union[float, int]]
+    ) -> None:
+        """Write the values part for a series of values into buf at the
+        given offset; buf must have at least :attr:`.values_size` bytes
+        available at that position.
 
+        """
+        template = self._message_template
+        template_end = offset + len(template)
+        buf[offset:template_end] = template
 
-class Values:
-    """A mirror object of collectd.Values"""
+        values_struct = self._values_struct
+        if values_struct is not None:
+            values_struct.pack_into(buf, template_end, *values)
+            return
 
-    __slots__ = (
-        "type",
-        "type_instance",
-        "plugin",
-        "plugin_instance",
-        "host",
-        "time",
-        "interval",
-        "values",
-    )
+        for run_offset, struct_, start, end in self._value_runs:
+            struct_.pack_into(buf, offset + run_offset, *values[start:end])
+
+    def _unpack_values_from(
+        self, buf: Union[bytes, memoryview], offset: int
+    ) -> List[Union[float, int]]:
+        """Decode the values part at the given offset in buf.
+
+        The part must have the number and types of values of this Type.
+
+        """
+
+        template = self._message_template
+        template_end = offset + len(template)
+        if buf[offset:template_end] == template:
+            values_struct = self._values_struct
+            if values_struct is not None:
+                return list(values_struct.unpack_from(buf, template_end))
+
+            result: List[Union[float, int]] = []
+            for run_offset, struct_, start, end in self._value_runs:
+                result.extend(struct_.unpack_from(buf, offset + run_offset))
+            return result
+
+        # the part doesn't have the number or the types of values this Type
+        # expects; the part length was checked against the number of values
+        # in the part, so the header matches
+        num = short.unpack_from(buf, offset + header.size)[0]
+        if num != len(self._value_types):
+            raise _MalformedPacket("value_count")
+        raise _MalformedPacket("value_type")
 
+
+class _ValuesRecord(NamedTuple):
     type: str
     type_instance: str
     plugin: str
     plugin_instance: str
     host: str
-    time: int
-    interval: int
+    time: float
+    interval: float
     values: Sequence[Union[float, int]]
 
-    def __init__(self, **kw: Any):
-        # TODO: see what new python 3 values objects or what can help
-        # with this
-        for k in self.__slots__:
-            setattr(self, k, kw[k] if k in kw else None)
-        if self.interval is None:
-            self.interval = DEFAULT_INTERVAL
+
+# all fields other than "values", which lead the record
+_NUM_NAME_FIELDS = 7
+
+
+class Values(_ValuesRecord):
+    """A mirror object of collectd.Values.
+
+    Values is an immutable tuple; :meth:`.build` returns a copy with some
+    fields changed.  Where all fields are at hand, such as when decoding
+    a packet, ``Values._make()`` constructs one from a sequence of all
+    fields in order, without the keyword defaults of the constructor.
+
+    """
+
+    __slots__ = ()
+
+    def __new__(
+        cls,
+        type=None,  # noqa: A002
+        type_instance=None,
+        plugin=None,
+        plugin_instance=None,
+        host=None,
+        time=None,
+        interval=None,
+        values=None,
+    ):
+        if interval is None:
+            interval = DEFAULT_INTERVAL
+        return tuple.__new__(
+            cls,
+            (
+                type,
+                type_instance,
+                plugin,
+                plugin_instance,
+                host,
+                time,
+                interval,
+                values,
+            ),
+        )
 
     def _asdict(self, omit_none=False):
         return {
-            k: getattr(self, k)
-            for k in self.__slots__
-            if not omit_none or getattr(self, k) is not None
+            k: v
+            for k, v in zip(self._fields, self)
+            if not omit_none or v is not None
         }
 
     def build(self, **kw: Any) -> Values:
-        d = self._asdict()
-        d.update(kw)
-        return Values(**d)
+        if "interval" in kw and kw["interval"] is None:
+            kw["interval"] = DEFAULT_INTERVAL
+        return self._replace(**kw)
+
+    @classmethod
+    def sum(cls, records: Sequence[Values]) -> Values:
+        """Sum the data values of a non-empty sequence of Values in one
+        pass.
+
+        Fields other than the data values which aren't the same for all
+        of the records are set to None in the result, as with ``+``.
+
+        """
+        first = records[0]
+        names: Tuple[Any, ...] = first[:_NUM_NAME_FIELDS]
+        if not all(rec[:_NUM_NAME_FIELDS] == names for rec in records):
+            names = tuple(
+                name if all(rec[idx] == name for rec in records) else None
+                for idx, name in enumerate(names)
+            )
+            if names[-1] is None:
+                # interval
+                names = names[:-1] + (DEFAULT_INTERVAL,)
+
+        return cls._make(
+            names
+            + ([sum(column) for column in zip(*[rec[7] for rec in records])],)
+        )
 
     def __radd__(self, other):
         return self.__add__(other)
@@ -173,36 +341,20 @@ class Values:
         """Sum the data values of this Values against another."""
 
         if not isinstance(other, Values):
-            other_values = [other for v in self.values]
-            _reverse_coalesce = {}
+            return self._replace(values=[v + other for v in self.values])
         else:
-            other_values = other.values
-            _reverse_coalesce = {
-                k: None
-                for k in [
-                    "type_instance",
-                    "host",
-                    "time",
-                    "interval",
-                    "plugin_instance",
-                    "plugin",
-                    "type",
-                ]
-                if getattr(self, k) != getattr(other, k)
-            }
-
-        return self.build(
-            values=[v + o for v, o in zip(self.values, other_values)],
-            **_reverse_coalesce,
-        )
+            return Values.sum((self, other))
 
     def __eq__(self, other):
         if not isinstance(other, Values):
             return False
 
-        return [getattr(self, k) for k in self.__slots__] == [
-            getattr(other, k) for k in self.__slots__
-        ]
+        return tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None  # type: ignore
 
     @classmethod
     def from_collectd_values(cls, cd_values_obj, log):
@@ -234,131 +386,367 @@ class Values:
 
     def __repr__(self):
         return "sqlalchemy_collectd.Values(%s)" % (
-            ", ".join("%s=%r" % (k, getattr(self, k)) for k in self.__slots__),
+            ", ".join("%s=%r" % (k, v) for k, v in zip(self._fields, self)),
         )
 
 
 class MessagePacker:
+    """Packs Values into messages.
+
+    Encoded header parts are cached per distinct host, plugin, type and
+    instance names, and messages are assembled in a buffer that's reused
+    for each message, so a MessagePacker should be used by one thread at a
+    time.
+
+    """
+
+    header_cache_size = 1000
+
     def __init__(self, types: Sequence[Type], log: Logger):
         self._types = {type_.name: type_ for type_ in types}
         self.log = log
+        self._buffer = bytearray(MAX_PACKET_SIZE)
+        self._header_cache: Dict[Tuple[Any, ...], Tuple[bytes, ...]] = {}
 
     def pack_values(self, values_obj) -> bytes:
-        timestamp = values_obj.time
-        type_name = values_obj.type
+        type_obj = self._type_for(values_obj)
+        host_part, remainder, type_part, type_instance_part = self._header(
+            values_obj
+        )
+        parts = (
+            host_part,
+            _pack_time(TYPE_TIME, TYPE_TIME_HR, values_obj.time),
+            remainder,
+        )
+        size = self._write_message(0, parts, type_obj, values_obj)
+        return bytes(self._buffer[0:size])
+
+    def pack_many(self, values_objs: Iterable[Values]) -> Iterator[bytes]:
+        """Pack any number of Values into as few packets as possible.
+
+        Each packet is no larger than :data:`.MAX_PACKET_SIZE`, unless a
+        single Values is larger than that by itself.  Within a packet, the
+        host, time, plugin, plugin instance and interval parts are only
+        packed when one of them changes, and the type and type instance
+        parts are only packed when they change.
+
+        """
+        pos = 0
+        current_common = current_type = current_type_instance = None
+
+        for values_obj in values_objs:
+            type_obj = self._type_for(values_obj)
+            host_part, remainder, type_part, type_instance_part = self._header(
+                values_obj
+            )
+
+            common = (
+                values_obj.host,
+                values_obj.time,
+                values_obj.plugin,
+                values_obj.plugin_instance,
+                values_obj.interval,
+            )
+            if pos and common == current_common:
+                parts = []
+                if values_obj.type != current_type:
+                    parts.append(type_part)
+                if values_obj.type_instance != current_type_instance:
+                    parts.append(type_instance_part)
+                size = sum(map(len, parts)) + type_obj.values_size
+
+                if pos + size > MAX_PACKET_SIZE:
+                    yield bytes(self._buffer[0:pos])
+                    pos = 0
+
+            if not pos or common != current_common:
+                parts = [
+                    host_part,
+                    _pack_time(TYPE_TIME, TYPE_TIME_HR, values_obj.time),
+                    remainder,
+                ]
+                size = sum(map(len, parts)) + type_obj.values_size
+
+                if pos and pos + size > MAX_PACKET_SIZE:
+                    yield bytes(self._buffer[0:pos])
+                    pos = 0
+
+            pos = self._write_message(pos, parts, type_obj, values_obj)
+            current_common = common
+            current_type = values_obj.type
+            current_type_instance = values_obj.type_instance
+
+        if pos:
+            yield bytes(self._buffer[0:pos])
 
+    def _type_for(self, values_obj: Values) -> Type:
+        type_name = values_obj.type
         try:
-            type_obj = self._types[type_name]
+            return self._types[type_name]
         except KeyError as ke:
             raise TypeError(f"don't know type: {type_name}") from ke
 
+    def _header(self, values_obj: Values) -> Tuple[bytes, ...]:
+        """Return the encoded header parts for a Values.
+
+        Returns a tuple of the host part, the remaining parts that follow
+        the time part, and the type and type instance parts by themselves.
+
+        """
+        key = (
+            values_obj.host,
+            values_obj.plugin,
+            values_obj.plugin_instance,
+            values_obj.type,
+            values_obj.interval,
+            values_obj.type_instance,
+        )
+        header_cache = self._header_cache
+        try:
+            return header_cache[key]
+        except KeyError:
+            pass
+
         _pack_string = self._pack_string
-        _host_message_part = _pack_string(TYPE_HOST, values_obj.host)
-        _remainder_message_parts = (
+        type_part = _pack_string(TYPE_TYPE, values_obj.type)
+        type_instance_part = _pack_string(
+            TYPE_TYPE_INSTANCE, values_obj.type_instance
+        )
+        parts = (
+            _pack_string(TYPE_HOST, values_obj.host),
             _pack_string(TYPE_PLUGIN, values_obj.plugin)
             + _pack_string(TYPE_PLUGIN_INSTANCE, values_obj.plugin_instance)
-            + _pack_string(TYPE_TYPE, type_obj.name)
-            + struct.pack("!HHq", TYPE_INTERVAL, 12, int(values_obj.interval))
-            + _pack_string(TYPE_TYPE_INSTANCE, values_obj.type_instance)
-        )
-        header_ = (
-            _host_message_part
-            + header.pack(TYPE_TIME, 12)
-            + long_.pack(int(timestamp))
-            + _remainder_message_parts
+            + type_part
+            + _pack_time(TYPE_INTERVAL, TYPE_INTERVAL_HR, values_obj.interval)
+            + type_instance_part,
+            type_part,
+            type_instance_part,
         )
 
-        payload = type_obj._encode_values(*values_obj.values)
+        if len(header_cache) >= self.header_cache_size:
+            header_cache.clear()
+        header_cache[key] = parts
+        return parts
+
+    def _write_message(
+        self,
+        pos: int,
+        parts: Sequence[bytes],
+        type_obj: Type,
+        values_obj: Values,
+    ) -> int:
+        """Write header parts and the values part for values_obj into the
+        buffer at pos, returning the position past the end of the message.
 
-        return header_ + payload
+        """
+        buf = self._buffer
+        for part in parts:
+            part_end = pos + len(part)
+            buf[pos:part_end] = part
+            pos = part_end
+
+        end = pos + type_obj.values_size
+        if end > len(buf):
+            buf.extend(bytes(end - len(buf)))
+
+        type_obj._pack_values_into(buf, pos, values_obj.values)
+        return end
 
     def _pack_string(self, typecode: int, value: str) -> bytes:
-        value = value or ""
-        return (
-            header.pack(typecode, 5 + len(value))
-            + value.encode("ascii")
-            + b"\0"
-        )
+        encoded = (value or "").encode("ascii")
+        return header.pack(typecode, 5 + len(encoded)) + encoded + b"\0"
+
+
+class _MalformedPacket(Exception):
+    """Raised within MessageUnpacker to reject a packet."""
+
+    def __init__(self, reason: str):
+        self.reason = reason
+
+
+# reasons that MessageUnpacker will reject a packet:
+REJECT_REASONS = (
+    # fewer bytes left than are needed for a part header
+    "truncated",
+    # part length is smaller than the part requires, including zero
+    "short_part",
+    # part length extends past the end of the packet
+    "overlong_part",
+    # part length of a values part doesn't match its number of values, or
+    # the number of values doesn't match that of its known type
+    "value_count",
+    # values part has a value type that doesn't exist, or that doesn't
+    # match that of its known type
+    "value_type",
+    # string part is not null terminated ASCII
+    "bad_string",
+    # time or interval part is not eight bytes
+    "bad_number",
+)
+
+_number_parts = frozenset(
+    [TYPE_TIME, TYPE_INTERVAL, TYPE_TIME_HR, TYPE_INTERVAL_HR]
+)
+
+_string_parts = frozenset(
+    [
+        TYPE_HOST,
+        TYPE_PLUGIN,
+        TYPE_PLUGIN_INSTANCE,
+        TYPE_TYPE,
+        TYPE_TYPE_INSTANCE,
+    ]
+)
 
 
 class MessageUnpacker:
+    """Unpacks messages into Values.
+
+    Packets that are malformed are rejected from the first malformed part
+    onwards, and counted in the :attr:`.rejects` dictionary, keyed on one of
+    :data:`.REJECT_REASONS`.
+    The work done for a packet is bounded by its size, as each part
+    decoded must move forward by at least a part header.
+
+    """
+
+    rejects: Dict[str, int]
+
     def __init__(self, types: Sequence[Type], log: Logger):
-        self._receivers = {
-            TYPE_HOST: self._unpack_string,
-            TYPE_TIME: self._unpack_long,
-            TYPE_PLUGIN: self._unpack_string,
-            TYPE_PLUGIN_INSTANCE: self._unpack_string,
-            TYPE_TYPE: self._unpack_string,
-            TYPE_TYPE_INSTANCE: self._unpack_string,
-            TYPE_VALUES: self._unpack_values,
-            TYPE_INTERVAL: self._unpack_long,
-        }
         self._types = {type_.name: type_ for type_ in types}
         self.log = log
+        self.rejects = dict.fromkeys(REJECT_REASONS, 0)
 
     def unpack_bytes(self, buf: bytes) -> Optional[Values]:
-        result = self._unpack_packet(buf)
-        try:
-            type_name = result[TYPE_TYPE]
-        except KeyError:
-            self.log.warn("Message did not have TYPE_TYPE block, skipping")
-            return None
+        """Unpack the first Values in a packet."""
+        values = self.unpack_all(buf)
+        return values[0] if values else None
+
+    def unpack_all(self, buf: bytes) -> List[Values]:
+        """Unpack all the Values in a packet into a list.
+
+        See :meth:`.iter_values`.
+
+        """
+        return list(self.iter_values(buf))
 
-        value = None
+    def iter_values(self, buf: bytes) -> Iterator[Values]:
+        """Yield each Values in a packet, in order.
+
+        A packet may hold any number of values parts.  As with collectd's
+        own network plugin, each header part such as host, plugin or type
+        stays in effect for all the values parts that follow it, until it's
+        replaced by another part of the same kind.  String parts that
+        haven't been sent are empty strings.
+
+        Parts are decoded in place from a memoryview of the packet.  The
+        values parts of types that aren't known are skipped without being
+        decoded.  If a malformed part is found, the Values that preceded it
+        have already been yielded; the remainder of the packet is skipped
+        and the reject is counted.
+
+        """
         try:
-            self._types[type_name]
-        except KeyError:
-            self.log.warn("Type %s not known, skipping", type_name)
-            return None
-        else:
-            value = self._to_value(result)
-            return value
-
-    def _to_value(self, result) -> Values:
-        return Values(
-            host=result[TYPE_HOST],
-            time=result[TYPE_TIME],
-            plugin=result[TYPE_PLUGIN],
-            plugin_instance=result[TYPE_PLUGIN_INSTANCE],
-            type=result[TYPE_TYPE],
-            type_instance=result[TYPE_TYPE_INSTANCE],
-            values=result[TYPE_VALUES],
-            interval=result[TYPE_INTERVAL],
-        )
+            yield from self._iter_values(memoryview(buf))
+        except _MalformedPacket as mp:
+            self.rejects[mp.reason] += 1
+            self.log.debug("Rejected malformed packet: %s", mp.reason)
 
-    def _unpack_packet(self, buf):
+    def _iter_values(self, view: memoryview) -> Iterator[Values]:
         pos = 0
-        length = len(buf)
-        result = {}
+        length = len(view)
+        header_size = header.size
+        header_unpack_from = header.unpack_from
+        long_unpack_from = long_.unpack_from
+        hr_unpack_from = _hr.unpack_from
+        short_unpack_from = short.unpack_from
+        make_values = Values._make
+
+        # collectd leaves out empty plugin_instance and type_instance parts
+        host = plugin = plugin_instance = type_instance = ""
+        time = interval = None
+        type_name = type_obj = None
+
+        unknown = set()
         while pos < length:
-            type_, len_ = header.unpack_from(buf, pos)
-
-            try:
-                fn = self._receivers[type_]
-            except KeyError:
-                self.log.warn("Message %s not known, skipping", type_)
+            if pos + header_size > length:
+                raise _MalformedPacket("truncated")
+            type_, len_ = header_unpack_from(view, pos)
+            end = pos + len_
+            if len_ < header_size:
+                raise _MalformedPacket("short_part")
+            elif end > length:
+                raise _MalformedPacket("overlong_part")
+
+            if type_ == TYPE_VALUES:
+                if len_ < 6:
+                    raise _MalformedPacket("short_part")
+                elif len_ != 6 + 9 * short_unpack_from(view, pos + 4)[0]:
+                    raise _MalformedPacket("value_count")
+
+                if type_obj is not None:
+                    yield make_values(
+                        (
+                            type_name,
+                            type_instance,
+                            plugin,
+                            plugin_instance,
+                            host,
+                            time,
+                            interval
+                            if interval is not None
+                            else DEFAULT_INTERVAL,
+                            type_obj._unpack_values_from(view, pos),
+                        )
+                    )
+                elif type_name is not None and type_name not in unknown:
+                    # warn once per packet
+                    unknown.add(type_name)
+                    self.log.warn("Type %s not known, skipping", type_name)
+            elif type_ in _string_parts:
+                if len_ < 5 or view[end - 1] != 0:
+                    raise _MalformedPacket("bad_string")
+                try:
+                    value = str(view[pos + 4 : end - 1], "ascii")
+                except UnicodeDecodeError:
+                    raise _MalformedPacket("bad_string")
+
+                if type_ == TYPE_TYPE:
+                    type_name = value
+                    type_obj = self._types.get(type_name)
+                elif type_ == TYPE_TYPE_INSTANCE:
+                    type_instance = value
+                elif type_ == TYPE_HOST:
+                    host = value
+                elif type_ == TYPE_PLUGIN:
+                    plugin = value
+                else:
+                    plugin_instance = value
+            elif type_ in _number_parts:
+                if len_ != 12:
+                    raise _MalformedPacket("bad_number")
+                if type_ == TYPE_TIME_HR:
+                    time = hr_unpack_from(view, pos + 4)[0] / (
+                        HR_UNITS_PER_SECOND
+                    )
+                elif type_ == TYPE_INTERVAL_HR:
+                    interval = hr_unpack_from(view, pos + 4)[0] / (
+                        HR_UNITS_PER_SECOND
+                    )
+                elif type_ == TYPE_TIME:
+                    # a whole second part sent along with a high resolution
+                    # part doesn't replace it, in either order
+                    seconds = long_unpack_from(view, pos + 4)[0]
+                    if time is None or int(time) != seconds:
+                        time = seconds
+                else:
+                    seconds = long_unpack_from(view, pos + 4)[0]
+                    if interval is None or math.ceil(interval) != seconds:
+                        interval = seconds
             else:
-                value = fn(type_, len_, buf[pos:])
-
-                result[type_] = value
-
-            pos += len_
-        return result
-
-    def _unpack_long(self, type_, length, buf):
-        return long_.unpack_from(buf, header.size)[0]
-
-    def _unpack_string(self, type_, length, buf):
-        return buf[header.size : length - 1].decode("ascii")
-
-    def _unpack_values(self, type_, length, buf):
-        num = short.unpack_from(buf, header.size)[0]
-        types_start = header.size + short.size
-        values_pos = types_start + num * char.size
-        result = []
-        for pos in range(0, num * char.size, char.size):
-            value_type = char.unpack_from(buf, types_start + pos)[0]
-            struct_ = _value_formats[value_type]
-            result.append(struct_.unpack_from(buf, values_pos)[0])
-            values_pos += struct_.size
-        return result
+                self.log.warn("Message %s not known, skipping", type_)
+
+            pos = end
+
+        if type_name is None:
+            self.log.warn("Message did not have TYPE_TYPE block, skipping")
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import logging
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Optional
+from typing import Tuple
+
+from .. import protocol
+
+
+class CollectdDispatcher:
+    """Dispatches Values to the collectd process in which we are embedded.
+
+    Rather than constructing a ``collectd.Values`` for each value as
+    :meth:`.Values.send_to_collectd` does, one ``collectd.Values`` is kept
+    for each host, plugin and plugin instance, and only its type, type
+    instance, time and values are set before each dispatch.  Those not
+    used in a call to :meth:`.dispatch_all` are discarded.
+
+    As with :meth:`.Values.send_to_collectd`, the interval configured for
+    collectd is used.
+
+    """
+
+    _templates: Dict[Tuple[Optional[str], ...], Any]
+
+    def __init__(self, collectd: Any, log: logging.Logger):
+        self.collectd = collectd
+        self.log = log
+        self._templates = {}
+
+    def _template(
+        self, host: Optional[str], plugin: Optional[str], instance: str
+    ) -> Any:
+        kw = {"plugin_instance": instance, "interval": 0}
+        if host is not None:
+            kw["host"] = host
+        if plugin is not None:
+            kw["plugin"] = plugin
+        return self.collectd.Values(**kw)
+
+    def dispatch_all(self, values: Iterable[protocol.Values]) -> int:
+        """Dispatch each of the given Values, returning the number
+        dispatched."""
+        templates = self._templates
+        used: Dict[Tuple[Optional[str], ...], Any] = {}
+        debug = self.log.isEnabledFor(logging.DEBUG)
+        count = 0
+
+        for (
+            type_,
+            type_instance,
+            plugin,
+            plugin_instance,
+            host,
+            time,
+            interval,
+            values_,
+        ) in values:
+            key = (host, plugin, plugin_instance)
+            template = used.get(key)
+            if template is None:
+                template = templates.get(key)
+                if template is None:
+                    template = self._template(
+                        host, plugin, plugin_instance or ""
+                    )
+                used[key] = template
+
+            template.type = type_
+            template.type_instance = type_instance or ""
+            template.time = time or 0
+            template.values = values_
+            if debug:
+                self.log.debug("send[collectd process] -> %r", template)
+            template.dispatch()
+            count += 1
+
+        self._templates = used
+        return count
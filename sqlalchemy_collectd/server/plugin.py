@@ -3,71 +3,151 @@ from __future__ import annotations
 import asyncio
 import logging
 import time
-from typing import Any
 from typing import Awaitable
-from typing import Iterator
 
+from . import dispatcher
 from . import receiver
+from . import workers
 from .logging import CollectdHandler
 from .. import networking
-from .. import protocol
+from .. import types_db
 from ..util import AsyncWorker
 
 
 log = logging.getLogger(__name__)
 
-receiver_: CollectdAsyncReceiverQueue
+receiver_: receiver.Receiver
+
+dispatcher_: dispatcher.CollectdDispatcher
+
+DEFAULT_PUBLISH_INTERVAL = receiver.DEFAULT_PUBLISH_INTERVAL
 
 
 class CollectdAsyncReceiverQueue(AsyncWorker):
-    queue: asyncio.Queue[Any]
+    """Runs a network receiver in its own thread and event loop, storing
+    what it receives in a :class:`.receiver.Receiver` and publishing
+    snapshots of it for the read callback."""
 
     def __init__(
-        self, receiver_fn: Awaitable[receiver.Receiver], log: logging.Logger
+        self,
+        network_receiver_fn: Awaitable[networking.AsyncNetworkReceiver],
+        receiver_: receiver.Receiver,
+        log: logging.Logger,
+        publish_interval: float = DEFAULT_PUBLISH_INTERVAL,
     ):
         super().__init__(log)
         self.loop = None
-        self.queue = asyncio.Queue()
-        self.receiver_fn = receiver_fn
-
-    def summarize(self, now) -> Iterator[protocol.Values]:
-        if self.receiver_ is not None:
-            yield from self.receiver_.summarize(now)
+        self.network_receiver_fn = network_receiver_fn
+        self.receiver_ = receiver_
+        self.publish_interval = publish_interval
 
     async def _init_service_awaitable(self):
-        self.receiver_ = await self.receiver_fn
+        self.receiver_.network_receiver = await self.network_receiver_fn
+        self._publisher = asyncio.ensure_future(self._publish())
+
+    async def _publish(self):
+        """Publish a snapshot of the receiver's statistics periodically,
+        for the read callback."""
+        receiver_ = self.receiver_
+        publish_interval = self.publish_interval
+        while True:
+            try:
+                receiver_.publish(time.time())
+            except Exception:
+                self.log.error(
+                    f"{self.__class__.__name__} caught an exception "
+                    "publishing statistics",
+                    exc_info=True,
+                )
+            await asyncio.sleep(publish_interval)
 
     async def _run_service_awaitable(self):
         await self.receiver_.receive()
 
 
 def start_plugin(config):
-    config_dict = {elem.key: tuple(elem.values) for elem in config.children}
+    config_dict = {
+        elem.key.lower(): tuple(elem.values) for elem in config.children
+    }
     host, port = config_dict.get("listen", ("localhost", 25827))
 
-    CollectdHandler.setup(__name__, config_dict.get("loglevel", ("info",))[0])
+    receive_buffer = config_dict.get(
+        "receivebuffer", (networking.DEFAULT_RECEIVE_BUFFER_SIZE,)
+    )
+    buffer_size = int(receive_buffer[0])
+    if len(receive_buffer) > 1:
+        drop_policy = receive_buffer[1]
+    else:
+        drop_policy = networking.DROP_OLDEST
+    if drop_policy not in (networking.DROP_OLDEST, networking.DROP_NEWEST):
+        raise ValueError(
+            "ReceiveBuffer drop policy must be %r or %r, got %r"
+            % (networking.DROP_OLDEST, networking.DROP_NEWEST, drop_policy)
+        )
 
-    async def _start_receiver():
-        receiver_ = receiver.Receiver(
-            networking.AsyncNetworkReceiver(
-                await networking.UDPServerReceiver.receive_from_send_clients(
-                    host, int(port), log
-                ),
-                receiver.Receiver.collectd_types,
-            )
+    publish_interval = float(
+        config_dict.get("publishinterval", (DEFAULT_PUBLISH_INTERVAL,))[0]
+    )
+    if publish_interval <= 0:
+        raise ValueError(
+            "PublishInterval must be greater than zero, got %r"
+            % (publish_interval,)
         )
 
-        log.info(
-            "sqlalchemy.collectd server listening for "
-            "SQLAlchemy clients on UDP %s %d" % (host, port)
+    workers_ = config_dict.get("workers", (0,))
+    num_workers = int(workers_[0])
+    if num_workers < 0:
+        raise ValueError(
+            "Workers must be zero or more, got %r" % (num_workers,)
         )
+    worker_executable = workers_[1] if len(workers_) > 1 else None
+
+    CollectdHandler.setup(__name__, config_dict.get("loglevel", ("info",))[0])
 
-        return receiver_
+    if "typesdb" in config_dict:
+        types = list(types_db.load(*config_dict["typesdb"]).values())
+    else:
+        types = []
 
-    q = CollectdAsyncReceiverQueue(_start_receiver(), log)
-    q.start()
     global receiver_
-    receiver_ = q
+    receiver_ = receiver.Receiver(
+        None, types=types, publish_interval=publish_interval
+    )
+
+    async def _start_network_receiver():
+        if num_workers:
+            return workers.WorkerNetworkReceiver.start(
+                host,
+                int(port),
+                log,
+                receiver.Receiver.collectd_types + types,
+                num_workers,
+                buffer_size=buffer_size,
+                drop_policy=drop_policy,
+                executable=worker_executable,
+            )
+        return networking.AsyncNetworkReceiver(
+            await networking.UDPServerReceiver.receive_from_send_clients(
+                host,
+                int(port),
+                log,
+                buffer_size=buffer_size,
+                drop_policy=drop_policy,
+            ),
+            receiver.Receiver.collectd_types + types,
+        )
+
+    CollectdAsyncReceiverQueue(
+        _start_network_receiver(),
+        receiver_,
+        log,
+        publish_interval=publish_interval,
+    ).start()
+
+    log.info(
+        "sqlalchemy.collectd server listening for "
+        "SQLAlchemy clients on UDP %s %d" % (host, port)
+    )
 
 
 def read(data=None):
@@ -79,16 +159,17 @@ def read(data=None):
 
     """
     global receiver_
-    import collectd  # type: ignore[import]
 
     now = time.time()
-    for values_obj in receiver_.summarize(now):
-        values_obj.send_to_collectd(collectd, log)
+    dispatcher_.dispatch_all(receiver_.read_snapshot(now))
 
 
 def run_collectd_plugin():
     import collectd  # type: ignore[import]
 
+    global dispatcher_
+    dispatcher_ = dispatcher.CollectdDispatcher(collectd, log)
+
     collectd.register_config(start_plugin)
     collectd.register_read(read)
 
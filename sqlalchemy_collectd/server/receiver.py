@@ -1,85 +1,334 @@
 from __future__ import annotations
 
+import functools
 import itertools
 import logging
+from typing import Any
 from typing import cast
 from typing import Dict
 from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Sequence
 from typing import Tuple
 
 from .. import collectd_types as _collectd_types
 from .. import networking
 from .. import protocol
+from .. import sketch
 from .. import stream
 
 log = logging.getLogger(__name__)
 
+# seconds between snapshots published for the read callback
+DEFAULT_PUBLISH_INTERVAL = 1.0
+
+# external values with the fields before and after "time"
+_ExternalValues = Tuple[Tuple[Tuple[Any, ...], Tuple[Any, ...]], ...]
+
+# records are keyed on host, plugin, plugin instance and type instance
+_RecordKey = Tuple[str, str, str, str]
+
+# groups summed per program name are keyed on host, plugin, plugin
+# instance and type instance, and those summed per host on host, plugin
+# and type instance.  the type instance of the SQLAlchemy plugin is the
+# process token, which is summed across, so it's "" in the group
+_ProgGroup = Tuple[str, str, str, str]
+_HostGroup = Tuple[str, str, str]
+
 
 class Receiver:
-    buckets: Dict[
-        str, stream.TimeBucket[Tuple[str, str, str], protocol.Values]
-    ]
+    buckets: Dict[str, stream.TimeBucket[_RecordKey, protocol.Values]]
 
     collectd_types = [
         _collectd_types.pool_internal,
         _collectd_types.totals_internal,
+        _collectd_types.pool_wait_internal,
+        _collectd_types.transactions_internal,
         _collectd_types.process_internal,
+        _collectd_types.checkout_time_internal,
+        _collectd_types.statement_time_internal,
+        _collectd_types.statement_internal,
     ]
 
+    # number of statement fingerprints reported per program name / host
+    max_statements = 10
+
+    # number of publish intervals after which a snapshot that hasn't been
+    # replaced is no longer reported
+    max_snapshot_intervals = 5
+
     def __init__(
         self,
-        network_receiver: networking.AsyncNetworkReceiver,
+        network_receiver: Optional[networking.AsyncNetworkReceiver],
         plugin=_collectd_types.COLLECTD_PLUGIN_NAME,
+        types: Sequence[protocol.Type] = (),
+        publish_interval: float = DEFAULT_PUBLISH_INTERVAL,
     ):
+        """Construct a Receiver.
+
+        :param network_receiver: the receiver used by :meth:`.receive`.
+         May be None until it's set, as the server plugin does once its
+         socket is open, so that :meth:`.read_snapshot` may be called
+         before then.
+
+        :param types: additional types to aggregate and report, such as
+         those loaded from a types.db file by :func:`.types_db.load`.
+         Values of these types are summed per host, plugin, plugin
+         instance and type instance, and per host, plugin and type
+         instance.   Types with the same name as one of the SQLAlchemy
+         types are ignored.
+
+        :param publish_interval: the seconds between calls to
+         :meth:`.publish`.  :meth:`.read_snapshot` stops reporting a
+         snapshot that's :attr:`.max_snapshot_intervals` of these old.
+
+        """
         self.plugin = plugin
         self.network_receiver = network_receiver
-        self.translator = stream.StreamTranslator(*self.collectd_types)
+        self.publish_interval = publish_interval
+
+        # the time of the snapshot last published for collectd's read
+        # callback, and its external values split around the time field
+        self._snapshot: Tuple[Optional[float], _ExternalValues] = (None, ())
+
+        # the time of the stale snapshot last warned about
+        self._stale_snapshot_warned: Optional[float] = None
+
+        internal_types = self.collectd_types
+        internal_names = {t.name for t in internal_types}
+        self.types = [t for t in types if t.name not in internal_names]
+        self.collectd_types = internal_types + self.types
+
+        self.translator = stream.StreamTranslator(
+            *internal_types,
+            histogram_summaries=_collectd_types.histogram_summaries,
+            qualified_types=self.types,
+        )
         self.bucket_names = [t.name for t in self.collectd_types]
         self.buckets = {
             name: cast(
-                stream.TimeBucket[Tuple[str, str, str], protocol.Values],
+                stream.TimeBucket[_RecordKey, protocol.Values],
                 stream.TimeBucket(),
             )
             for name in self.bucket_names
         }
 
+        # running sums per program name and per host of each type that's
+        # summed; statements are merged by get_top_statements()
+        self._sums_by_progname: Dict[str, stream.GroupSums[_ProgGroup]] = {}
+        self._sums_by_hostname: Dict[str, stream.GroupSums[_HostGroup]] = {}
+
+        # the external values last built from each of those sums, split
+        # around the time field so they can be yielded with a new time
+        self._external_by_progname: Dict[
+            str, Dict[_ProgGroup, _ExternalValues]
+        ] = {}
+        self._external_by_hostname: Dict[
+            str, Dict[_HostGroup, _ExternalValues]
+        ] = {}
+        for name in self.bucket_names:
+            if name == _collectd_types.statement_internal.name:
+                continue
+            self._sums_by_progname[name] = stream.GroupSums()
+            self._sums_by_hostname[name] = stream.GroupSums()
+            self._external_by_progname[name] = {}
+            self._external_by_hostname[name] = {}
+            self.buckets[name].on_expire = functools.partial(
+                self._remove_from_sums, name
+            )
+
     async def receive(self):
-        values_obj = await self.network_receiver.receive_async()
-        if values_obj is not None:
-            self._set_stats(values_obj)
+        """Receive and store the next batch of values."""
+        network_receiver = self.network_receiver
+        assert network_receiver is not None, "no network receiver set"
+        for values_obj in await network_receiver.receive_batch_async():
+            # a value that can't be stored, such as one whose client
+            # clock is too far behind, shouldn't lose the rest
+            try:
+                self._set_stats(values_obj)
+            except Exception:
+                log.error(
+                    "Could not store value %r", values_obj, exc_info=True
+                )
 
     def summarize(self, timestamp: float) -> Iterator[protocol.Values]:
+        """Yield the external values for each type, per program name and
+        per host.
+
+        External values are rebuilt only for the groups whose records
+        changed or expired since the last call; those of other groups are
+        yielded again with the given timestamp.
+
+        This reads and updates the stored records, so it's called in the
+        thread that receives, through :meth:`.publish`; collectd's read
+        callback uses :meth:`.read_snapshot`.
+
+        """
+        make_values = protocol.Values._make
+        time_ = (timestamp,)
+        for head, tail in self._iter_external_values(timestamp):
+            yield make_values(head + time_ + tail)
+
+        yield from self.get_self_stats(timestamp)
+
+    def publish(self, timestamp: float) -> None:
+        """Summarize the stored records as of the given timestamp and
+        publish the result for :meth:`.read_snapshot`.
+
+        The snapshot is an immutable tuple that replaces the previous one
+        in a single assignment, so that a reader never sees one that's
+        partially built and never waits for the thread that receives.
+
+        """
+        self._snapshot = (
+            timestamp,
+            tuple(self._iter_external_values(timestamp)),
+        )
+
+    def read_snapshot(self, timestamp: float) -> Iterator[protocol.Values]:
+        """Yield the external values last published by :meth:`.publish`
+        with the given timestamp, followed by those of
+        :meth:`.get_self_stats`.
+
+        This may be called from any thread while values are being
+        received.
+
+        A snapshot that's older than :attr:`.max_snapshot_intervals`
+        publish intervals isn't reported, as the thread that publishes is
+        failing or has stopped; a warning is logged once for it.
+
+        """
+        published, external_values = self._snapshot
+        if (
+            published is not None
+            and timestamp - published
+            > self.publish_interval * self.max_snapshot_intervals
+        ):
+            if self._stale_snapshot_warned != published:
+                self._stale_snapshot_warned = published
+                log.warning(
+                    "Statistics were last published at %s, %d seconds "
+                    "ago; not reporting them",
+                    published,
+                    timestamp - published,
+                )
+            external_values = ()
+
+        make_values = protocol.Values._make
+        time_ = (timestamp,)
+        for head, tail in external_values:
+            yield make_values(head + time_ + tail)
+
+        yield from self.get_self_stats(timestamp)
+
+    def _iter_external_values(
+        self, timestamp: float
+    ) -> Iterator[Tuple[Tuple[Any, ...], Tuple[Any, ...]]]:
         for type_ in self.collectd_types:
-            for values_obj in self.get_stats_by_progname(
-                type_.name, timestamp
-            ):
-                for (
-                    external_values_obj
-                ) in self.translator.break_into_individual_values(values_obj):
-                    yield external_values_obj
+            if type_ is _collectd_types.statement_internal:
+                for values_obj in self.get_top_statements(timestamp):
+                    yield values_obj[0:5], values_obj[6:]
+                continue
 
-            for values_obj in self.get_stats_by_hostname(
-                type_.name, timestamp
+            # expire stale records, which removes them from the sums
+            self.buckets[type_.name].get_data(timestamp)
+
+            for external_values in (
+                self._refresh_external_values(
+                    self._sums_by_progname[type_.name],
+                    self._external_by_progname[type_.name],
+                    type_.name,
+                    False,
+                ),
+                self._refresh_external_values(
+                    self._sums_by_hostname[type_.name],
+                    self._external_by_hostname[type_.name],
+                    type_.name,
+                    True,
+                ),
             ):
-                for (
-                    external_values_obj
-                ) in self.translator.break_into_individual_values(values_obj):
-                    yield external_values_obj
+                for group_values in external_values.values():
+                    yield from group_values
+
+    def _refresh_external_values(
+        self,
+        group_sums: stream.GroupSums[Any],
+        external_values: Dict[Any, _ExternalValues],
+        bucket_name: str,
+        by_hostname: bool,
+    ) -> Dict[Any, _ExternalValues]:
+        for group in group_sums.pop_changed():
+            summary = group_sums.get(group)
+            if summary is None:
+                external_values.pop(group, None)
+                continue
+
+            _, interval, sums = summary
+            if by_hostname:
+                hostname, plugin, type_instance = group
+                progname = "host"
+            else:
+                hostname, plugin, progname, type_instance = group
+            external_values[group] = tuple(
+                (values_obj[0:5], values_obj[6:])
+                for values_obj in self.translator.break_into_individual_values(
+                    protocol.Values(
+                        type=bucket_name,
+                        type_instance=type_instance,
+                        plugin=plugin,
+                        plugin_instance=progname,
+                        host=hostname,
+                        interval=interval,
+                        values=sums,
+                    )
+                )
+            )
+        return external_values
+
+    def get_self_stats(self, timestamp: float) -> Iterator[protocol.Values]:
+        """Yield external values describing the server plugin itself.
+
+        These are reported with a plugin instance of "server" and no host,
+        so that collectd fills in the name of the host it runs on.
+
+        """
+        yield protocol.Values(
+            type="derive",
+            type_instance="dropped_datagrams",
+            plugin=self.plugin,
+            plugin_instance="server",
+            time=timestamp,
+            values=[
+                self.network_receiver.connection.num_dropped
+                if self.network_receiver is not None
+                else 0
+            ],
+        )
 
     def _set_stats(self, values: protocol.Values):
         bucket_name = values.type
         timestamp = values.time
         hostname = values.host
         progname = values.plugin_instance
-        process_token = values.type_instance
         interval = values.interval
 
         bucket = self.buckets[bucket_name]
         records = bucket.get_data(timestamp, interval=interval * 2)
 
-        records[(hostname, progname, process_token)] = values
+        self._store(
+            bucket_name,
+            records,
+            (hostname, values.plugin, progname, values.type_instance),
+            values,
+        )
 
-        if process_token:
+        # statement messages have the statement digest appended to the
+        # process token.  values from other collectd plugins don't have a
+        # process token
+        process_token = values.type_instance.partition("/")[0]
+
+        if process_token and values.plugin == self.plugin:
             # manufacture a record for that is a single process count for this
             # process_token (which is roughly the pid plus a unique key
             # generated by the client plugin).   we also use a larger interval
@@ -90,38 +339,145 @@ class Receiver:
             process_records = process_bucket.get_data(
                 timestamp, interval=interval * 5
             )
-            process_records[
-                (hostname, progname, process_token)
-            ] = values.build(
-                type=_collectd_types.process_internal.name, values=[1]
+            self._store(
+                _collectd_types.process_internal.name,
+                process_records,
+                (hostname, values.plugin, progname, process_token),
+                values.build(
+                    type=_collectd_types.process_internal.name, values=[1]
+                ),
             )
 
-    def get_stats_by_progname(self, bucket_name, timestamp, agg_func=sum):
-        bucket = self.buckets[bucket_name]
-        records = bucket.get_data(timestamp)
+    def _store(
+        self,
+        bucket_name: str,
+        records: stream.DictFacade[_RecordKey, protocol.Values],
+        key: _RecordKey,
+        values: protocol.Values,
+    ) -> None:
+        previous = records.get(key)
+        records[key] = values
+        if previous is not None:
+            self._remove_from_sums(bucket_name, key, previous)
+        if bucket_name in self._sums_by_progname:
+            prog_group, host_group = self._groups(key)
+            self._sums_by_progname[bucket_name].add(prog_group, values)
+            self._sums_by_hostname[bucket_name].add(host_group, values)
 
-        for _, keys in itertools.groupby(
-            sorted(records), key=lambda rec: (rec[0], rec[1])
-        ):
-            recs = [records[key] for key in keys]
-            interval = recs[0].interval
-            # summation here is across process_tokens.
-            # if records are process_token-less, then there would be one record
-            # per host/program name.
-            values_obj = agg_func(recs).build(
-                time=timestamp, interval=interval
+    def _remove_from_sums(
+        self,
+        bucket_name: str,
+        key: _RecordKey,
+        values: protocol.Values,
+    ) -> None:
+        if bucket_name in self._sums_by_progname:
+            prog_group, host_group = self._groups(key)
+            self._sums_by_progname[bucket_name].remove(prog_group, values)
+            self._sums_by_hostname[bucket_name].remove(host_group, values)
+
+    def _groups(self, key: _RecordKey) -> Tuple[_ProgGroup, _HostGroup]:
+        hostname, plugin, progname, type_instance = key
+        if plugin == self.plugin:
+            # summation is across process tokens
+            type_instance = ""
+        return (
+            (hostname, plugin, progname, type_instance),
+            (hostname, plugin, type_instance),
+        )
+
+    def get_stats_by_progname(
+        self, bucket_name: str, timestamp: float
+    ) -> Iterator[protocol.Values]:
+        # expire stale records, which removes them from the sums
+        self.buckets[bucket_name].get_data(timestamp)
+
+        # summation here is across process_tokens.
+        # records of other plugins have no process token, and are summed
+        # per type instance
+        for (
+            (hostname, plugin, progname, type_instance),
+            _,
+            interval,
+            sums,
+        ) in self._sums_by_progname[bucket_name].sums():
+            yield protocol.Values(
+                type=bucket_name,
+                type_instance=type_instance,
+                plugin=plugin,
+                plugin_instance=progname,
+                host=hostname,
+                time=timestamp,
+                interval=interval,
+                values=sums,
             )
-            yield values_obj
 
-    def get_stats_by_hostname(self, bucket_name, timestamp, agg_func=sum):
-        bucket = self.buckets[bucket_name]
+    def get_stats_by_hostname(
+        self, bucket_name: str, timestamp: float
+    ) -> Iterator[protocol.Values]:
+        self.buckets[bucket_name].get_data(timestamp)
+
+        for (
+            (hostname, plugin, type_instance),
+            _,
+            interval,
+            sums,
+        ) in self._sums_by_hostname[bucket_name].sums():
+            yield protocol.Values(
+                type=bucket_name,
+                type_instance=type_instance,
+                plugin=plugin,
+                plugin_instance="host",
+                host=hostname,
+                time=timestamp,
+                interval=interval,
+                values=sums,
+            )
+
+    def get_top_statements(
+        self, timestamp: float
+    ) -> Iterator[protocol.Values]:
+        """Merge the statement heavy hitters sent by each process and
+        yield external values for those with the most time, per program
+        name and per host.
+
+        """
+        bucket = self.buckets[_collectd_types.statement_internal.name]
         records = bucket.get_data(timestamp)
-        for _, keys in itertools.groupby(
-            sorted(records), key=lambda rec: rec[0]
+
+        by_progname: Dict[Tuple[str, str], List[protocol.Values]] = {}
+        by_hostname: Dict[str, List[protocol.Values]] = {}
+        for key in records:
+            hostname, plugin, progname, type_instance = key
+            values_obj = records[key]
+            by_progname.setdefault((hostname, progname), []).append(values_obj)
+            by_hostname.setdefault(hostname, []).append(values_obj)
+
+        for recs, plugin_instance in itertools.chain(
+            ((recs, None) for recs in by_progname.values()),
+            ((recs, "host") for recs in by_hostname.values()),
         ):
-            recs = [records[key] for key in keys]
-            interval = recs[0].interval
-            values_obj = agg_func(recs).build(
-                plugin_instance="host", time=timestamp, interval=interval
+            first = recs[0]
+            template = first.build(
+                time=timestamp,
+                plugin_instance=plugin_instance or first.plugin_instance,
+                type="count",
             )
-            yield values_obj
+            for digest, time, count in sketch.merge(
+                (
+                    (
+                        rec.type_instance.partition("/")[2],
+                        rec.values[0],
+                        rec.values[1],
+                    )
+                    for rec in recs
+                ),
+                self.max_statements,
+            ):
+                yield template.build(
+                    type_instance="statement_time-%s" % digest,
+                    values=[time],
+                )
+                yield template.build(
+                    type_instance="statement_count-%s" % digest,
+                    values=[count],
+                )
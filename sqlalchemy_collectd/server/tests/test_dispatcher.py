@@ -0,0 +1,118 @@
+from unittest import mock
+
+from .. import dispatcher
+from ... import protocol
+from ... import testing
+
+
+class FakeCollectd:
+    """Stands in for the collectd module, recording each collectd.Values
+    constructed and each dispatch."""
+
+    def __init__(self):
+        self.constructed = []
+        self.dispatched = []
+        collectd = self
+
+        class Values:
+            def __init__(self, **kw):
+                self.type = self.type_instance = self.plugin = ""
+                self.plugin_instance = self.host = ""
+                self.time = self.interval = 0
+                self.values = []
+                for key, value in kw.items():
+                    setattr(self, key, value)
+                collectd.constructed.append(self)
+
+            def dispatch(self):
+                collectd.dispatched.append(
+                    {
+                        key: getattr(self, key)
+                        for key in (
+                            "type",
+                            "type_instance",
+                            "plugin",
+                            "plugin_instance",
+                            "host",
+                            "time",
+                            "interval",
+                            "values",
+                        )
+                    }
+                )
+
+        self.Values = Values
+
+
+class CollectdDispatcherTest(testing.TestBase):
+    def _values(self, host, plugin_instance, type_instance, value):
+        return protocol.Values(
+            type="count",
+            type_instance=type_instance,
+            plugin="sqlalchemy",
+            plugin_instance=plugin_instance,
+            host=host,
+            time=100,
+            interval=10,
+            values=[value],
+        )
+
+    def _summary(self):
+        return [
+            self._values(host, plugin_instance, type_instance, value)
+            for host in ("host1", "host2")
+            for plugin_instance in ("prog1", "host")
+            for value, type_instance in enumerate(
+                ("checkedout", "checkedin", "connections")
+            )
+        ]
+
+    def test_dispatch_values(self):
+        collectd = FakeCollectd()
+        dispatcher_ = dispatcher.CollectdDispatcher(collectd, mock.Mock())
+        values = self._summary() + [
+            protocol.Values(
+                type="derive",
+                type_instance="dropped_datagrams",
+                plugin="sqlalchemy",
+                plugin_instance="server",
+                time=100,
+                values=[5],
+            )
+        ]
+
+        self.assertEqual(dispatcher_.dispatch_all(values), len(values))
+
+        expected = []
+        for values_obj in values:
+            data = values_obj._asdict()
+            data["interval"] = 0
+            if values_obj.host is None:
+                # collectd fills in its own hostname
+                data["host"] = ""
+            expected.append(data)
+        self.assertEqual(collectd.dispatched, expected)
+
+    def test_reuse_values(self):
+        collectd = FakeCollectd()
+        dispatcher_ = dispatcher.CollectdDispatcher(collectd, mock.Mock())
+
+        for i in range(3):
+            dispatcher_.dispatch_all(self._summary())
+
+        # one collectd.Values per host / plugin instance, over all reads
+        self.assertEqual(len(collectd.constructed), 4)
+        self.assertEqual(len(collectd.dispatched), 36)
+
+    def test_unused_values_discarded(self):
+        collectd = FakeCollectd()
+        dispatcher_ = dispatcher.CollectdDispatcher(collectd, mock.Mock())
+
+        dispatcher_.dispatch_all(self._summary())
+        dispatcher_.dispatch_all(
+            [v for v in self._summary() if v.host == "host1"]
+        )
+        dispatcher_.dispatch_all(self._summary())
+
+        # host2's were discarded when host2 didn't report, then rebuilt
+        self.assertEqual(len(collectd.constructed), 6)
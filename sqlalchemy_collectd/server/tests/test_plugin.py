@@ -0,0 +1,110 @@
+import contextlib
+import importlib
+import sys
+from unittest import mock
+
+from ... import testing
+
+
+class StartPluginTest(testing.TestBase):
+    @contextlib.contextmanager
+    def _plugin(self):
+        # the plugin module registers itself with the collectd module
+        # of the collectd process when imported
+        collectd = mock.Mock()
+        with mock.patch.dict(sys.modules, {"collectd": collectd}):
+            sys.modules.pop("sqlalchemy_collectd.server.plugin", None)
+            plugin = importlib.import_module(
+                "sqlalchemy_collectd.server.plugin"
+            )
+            with mock.patch.object(
+                plugin, "CollectdAsyncReceiverQueue"
+            ) as queue, mock.patch.object(plugin.CollectdHandler, "setup"):
+                yield plugin
+            for call in queue.mock_calls:
+                if call.args:
+                    # the network receiver coroutine, not started
+                    call.args[0].close()
+            self.assertEqual(
+                collectd.register_config.mock_calls,
+                [mock.call(plugin.start_plugin)],
+            )
+
+    def _config(self, *elements):
+        return mock.Mock(
+            children=[
+                mock.Mock(key=key, values=list(values))
+                for key, *values in elements
+            ]
+        )
+
+    def test_types_db(self, tmp_path):
+        path = tmp_path / "types.db"
+        path.write_text(
+            "load shortterm:GAUGE:0:5000, midterm:GAUGE:0:5000, "
+            "longterm:GAUGE:0:5000\n"
+        )
+
+        with self._plugin() as plugin:
+            plugin.start_plugin(
+                self._config(
+                    ("Listen", "localhost", 25827),
+                    ("TypesDB", str(path)),
+                )
+            )
+
+            self.assertEqual(
+                [t.name for t in plugin.receiver_.types], ["load"]
+            )
+
+    def test_no_types_db(self):
+        with self._plugin() as plugin:
+            plugin.start_plugin(self._config(("Listen", "localhost", 25827)))
+
+            self.assertEqual(plugin.receiver_.types, [])
+
+    def test_publish_interval(self):
+        with self._plugin() as plugin:
+            plugin.start_plugin(
+                self._config(
+                    ("Listen", "localhost", 25827),
+                    ("PublishInterval", 10),
+                )
+            )
+
+            self.assertEqual(
+                plugin.CollectdAsyncReceiverQueue.call_args.kwargs,
+                {"publish_interval": 10.0},
+            )
+            self.assertEqual(plugin.receiver_.publish_interval, 10.0)
+
+    def test_publish_interval_default(self):
+        with self._plugin() as plugin:
+            plugin.start_plugin(self._config(("Listen", "localhost", 25827)))
+
+            self.assertEqual(
+                plugin.CollectdAsyncReceiverQueue.call_args.kwargs,
+                {"publish_interval": plugin.DEFAULT_PUBLISH_INTERVAL},
+            )
+
+    def test_workers_invalid(self):
+        with self._plugin() as plugin:
+            self.assertRaises(
+                ValueError,
+                plugin.start_plugin,
+                self._config(
+                    ("Listen", "localhost", 25827),
+                    ("Workers", -1),
+                ),
+            )
+
+    def test_publish_interval_invalid(self):
+        with self._plugin() as plugin:
+            self.assertRaises(
+                ValueError,
+                plugin.start_plugin,
+                self._config(
+                    ("Listen", "localhost", 25827),
+                    ("PublishInterval", 0),
+                ),
+            )
@@ -0,0 +1,724 @@
+import asyncio
+import struct
+import threading
+import time
+from unittest import mock
+
+from .. import receiver
+from ... import collectd_types
+from ... import histogram
+from ... import protocol
+from ... import testing
+
+
+class ReceiverTest(testing.TestBase):
+    def _network_receiver(self, num_dropped=0):
+        network_receiver = mock.Mock()
+        network_receiver.connection.num_dropped = num_dropped
+        return network_receiver
+
+    def _receiver(self):
+        return receiver.Receiver(self._network_receiver())
+
+    def _values(self, type_, values, process_token, time=100, host="host1"):
+        return protocol.Values(
+            type=type_.name,
+            host=host,
+            plugin="sqlalchemy",
+            plugin_instance="someprog",
+            type_instance=process_token,
+            interval=2,
+            time=time,
+            values=values,
+        )
+
+    def test_pool_stats_by_progname(self):
+        receiver_ = self._receiver()
+        receiver_._set_stats(
+            self._values(collectd_types.pool_internal, [1, 2, 3, 0, 5], "p1")
+        )
+        receiver_._set_stats(
+            self._values(collectd_types.pool_internal, [1, 4, 1, 0, 5], "p2")
+        )
+
+        results = {
+            (v.plugin_instance, v.type_instance): v
+            for v in receiver_.summarize(101)
+        }
+        self.assertEqual(results[("someprog", "checkedout")].values, [6])
+        self.assertEqual(results[("someprog", "connections")].values, [10])
+        self.assertEqual(results[("host", "checkedout")].values, [6])
+        self.assertEqual(results[("someprog", "numprocs")].values, [2])
+
+    def test_replaced_and_expired_stats(self):
+        receiver_ = self._receiver()
+        receiver_._set_stats(
+            self._values(collectd_types.pool_internal, [1, 2, 3, 0, 5], "p1")
+        )
+        receiver_._set_stats(
+            self._values(
+                collectd_types.pool_internal, [1, 4, 1, 0, 5], "p2", time=103
+            )
+        )
+        # replaces the first record for p1 rather than adding to it
+        receiver_._set_stats(
+            self._values(
+                collectd_types.pool_internal, [1, 1, 3, 0, 5], "p1", time=104
+            )
+        )
+
+        def checkedout(timestamp):
+            return {
+                (v.host, v.plugin_instance): v.values[0]
+                for v in receiver_.summarize(timestamp)
+                if v.type_instance == "checkedout"
+            }
+
+        self.assertEqual(
+            checkedout(105), {("host1", "someprog"): 5, ("host1", "host"): 5}
+        )
+
+        # p2's record expires after 2.4 times its interval of 2, p1's
+        # after that
+        self.assertEqual(
+            checkedout(108), {("host1", "someprog"): 1, ("host1", "host"): 1}
+        )
+        self.assertEqual(checkedout(109), {})
+
+    def test_summarize_rebuilds_changed_groups(self):
+        receiver_ = self._receiver()
+        receiver_._set_stats(
+            self._values(collectd_types.pool_internal, [1, 2, 3, 0, 5], "p1")
+        )
+        receiver_._set_stats(
+            self._values(
+                collectd_types.pool_internal,
+                [1, 4, 1, 0, 5],
+                "p2",
+                host="host2",
+            )
+        )
+
+        def checkedout(timestamp):
+            return {
+                (v.host, v.plugin_instance): (v.time, v.values[0])
+                for v in receiver_.summarize(timestamp)
+                if v.type_instance == "checkedout"
+            }
+
+        self.assertEqual(
+            checkedout(101),
+            {
+                ("host1", "someprog"): (101, 2),
+                ("host1", "host"): (101, 2),
+                ("host2", "someprog"): (101, 4),
+                ("host2", "host"): (101, 4),
+            },
+        )
+
+        receiver_._set_stats(
+            self._values(
+                collectd_types.pool_internal, [1, 3, 2, 0, 5], "p1", time=102
+            )
+        )
+        with mock.patch.object(
+            receiver_.translator,
+            "break_into_individual_values",
+            wraps=receiver_.translator.break_into_individual_values,
+        ) as break_into_individual_values:
+            self.assertEqual(
+                checkedout(103),
+                {
+                    ("host1", "someprog"): (103, 3),
+                    ("host1", "host"): (103, 3),
+                    ("host2", "someprog"): (103, 4),
+                    ("host2", "host"): (103, 4),
+                },
+            )
+
+        # only host1's pool stats and process count were rebuilt
+        self.assertEqual(
+            sorted(
+                (call.args[0].type, call.args[0].plugin_instance)
+                for call in break_into_individual_values.mock_calls
+            ),
+            [
+                (collectd_types.pool_internal.name, "host"),
+                (collectd_types.pool_internal.name, "someprog"),
+                (collectd_types.process_internal.name, "host"),
+                (collectd_types.process_internal.name, "someprog"),
+            ],
+        )
+
+    def test_read_snapshot(self):
+        receiver_ = self._receiver()
+        receiver_._set_stats(
+            self._values(collectd_types.pool_internal, [1, 2, 3, 0, 5], "p1")
+        )
+
+        def checkedout(timestamp):
+            return {
+                v.plugin_instance: (v.time, v.values[0])
+                for v in receiver_.read_snapshot(timestamp)
+                if v.type_instance == "checkedout"
+            }
+
+        # nothing is read until published
+        self.assertEqual(checkedout(101), {})
+
+        receiver_.publish(101)
+        self.assertEqual(
+            checkedout(102), {"someprog": (102, 2), "host": (102, 2)}
+        )
+
+        receiver_._set_stats(
+            self._values(
+                collectd_types.pool_internal, [1, 4, 1, 0, 5], "p2", time=102
+            )
+        )
+        self.assertEqual(
+            checkedout(103), {"someprog": (103, 2), "host": (103, 2)}
+        )
+
+        receiver_.publish(103)
+        self.assertEqual(
+            checkedout(104), {"someprog": (104, 6), "host": (104, 6)}
+        )
+
+        # self stats are read as they are
+        receiver_.network_receiver.connection.num_dropped = 3
+        self.assertEqual(
+            [
+                v.values
+                for v in receiver_.read_snapshot(104)
+                if v.type_instance == "dropped_datagrams"
+            ],
+            [[3]],
+        )
+
+    def test_read_snapshot_stale(self):
+        receiver_ = receiver.Receiver(
+            self._network_receiver(), publish_interval=2
+        )
+        receiver_._set_stats(
+            self._values(collectd_types.pool_internal, [1, 2, 3, 0, 5], "p1")
+        )
+
+        def read(timestamp):
+            return {
+                (v.plugin_instance, v.type_instance)
+                for v in receiver_.read_snapshot(timestamp)
+            }
+
+        receiver_.publish(101)
+
+        with mock.patch.object(receiver, "log") as log:
+            assert ("someprog", "checkedout") in read(111)
+            self.assertEqual(log.mock_calls, [])
+
+            # not published again for more than five publish intervals,
+            # e.g. as publish() raises; self stats are still reported
+            for timestamp in (112, 120, 2000):
+                self.assertEqual(
+                    read(timestamp), {("server", "dropped_datagrams")}
+                )
+            self.assertEqual(len(log.warning.mock_calls), 1)
+
+            receiver_._set_stats(
+                self._values(
+                    collectd_types.pool_internal,
+                    [1, 2, 3, 0, 5],
+                    "p1",
+                    time=2000,
+                )
+            )
+            receiver_.publish(2000)
+            assert ("someprog", "checkedout") in read(2001)
+            self.assertEqual(len(log.warning.mock_calls), 1)
+
+    def test_read_snapshot_while_receiving(self):
+        """Stress test reading snapshots in one thread while another
+        receives packets from a changing set of processes and publishes."""
+
+        num_hosts = 20
+        num_processes = 50
+        duration = 1.0
+        max_batches = 2000
+        errors = []
+        done = threading.Event()
+
+        receiver_ = self._receiver()
+
+        async def receive_batch_async():
+            batch = receive_batch_async.batch = (
+                getattr(receive_batch_async, "batch", 0) + 1
+            )
+            timestamp = 100 + batch * 0.001
+            return [
+                self._values(
+                    collectd_types.pool_internal,
+                    [1, 1, 0, 0, 1],
+                    "p%d-%d" % (batch, proc),
+                    time=timestamp,
+                    host="host%d" % (proc % num_hosts),
+                )
+                for proc in range(num_processes)
+            ]
+
+        receiver_.network_receiver.receive_batch_async = receive_batch_async
+
+        def ingest():
+            async def go():
+                batches = 0
+                start = time.perf_counter()
+                while (
+                    time.perf_counter() - start < duration
+                    and batches < max_batches
+                ):
+                    await receiver_.receive()
+                    batches += 1
+                    if batches % 10 == 0:
+                        receiver_.publish(100 + batches * 0.001)
+                return batches
+
+            try:
+                ingest.batches = asyncio.run(go())
+            except Exception as err:
+                errors.append(err)
+            finally:
+                done.set()
+
+        reads = []
+
+        def read():
+            try:
+                while not done.is_set():
+                    reads.append(sum(1 for v in receiver_.read_snapshot(101)))
+            except Exception as err:
+                errors.append(err)
+
+        threads = [threading.Thread(target=fn) for fn in (ingest, read)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        assert ingest.batches > 10
+        assert len(reads) > 1
+
+        # the batches span at most two seconds, less than the 12 seconds
+        # after which process counts expire, so all processes are live
+        receiver_.publish(100 + ingest.batches * 0.001)
+        numprocs = {
+            v.host: v.values[0]
+            for v in receiver_.read_snapshot(101)
+            if v.type_instance == "numprocs" and v.plugin_instance == "host"
+        }
+        self.assertEqual(len(numprocs), num_hosts)
+        self.assertEqual(
+            sum(numprocs.values()), ingest.batches * num_processes
+        )
+
+    def test_dropped_datagrams(self):
+        receiver_ = self._receiver()
+        receiver_.network_receiver.connection.num_dropped = 7
+
+        results = {
+            (v.plugin_instance, v.type_instance): v
+            for v in receiver_.summarize(101)
+        }
+        dropped = results[("server", "dropped_datagrams")]
+        self.assertEqual(dropped.type, "derive")
+        self.assertEqual(dropped.plugin, "sqlalchemy")
+        self.assertEqual(dropped.host, None)
+        self.assertEqual(dropped.values, [7])
+
+    def test_no_network_receiver(self):
+        # the server plugin sets the network receiver once its socket is
+        # open; until then nothing has been dropped
+        receiver_ = receiver.Receiver(None)
+
+        results = {
+            (v.plugin_instance, v.type_instance): v
+            for v in receiver_.read_snapshot(101)
+        }
+        self.assertEqual(results[("server", "dropped_datagrams")].values, [0])
+
+    def test_receive_packet(self):
+        receiver_ = self._receiver()
+        receiver_.network_receiver.receive_batch_async = mock.AsyncMock(
+            return_value=[
+                self._values(
+                    collectd_types.pool_internal, [1, 2, 3, 0, 5], "p1"
+                ),
+                self._values(
+                    collectd_types.pool_internal, [1, 4, 1, 0, 5], "p2"
+                ),
+            ]
+        )
+        asyncio.run(receiver_.receive())
+
+        results = {
+            (v.plugin_instance, v.type_instance): v
+            for v in receiver_.summarize(101)
+        }
+        self.assertEqual(results[("someprog", "checkedout")].values, [6])
+
+    def test_receive_packet_stale_value(self):
+        receiver_ = self._receiver()
+        receiver_.network_receiver.receive_batch_async = mock.AsyncMock(
+            return_value=[
+                self._values(
+                    collectd_types.pool_internal, [1, 2, 3, 0, 5], "p1"
+                ),
+                # from a client whose clock is too far behind; the bucket
+                # refuses it
+                self._values(
+                    collectd_types.pool_internal,
+                    [1, 8, 3, 0, 5],
+                    "p2",
+                    time=80,
+                ),
+                self._values(
+                    collectd_types.pool_internal, [1, 4, 1, 0, 5], "p3"
+                ),
+                self._values(
+                    collectd_types.pool_internal, [1, 1, 1, 0, 5], "p4"
+                ),
+            ]
+        )
+        with mock.patch.object(receiver, "log") as log:
+            asyncio.run(receiver_.receive())
+
+        self.assertEqual(log.error.call_count, 1)
+
+        results = {
+            (v.plugin_instance, v.type_instance): v
+            for v in receiver_.summarize(101)
+        }
+        self.assertEqual(results[("someprog", "checkedout")].values, [7])
+        self.assertEqual(results[("someprog", "numprocs")].values, [3])
+
+    def test_additional_types(self):
+        load = protocol.Type(
+            "load",
+            ("shortterm", protocol.VALUE_GAUGE),
+            ("midterm", protocol.VALUE_GAUGE),
+            ("longterm", protocol.VALUE_GAUGE),
+        )
+        counter = protocol.Type("counter", ("value", protocol.VALUE_COUNTER))
+        receiver_ = receiver.Receiver(
+            self._network_receiver(),
+            types=[load, counter, collectd_types.pool_internal],
+        )
+        self.assertEqual(receiver_.types, [load, counter])
+
+        for host, values in [("host1", [1, 2, 3]), ("host2", [2, 2, 2])]:
+            receiver_._set_stats(
+                protocol.Values(
+                    type="load",
+                    host=host,
+                    plugin="load",
+                    plugin_instance="",
+                    type_instance="",
+                    interval=2,
+                    time=100,
+                    values=values,
+                )
+            )
+        receiver_._set_stats(
+            protocol.Values(
+                type="counter",
+                host="host1",
+                plugin="myapp",
+                plugin_instance="requests",
+                type_instance="GET",
+                interval=2,
+                time=100,
+                values=[5],
+            )
+        )
+
+        results = {
+            (v.host, v.plugin_instance, v.type, v.type_instance): v.values
+            for v in receiver_.summarize(101)
+        }
+        self.assertEqual(
+            results[("host1", "", "count", "load_shortterm")], [1]
+        )
+        self.assertEqual(
+            results[("host2", "host", "count", "load_longterm")], [2]
+        )
+        self.assertEqual(
+            results[("host1", "requests", "counter", "counter_value-GET")],
+            [5],
+        )
+
+        # no process counts are made up for other plugins
+        assert not any(
+            type_instance == "numprocs"
+            for host, plugin_instance, type_, type_instance in results
+        )
+
+    def test_receive_packet_no_instances(self):
+        load = protocol.Type(
+            "load",
+            ("shortterm", protocol.VALUE_GAUGE),
+            ("midterm", protocol.VALUE_GAUGE),
+            ("longterm", protocol.VALUE_GAUGE),
+        )
+        receiver_ = receiver.Receiver(self._network_receiver(), types=[load])
+
+        # as sent by collectd's load plugin, which has no plugin_instance
+        # or type_instance parts
+        packet = (
+            b"\x00\x00\x00\x0ahost1\x00"  # TYPE_HOST
+            b"\x00\x01\x00\x0c" + struct.pack(">q", 100)  # TYPE_TIME
+            # TYPE_INTERVAL
+            + b"\x00\x07\x00\x0c"
+            + struct.pack(">q", 2)
+            + b"\x00\x02\x00\x09load\x00"  # TYPE_PLUGIN
+            + b"\x00\x04\x00\x09load\x00"  # TYPE_TYPE
+            + b"\x00\x06\x00\x21\x00\x03\x01\x01\x01"  # TYPE_VALUES
+            + struct.pack("<3d", 0.5, 1.0, 1.5)
+        )
+        unpacker = protocol.MessageUnpacker([load], mock.Mock())
+        values = unpacker.unpack_bytes(packet)
+        self.assertEqual(
+            (values.plugin_instance, values.type_instance), ("", "")
+        )
+
+        with mock.patch.object(receiver, "log") as log:
+            receiver_._set_stats(values)
+        self.assertEqual(log.mock_calls, [])
+
+        results = {
+            (v.plugin_instance, v.type_instance): v.values
+            for v in receiver_.summarize(101)
+        }
+        self.assertEqual(results[("", "load_midterm")], [1.0])
+        self.assertEqual(results[("host", "load_longterm")], [1.5])
+
+    def test_additional_types_per_type_instance(self):
+        derive = protocol.Type("derive", ("value", protocol.VALUE_DERIVE))
+        percent = protocol.Type("percent", ("value", protocol.VALUE_GAUGE))
+        receiver_ = receiver.Receiver(
+            self._network_receiver(), types=[derive, percent]
+        )
+
+        def values(type_, plugin, plugin_instance, type_instance, value):
+            return protocol.Values(
+                type=type_,
+                host="host1",
+                plugin=plugin,
+                plugin_instance=plugin_instance,
+                type_instance=type_instance,
+                interval=2,
+                time=100,
+                values=[value],
+            )
+
+        for values_obj in [
+            values("derive", "cpu", "0", "user", 20),
+            values("derive", "cpu", "0", "system", 10),
+            values("derive", "cpu", "0", "idle", 70),
+            values("derive", "cpu", "1", "user", 5),
+            values("derive", "cpu", "1", "system", 5),
+            values("derive", "cpu", "1", "idle", 90),
+            values("percent", "memory", "", "used", 40),
+            values("percent", "swap", "", "used", 10),
+        ]:
+            receiver_._set_stats(values_obj)
+
+        results = {
+            (v.plugin, v.plugin_instance, v.type_instance): v.values
+            for v in receiver_.summarize(101)
+        }
+        self.assertEqual(results[("cpu", "0", "derive_value-user")], [20])
+        self.assertEqual(results[("cpu", "0", "derive_value-idle")], [70])
+        self.assertEqual(results[("cpu", "1", "derive_value-system")], [5])
+        self.assertEqual(results[("cpu", "host", "derive_value-user")], [25])
+        self.assertEqual(results[("cpu", "host", "derive_value-idle")], [160])
+        self.assertEqual(results[("memory", "", "percent_value-used")], [40])
+        self.assertEqual(results[("swap", "", "percent_value-used")], [10])
+        self.assertEqual(
+            results[("memory", "host", "percent_value-used")], [40]
+        )
+
+    def test_checkout_time_percentiles(self):
+        receiver_ = self._receiver()
+
+        p1_counts = [0] * histogram.NUM_BUCKETS
+        p1_counts[histogram.bucket_for(0.001)] = 60
+        p2_counts = [0] * histogram.NUM_BUCKETS
+        p2_counts[histogram.bucket_for(0.001)] = 35
+        p2_counts[histogram.bucket_for(2.0)] = 5
+
+        receiver_._set_stats(
+            self._values(
+                collectd_types.checkout_time_internal, p1_counts, "p1"
+            )
+        )
+        receiver_._set_stats(
+            self._values(
+                collectd_types.checkout_time_internal, p2_counts, "p2"
+            )
+        )
+
+        results = {
+            (v.plugin_instance, v.type_instance): v
+            for v in receiver_.summarize(101)
+        }
+
+        merged = [a + b for a, b in zip(p1_counts, p2_counts)]
+        p50, p95, p99 = histogram.percentiles(merged)
+
+        for plugin_instance in ("someprog", "host"):
+            for name, expected in [
+                ("checkout_time_p50", p50),
+                ("checkout_time_p95", p95),
+                ("checkout_time_p99", p99),
+            ]:
+                values_obj = results[(plugin_instance, name)]
+                self.assertEqual(values_obj.type, "count")
+                self.assertEqual(values_obj.values, [expected])
+
+        assert p50 < 0.002
+        assert p99 > 1.0
+        assert not any(
+            type_instance.startswith("bucket")
+            for plugin_instance, type_instance in results
+        )
+
+    def test_checkout_time_percentiles_sampled_idle(self):
+        receiver_ = self._receiver()
+
+        # counts weighted by 1 / sample rate, from processes that then
+        # report an idle interval
+        weight = 1 / 0.3
+        for process_token, buckets in [
+            ("p1", [(0.001, 3), (2.0, 0)]),
+            ("p2", [(0.001, 1), (2.0, 7)]),
+            ("p3", [(0.001, 2), (2.0, 1)]),
+        ]:
+            counts = [0.0] * histogram.NUM_BUCKETS
+            for value, count in buckets:
+                counts[histogram.bucket_for(value)] = weight * count
+            receiver_._set_stats(
+                self._values(
+                    collectd_types.checkout_time_internal,
+                    counts,
+                    process_token,
+                )
+            )
+        receiver_.summarize(101)
+
+        for process_token in ("p2", "p3", "p1"):
+            receiver_._set_stats(
+                self._values(
+                    collectd_types.checkout_time_internal,
+                    [0.0] * histogram.NUM_BUCKETS,
+                    process_token,
+                    time=101,
+                )
+            )
+
+        results = {
+            (v.plugin_instance, v.type_instance): v
+            for v in receiver_.summarize(102)
+        }
+        for plugin_instance in ("someprog", "host"):
+            for name in (
+                "checkout_time_p50",
+                "checkout_time_p95",
+                "checkout_time_p99",
+            ):
+                self.assertEqual(
+                    results[(plugin_instance, name)].values, [0.0]
+                )
+
+    def test_transactions(self):
+        receiver_ = self._receiver()
+        receiver_._set_stats(
+            self._values(
+                collectd_types.transactions_internal, [10, 2, 12], "p1"
+            )
+        )
+        receiver_._set_stats(
+            self._values(collectd_types.transactions_internal, [5, 1, 7], "p2")
+        )
+        receiver_._set_stats(
+            self._values(
+                collectd_types.transactions_internal,
+                [3, 3, 6],
+                "p3",
+                host="host2",
+            )
+        )
+
+        results = {
+            (v.host, v.plugin_instance, v.type_instance): v
+            for v in receiver_.summarize(101)
+        }
+        for key, expected in [
+            (("host1", "someprog", "commits"), [15]),
+            (("host1", "someprog", "rollbacks"), [3]),
+            (("host1", "someprog", "transactions"), [19]),
+            (("host1", "host", "transactions"), [19]),
+            (("host2", "someprog", "rollbacks"), [3]),
+            (("host2", "host", "transactions"), [6]),
+        ]:
+            self.assertEqual(results[key].type, "derive")
+            self.assertEqual(results[key].values, expected)
+
+    def test_top_statements(self):
+        receiver_ = self._receiver()
+        receiver_.max_statements = 2
+
+        for process_token, host, entries in [
+            ("p1", "host1", [("aaa", 5.0, 10), ("bbb", 1.0, 100)]),
+            ("p2", "host1", [("aaa", 1.0, 2), ("ccc", 3.0, 5)]),
+            ("p3", "host2", [("ddd", 0.5, 1)]),
+        ]:
+            for digest, elapsed, count in entries:
+                receiver_._set_stats(
+                    self._values(
+                        collectd_types.statement_internal,
+                        [elapsed, count],
+                        "%s/%s" % (process_token, digest),
+                        host=host,
+                    )
+                )
+
+        results = [
+            (v.host, v.plugin_instance, v.type_instance, v.values[0])
+            for v in receiver_.summarize(101)
+            if v.type_instance.startswith("statement_")
+        ]
+        self.assertEqual(
+            results,
+            [
+                ("host1", "someprog", "statement_time-aaa", 6.0),
+                ("host1", "someprog", "statement_count-aaa", 12),
+                ("host1", "someprog", "statement_time-ccc", 3.0),
+                ("host1", "someprog", "statement_count-ccc", 5),
+                ("host2", "someprog", "statement_time-ddd", 0.5),
+                ("host2", "someprog", "statement_count-ddd", 1),
+                ("host1", "host", "statement_time-aaa", 6.0),
+                ("host1", "host", "statement_count-aaa", 12),
+                ("host1", "host", "statement_time-ccc", 3.0),
+                ("host1", "host", "statement_count-ccc", 5),
+                ("host2", "host", "statement_time-ddd", 0.5),
+                ("host2", "host", "statement_count-ddd", 1),
+            ],
+        )
+
+        # statement messages don't count as additional processes
+        numprocs = {
+            (v.host, v.plugin_instance): v.values[0]
+            for v in receiver_.summarize(101)
+            if v.type_instance == "numprocs"
+        }
+        self.assertEqual(numprocs[("host1", "someprog")], 2)
+        self.assertEqual(numprocs[("host2", "someprog")], 1)
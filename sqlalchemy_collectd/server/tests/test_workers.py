@@ -0,0 +1,119 @@
+import asyncio
+import multiprocessing
+import socket
+from unittest import mock
+
+from .. import workers
+from ... import collectd_types
+from ... import networking
+from ... import protocol
+from ... import testing
+
+
+class WorkersTest(testing.TestBase):
+    def _free_port(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    def _values(self, process_token, checkedout):
+        return protocol.Values(
+            type=collectd_types.pool_internal.name,
+            host="host1",
+            plugin="sqlalchemy",
+            plugin_instance="someprog",
+            type_instance=process_token,
+            interval=2,
+            time=100,
+            values=[1, checkedout, 3, 0, 5],
+        )
+
+    def test_receive(self):
+        port = self._free_port()
+        types = [collectd_types.pool_internal]
+        packer = protocol.MessagePacker(types, mock.Mock())
+
+        async def go():
+            network_receiver = workers.WorkerNetworkReceiver.start(
+                "127.0.0.1", port, mock.Mock(), types, 2
+            )
+            latest = {}
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+
+                async def send():
+                    # until the workers are listening
+                    while True:
+                        for token in ("p1", "p2", "p3"):
+                            for checkedout in range(5):
+                                sock.sendto(
+                                    packer.pack_values(
+                                        self._values(token, checkedout)
+                                    ),
+                                    ("127.0.0.1", port),
+                                )
+                        await asyncio.sleep(0.1)
+
+                sender = asyncio.ensure_future(send())
+                try:
+                    while len(latest) < 3:
+                        for values in await asyncio.wait_for(
+                            network_receiver.receive_batch_async(), 30
+                        ):
+                            latest[values.type_instance] = values
+                finally:
+                    sender.cancel()
+            network_receiver.close()
+            return latest
+
+        latest = asyncio.run(go())
+
+        self.assertEqual(sorted(latest), ["p1", "p2", "p3"])
+        for token, values in latest.items():
+            self.assertEqual(values, self._values(token, values.values[1]))
+
+    def test_worker_forwards_latest(self):
+        port = self._free_port()
+        types = [collectd_types.pool_internal]
+        packer = protocol.MessagePacker(types, mock.Mock())
+        receive_pipe, send_pipe = multiprocessing.Pipe(duplex=False)
+
+        async def go():
+            worker = asyncio.ensure_future(
+                workers._run_worker(
+                    "127.0.0.1",
+                    port,
+                    types,
+                    send_pipe,
+                    networking.DEFAULT_RECEIVE_BUFFER_SIZE,
+                    networking.DROP_OLDEST,
+                    0.5,
+                )
+            )
+            await asyncio.sleep(0.1)
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                for token in ("p1", "p2"):
+                    for checkedout in range(5):
+                        sock.sendto(
+                            packer.pack_values(
+                                self._values(token, checkedout)
+                            ),
+                            ("127.0.0.1", port),
+                        )
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    None, receive_pipe.recv
+                )
+            finally:
+                worker.cancel()
+
+        values, num_dropped = asyncio.run(go())
+
+        # only the latest Values of each record are forwarded
+        self.assertEqual(
+            sorted(values),
+            [
+                tuple(self._values("p1", 4)),
+                tuple(self._values("p2", 4)),
+            ],
+        )
+        self.assertEqual(num_dropped, 0)
@@ -0,0 +1,282 @@
+"""Receive and decode client packets in worker processes.
+
+Each worker process listens on the same host and port with
+``SO_REUSEPORT``, so that the kernel distributes the clients among them,
+and decodes the packets it receives outside of the collectd process and its
+GIL.  Within a short forwarding interval, a worker keeps only the latest
+Values for each record the :class:`.receiver.Receiver` stores, and sends
+those to the collectd process over a pipe as plain tuples, along with the
+number of datagrams its socket discarded.
+
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import logging
+import multiprocessing
+from multiprocessing.connection import Connection as PipeConnection
+import sys
+from typing import Any
+from typing import Deque
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from .. import networking
+from .. import protocol
+
+log = logging.getLogger(__name__)
+
+# seconds between the batches each worker sends to the collectd process
+DEFAULT_FORWARD_INTERVAL = 0.1
+
+# the Values a worker keeps per forwarding interval are keyed on their
+# host, plugin, plugin instance, type and type instance
+_ValuesKey = Tuple[str, str, str, str, str]
+
+
+class WorkerConnection(networking.AsyncReceiver):
+    """Stands in for the sockets of the worker processes, reporting the
+    total of the datagrams they discarded."""
+
+    __slots__ = ("dropped",)
+
+    dropped: List[int]
+
+    def __init__(self, host: str, port: int, log: logging.Logger, num: int):
+        self.host = host
+        self.port = port
+        self.log = log
+        self.dropped = [0] * num
+
+    @property
+    def num_dropped(self) -> int:
+        return sum(self.dropped)
+
+
+class WorkerNetworkReceiver(networking.AsyncNetworkReceiver):
+    """Receives the Values decoded by worker processes.
+
+    Use :meth:`.start` to start the worker processes, from within the event
+    loop that calls :meth:`.receive_batch_async`.
+
+    """
+
+    connection: WorkerConnection
+
+    _received: Deque[Tuple[Any, ...]]
+    _waiter: Optional[asyncio.Future[None]]
+
+    def __init__(
+        self,
+        connection: WorkerConnection,
+        types: Sequence[protocol.Type],
+        pipes: Sequence[PipeConnection],
+        processes: Sequence[multiprocessing.process.BaseProcess] = (),
+    ):
+        super().__init__(connection, types)
+        self.pipes = pipes
+        self.processes = processes
+        self._received = collections.deque()
+        self._waiter = None
+
+        loop = asyncio.get_running_loop()
+        for index, pipe in enumerate(pipes):
+            loop.add_reader(pipe.fileno(), self._read, index, pipe)
+
+    @classmethod
+    def start(
+        cls,
+        host: str,
+        port: int,
+        log: logging.Logger,
+        types: Sequence[protocol.Type],
+        num_workers: int,
+        buffer_size: int = networking.DEFAULT_RECEIVE_BUFFER_SIZE,
+        drop_policy: str = networking.DROP_OLDEST,
+        executable: Optional[str] = None,
+        forward_interval: float = DEFAULT_FORWARD_INTERVAL,
+    ) -> WorkerNetworkReceiver:
+        """Start the given number of worker processes listening on the
+        given host and port.
+
+        :param executable: the Python interpreter that runs the workers.
+         Defaults to ``sys.executable``, which within collectd may not be a
+         Python interpreter.
+
+        """
+        # collectd is a threaded process that isn't safe to fork
+        context = multiprocessing.get_context("spawn")
+        context.set_executable(executable or sys.executable)
+
+        pipes = []
+        processes = []
+        for i in range(num_workers):
+            receive_pipe, send_pipe = context.Pipe(duplex=False)
+            process = context.Process(
+                target=run_worker,
+                args=(
+                    host,
+                    port,
+                    types,
+                    send_pipe,
+                    buffer_size,
+                    drop_policy,
+                    forward_interval,
+                ),
+                name="sqlalchemy-collectd-worker-%d" % i,
+                daemon=True,
+            )
+            process.start()
+            send_pipe.close()
+            pipes.append(receive_pipe)
+            processes.append(process)
+
+        return cls(
+            WorkerConnection(host, port, log, num_workers),
+            types,
+            pipes,
+            processes,
+        )
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        loop = asyncio.get_running_loop()
+        for pipe in self.pipes:
+            loop.remove_reader(pipe.fileno())
+            pipe.close()
+        for process in self.processes:
+            process.terminate()
+            process.join()
+
+    def _read(self, index: int, pipe: PipeConnection) -> None:
+        try:
+            values, num_dropped = pipe.recv()
+        except (EOFError, OSError):
+            asyncio.get_running_loop().remove_reader(pipe.fileno())
+            self.log.error("sqlalchemy.collectd worker %d exited", index)
+            return
+
+        self.connection.dropped[index] = num_dropped
+        if values:
+            self._received.extend(values)
+            waiter = self._waiter
+            if waiter is not None and not waiter.done():
+                waiter.set_result(None)
+
+    async def receive_values_async(self) -> Iterator[protocol.Values]:
+        return iter(await self.receive_batch_async())
+
+    async def receive_batch_async(self) -> List[protocol.Values]:
+        """Return all the Values the workers have sent, waiting for at
+        least one."""
+        while not self._received:
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+
+        make_values = protocol.Values._make
+        batch = [make_values(values) for values in self._received]
+        self._received.clear()
+
+        if self.log.isEnabledFor(logging.DEBUG):
+            for value in batch:
+                self.connection.debug_receive_message(value)
+        return batch
+
+
+def run_worker(
+    host: str,
+    port: int,
+    types: Sequence[protocol.Type],
+    pipe: PipeConnection,
+    buffer_size: int = networking.DEFAULT_RECEIVE_BUFFER_SIZE,
+    drop_policy: str = networking.DROP_OLDEST,
+    forward_interval: float = DEFAULT_FORWARD_INTERVAL,
+) -> None:
+    """Receive and decode packets, sending the latest Values of each record
+    over the pipe every forward_interval seconds, until the collectd
+    process closes its end."""
+    try:
+        asyncio.run(
+            _run_worker(
+                host,
+                port,
+                types,
+                pipe,
+                buffer_size,
+                drop_policy,
+                forward_interval,
+            )
+        )
+    except (BrokenPipeError, EOFError):
+        pass
+
+
+async def _run_worker(
+    host: str,
+    port: int,
+    types: Sequence[protocol.Type],
+    pipe: PipeConnection,
+    buffer_size: int,
+    drop_policy: str,
+    forward_interval: float,
+) -> None:
+    connection = await networking.UDPServerReceiver.receive_from_send_clients(
+        host,
+        port,
+        log,
+        buffer_size=buffer_size,
+        drop_policy=drop_policy,
+        reuse_port=True,
+    )
+    unpacker = protocol.MessageUnpacker(types, log)
+    latest: Dict[_ValuesKey, protocol.Values] = {}
+
+    async def receive():
+        iter_values = unpacker.iter_values
+        while True:
+            for buf, _ in await connection.receive_many_async():
+                for values in iter_values(buf):
+                    latest[
+                        (
+                            values.host,
+                            values.plugin,
+                            values.plugin_instance,
+                            values.type,
+                            values.type_instance,
+                        )
+                    ] = values
+
+    async def forward():
+        # the collectd process reads the pipe in its event loop, so a send
+        # waits only while that loop is busy
+        parent = multiprocessing.parent_process()
+        num_dropped = 0
+        while parent is None or parent.is_alive():
+            await asyncio.sleep(forward_interval)
+            if latest or connection.num_dropped != num_dropped:
+                num_dropped = connection.num_dropped
+                pipe.send(
+                    (
+                        [tuple(values) for values in latest.values()],
+                        num_dropped,
+                    )
+                )
+                latest.clear()
+
+    done, pending = await asyncio.wait(
+        [asyncio.ensure_future(receive()), asyncio.ensure_future(forward())],
+        return_when=asyncio.FIRST_COMPLETED,
+    )
+    for task in pending:
+        task.cancel()
+    for task in done:
+        # raises the error that ended the worker, such as BrokenPipeError
+        task.result()
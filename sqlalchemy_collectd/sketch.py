@@ -0,0 +1,166 @@
+"""Bounded tracking of the SQL statements that take the most time.
+
+The client plugin, when statement tracking is enabled, reduces each SQL
+string to a fingerprint with literals and parameter lists collapsed, and
+counts execution time per fingerprint in a :class:`.SpaceSaving` sketch.
+The sketch holds a fixed number of entries no matter how many distinct
+statements are run; when a statement that isn't tracked arrives and the
+sketch is full, the entry with the least time is replaced and its time is
+carried over to the new entry as an upper bound of error, per the
+"Space-Saving" algorithm of Metwally, Agrawal and El Abbadi.  Statements
+that are actually heavy hitters stay in the sketch.
+
+Fingerprints are identified by a short digest, which is what's sent to the
+server plugin; the digest for each fingerprint is logged once on the
+``sqlalchemy_collectd.statements`` logger when first seen.
+
+"""
+from __future__ import annotations
+
+import functools
+import hashlib
+import logging
+import re
+import threading
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Set
+from typing import Tuple
+
+log = logging.getLogger("sqlalchemy_collectd.statements")
+
+DEFAULT_CAPACITY = 20
+
+_param = r"(?:\?|%s|%\(\w+\)s|:\w+)"
+
+_fingerprint_replacements = [
+    # string literals
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    # numeric literals
+    (re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b"), "?"),
+    (re.compile(r"\s+"), " "),
+    # lists of parameters or literals, such as IN lists and VALUES
+    (
+        re.compile(r"\(\s*%s(?:\s*,\s*%s)*\s*\)" % (_param, _param)),
+        "(?)",
+    ),
+    # repeated VALUES groups for multi-row INSERT
+    (re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+"), "(?)"),
+]
+
+
+def fingerprint(statement: str) -> str:
+    """Return the statement with literals and parameter lists collapsed."""
+
+    for regexp, replacement in _fingerprint_replacements:
+        statement = regexp.sub(replacement, statement)
+    return statement.strip()
+
+
+# digests whose fingerprint has been logged
+_logged_digests: Set[str] = set()
+
+
+@functools.lru_cache(maxsize=1024)
+def digest_for_statement(statement: str) -> str:
+    """Return the digest of the fingerprint of a SQL string.
+
+    Memoized on the SQL string, as applications run the same strings over
+    and over.
+
+    """
+    return digest_for_fingerprint(fingerprint(statement))
+
+
+@functools.lru_cache(maxsize=1024)
+def digest_for_fingerprint(fp: str) -> str:
+    """Return the digest of a fingerprint, logging the fingerprint the
+    first time its digest is seen.
+
+    Memoized separately from :func:`.digest_for_statement`, as the many
+    SQL strings that differ only in their literals or the length of their
+    IN lists have one fingerprint.
+
+    """
+    digest = hashlib.sha1(fp.encode("utf-8")).hexdigest()[0:12]
+    if digest not in _logged_digests:
+        _logged_digests.add(digest)
+        log.info("statement %s: %s", digest, fp)
+    return digest
+
+
+# time, count, error
+_Entry = List[float]
+
+
+class SpaceSaving:
+    """A bounded set of (digest, time, count) heavy hitters by time.
+
+    Statements are added from every thread of the application, so the
+    sketch is updated under a lock.
+
+    """
+
+    __slots__ = ("capacity", "entries", "_lock")
+
+    entries: Dict[str, _Entry]
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def add(self, key: str, elapsed: float, weight: float = 1) -> None:
+        """Count an execution of a statement taking ``elapsed`` seconds.
+
+        ``weight`` is the number of executions this one stands for, which
+        is greater than one when executions are sampled.
+
+        """
+        elapsed *= weight
+        with self._lock:
+            entries = self.entries
+            entry = entries.get(key)
+            if entry is not None:
+                entry[0] += elapsed
+                entry[1] += weight
+            elif len(entries) < self.capacity:
+                entries[key] = [elapsed, weight, 0.0]
+            else:
+                min_key = min(entries, key=lambda k: entries[k][0])
+                min_time = entries.pop(min_key)[0]
+                entries[key] = [min_time + elapsed, weight, min_time]
+
+    def snapshot_and_reset(self) -> List[Tuple[str, float, float, float]]:
+        """Return (key, time, count, error) tuples and empty the sketch."""
+
+        with self._lock:
+            entries, self.entries = self.entries, {}
+        return [
+            (key, time, count, error)
+            for key, (time, count, error) in entries.items()
+        ]
+
+
+def merge(
+    summaries: Iterable[Tuple[str, float, float]], capacity: int
+) -> List[Tuple[str, float, float]]:
+    """Merge (key, time, count) entries from many sketches, returning the
+    ``capacity`` entries having the most time, most time first.
+
+    """
+    totals: Dict[str, List[float]] = {}
+    for key, time, count in summaries:
+        total = totals.get(key)
+        if total is None:
+            totals[key] = [time, count]
+        else:
+            total[0] += time
+            total[1] += count
+
+    return sorted(
+        ((key, time, count) for key, (time, count) in totals.items()),
+        key=lambda entry: entry[1],
+        reverse=True,
+    )[0:capacity]
@@ -1,13 +1,27 @@
 from __future__ import annotations
 
+import collections
+import heapq
+import itertools
+import math
+import operator
+from typing import Any
+from typing import Callable
+from typing import cast
+from typing import Counter
 from typing import Dict
 from typing import Generic
 from typing import Iterator
+from typing import List
+from typing import Mapping
 from typing import Optional
+from typing import Sequence
+from typing import Set
 from typing import Tuple
 from typing import TypeVar
 from typing import Union
 
+from . import histogram
 from . import protocol
 
 
@@ -27,10 +41,41 @@ class StreamTranslator:
     the per-process messages have been aggregated into per-"program" messages
     and are usually at a lower interval, there is less message volume.
 
+    Internal types that carry histogram bucket counts are given in the
+    ``histogram_summaries`` mapping, linked to a type that holds percentiles;
+    these are converted to percentiles before being broken into individual
+    values.
+
+    Values of the types given in ``qualified_types`` are named after both
+    the type and the value, e.g. "load_shortterm", as types from a
+    types.db file commonly share value names such as "value".  The type
+    instance of such a Values, if any, follows, e.g. "cpu_value-user".
+
     """
 
-    def __init__(self, *collectd_types):
-        self.collectd_types = collectd_types
+    def __init__(
+        self,
+        *collectd_types: protocol.Type,
+        histogram_summaries: Optional[
+            Mapping[protocol.Type, protocol.Type]
+        ] = None,
+        qualified_types: Sequence[protocol.Type] = (),
+    ):
+        self.collectd_types = collectd_types + tuple(qualified_types)
+        self._qualified_type_names = qualified_type_names = {
+            t.name for t in qualified_types
+        }
+
+        self._histogram_summaries = {
+            histogram_type.name: summary_type
+            for histogram_type, summary_type in (
+                histogram_summaries or {}
+            ).items()
+        }
+        collectd_types = tuple(
+            self._histogram_summaries.get(t.name, t)
+            for t in self.collectd_types
+        )
 
         self._type_by_name = {t.name: t for t in collectd_types}
         self.external_types = {}
@@ -38,27 +83,60 @@ class StreamTranslator:
         self._protocol_type_string_names = {
             protocol.VALUE_GAUGE: "count",
             protocol.VALUE_DERIVE: "derive",
+            protocol.VALUE_COUNTER: "counter",
+            protocol.VALUE_ABSOLUTE: "absolute",
         }
 
+        # per internal type name, the (type, type_instance) of each
+        # external value it's broken into
+        self._external_names: Dict[str, Tuple[Tuple[str, str], ...]] = {}
+
         for internal_type in collectd_types:
-            for name, value_type in zip(
-                internal_type.names, internal_type.types
-            ):
+            if internal_type.name in qualified_type_names:
+                names = [
+                    "%s_%s" % (internal_type.name, name)
+                    for name in internal_type.names
+                ]
+            else:
+                names = internal_type.names
+
+            for name, value_type in zip(names, internal_type.types):
                 self.external_types[name] = self._type_by_name[
                     name
                 ] = external_type = protocol.Type(name, ("value", value_type))
                 self.external_type_to_internal[external_type] = internal_type
 
+            self._external_names[internal_type.name] = tuple(
+                (self._protocol_type_string_names[value_type], name)
+                for name, value_type in zip(names, internal_type.types)
+            )
+
     def break_into_individual_values(self, values_obj):
-        internal_type = self._type_by_name[values_obj.type]
-        for name, protocol_type, value_element in zip(
-            internal_type.names, internal_type.types, values_obj.values
+        summary_type = self._histogram_summaries.get(values_obj.type)
+        if summary_type is not None:
+            values_obj = values_obj.build(
+                type=summary_type.name,
+                values=histogram.percentiles(values_obj.values),
+            )
+
+        # plugin, plugin_instance, host, time, interval are carried over
+        # as is
+        carried = values_obj[2:7]
+        make_values = protocol.Values._make
+        external_names = self._external_names[values_obj.type]
+        if (
+            values_obj.type_instance
+            and values_obj.type in self._qualified_type_names
+        ):
+            external_names = tuple(
+                (type_, "%s-%s" % (type_instance, values_obj.type_instance))
+                for type_, type_instance in external_names
+            )
+        for (type_, type_instance), value_element in zip(
+            external_names, values_obj.values
         ):
-            external_type = self.external_types[name]
-            yield values_obj.build(
-                type_instance=external_type.name,
-                type=self._protocol_type_string_names[protocol_type],
-                values=[value_element],
+            yield make_values(
+                (type_, type_instance) + carried + ([value_element],)
             )
 
 
@@ -72,45 +150,110 @@ class TimeBucket(Generic[_TBKEY, _TBVALUE]):
     those that are stale based on the timestamp / interval given for that
     value.
 
+    A heap of (expiry time, sequence, key) is kept alongside the stored
+    objects, so that each call only visits those that have expired.  An
+    entry is pushed each time a key is stored; entries for keys that have
+    since been replaced or deleted are discarded when they reach the top.
+
     """
 
-    __slots__ = "bucket", "last_timestamp", "interval_factor", "last_interval"
+    __slots__ = (
+        "bucket",
+        "last_timestamp",
+        "_interval_factor",
+        "last_interval",
+        "_expiry",
+        "_counter",
+        "on_expire",
+    )
+
+    on_expire: Optional[Callable[[_TBKEY, _TBVALUE], None]]
+    """Called with the key and value of each record as it expires."""
 
     def __init__(self):
         self.bucket = {}
         self.last_timestamp = 0
         self.last_interval = 0
-        self.interval_factor = 1.2
+        self._interval_factor = 1.2
+        self._expiry = []
+        self._counter = itertools.count()
+        self.on_expire = None
+
+    @property
+    def interval_factor(self) -> float:
+        return self._interval_factor
+
+    @interval_factor.setter
+    def interval_factor(self, value: float) -> None:
+        # expiry times depend on the factor, so order them again
+        self._interval_factor = value
+        counter = self._counter
+        self._expiry = [
+            (ts + b_interval * value, next(counter), k)
+            for k, (ts, b_interval, _) in self.bucket.items()
+        ]
+        heapq.heapify(self._expiry)
+
+    def _set(
+        self,
+        key: _TBKEY,
+        timestamp: Union[float, int],
+        interval: float,
+        value: _TBVALUE,
+    ) -> None:
+        self.bucket[key] = (timestamp, interval, value)
+        heapq.heappush(
+            self._expiry,
+            (
+                timestamp + interval * self._interval_factor,
+                next(self._counter),
+                key,
+            ),
+        )
+
+    def _expire(self, timestamp: Union[float, int]) -> None:
+        expiry = self._expiry
+        bucket = self.bucket
+        interval_factor = self._interval_factor
+        while expiry and expiry[0][0] < timestamp:
+            _, _, k = heapq.heappop(expiry)
+            record = bucket.get(k)
+            if record is None:
+                continue
+            ts, b_interval, _ = record
+            # same expression as the heap entry, so that an entry that's
+            # due never leaves a current record behind
+            if ts + b_interval * interval_factor < timestamp:
+                del bucket[k]
+                if self.on_expire is not None:
+                    self.on_expire(k, record[2])
 
     def _get_bucket(
-        self, timestamp: Union[float, int], interval: Optional[int]
+        self, timestamp: Union[float, int], interval: Optional[float]
     ) -> "DictFacade[_TBKEY, _TBVALUE]":
         if interval is not None:
             self.last_interval = interval
 
-        oldest_to_accept = int(self.last_interval * self.interval_factor)
+        oldest_to_accept = self.last_interval * self._interval_factor
 
         if (
             self.last_interval
-            and int(timestamp) < int(self.last_timestamp) - oldest_to_accept
+            and timestamp < self.last_timestamp - oldest_to_accept
         ):
             raise ValueError(
                 f"bucket timestamp is now {self.last_timestamp}, "
                 f"greater than given timestamp of {timestamp} "
                 f"plus interval {oldest_to_accept}"
             )
-        for k in list(self.bucket):
-            ts, b_interval, value = self.bucket[k]
-            if ts < timestamp - int(b_interval * self.interval_factor):
-                del self.bucket[k]
+        self._expire(timestamp)
 
         self.last_timestamp = timestamp
-        return DictFacade(timestamp, interval, self.bucket)
+        return DictFacade(timestamp, interval, self.bucket, self)
 
     def put(
         self,
-        timestamp: int,
-        interval: int,
+        timestamp: Union[float, int],
+        interval: float,
         key: _TBKEY,
         data: _TBVALUE,
     ) -> "DictFacade[_TBKEY, _TBVALUE]":
@@ -122,30 +265,34 @@ class TimeBucket(Generic[_TBKEY, _TBVALUE]):
         self,
         current_time: Union[float, int],
         key: _TBKEY,
-        interval: Optional[int] = None,
+        interval: Optional[float] = None,
     ) -> Optional[_TBVALUE]:
         return self._get_bucket(current_time, interval).get(key)
 
     def get_data(
-        self, current_time: Union[float, int], interval: Optional[int] = None
+        self,
+        current_time: Union[float, int],
+        interval: Optional[float] = None,
     ) -> "DictFacade[_TBKEY, _TBVALUE]":
         return self._get_bucket(current_time, interval)
 
 
 class DictFacade(Generic[_TBKEY, _TBVALUE]):
-    __slots__ = "timestamp", "interval", "dictionary"
+    __slots__ = "timestamp", "interval", "dictionary", "time_bucket"
 
     def __init__(
         self,
         timestamp: Union[float, int],
-        interval: Optional[int],
+        interval: Optional[float],
         dictionary: Dict[
-            _TBKEY, Tuple[Union[float, int], Optional[int], _TBVALUE]
+            _TBKEY, Tuple[Union[float, int], Optional[float], _TBVALUE]
         ],
+        time_bucket: Optional[TimeBucket[_TBKEY, _TBVALUE]] = None,
     ):
         self.timestamp = timestamp
         self.interval = interval
         self.dictionary = dictionary
+        self.time_bucket = time_bucket
 
     def __contains__(self, key: _TBKEY) -> bool:
         return key in self.dictionary
@@ -163,7 +310,12 @@ class DictFacade(Generic[_TBKEY, _TBVALUE]):
         return value
 
     def __setitem__(self, key: _TBKEY, value: _TBVALUE):
-        self.dictionary[key] = (self.timestamp, self.interval, value)
+        if self.time_bucket is not None:
+            self.time_bucket._set(
+                key, self.timestamp, cast(float, self.interval), value
+            )
+        else:
+            self.dictionary[key] = (self.timestamp, self.interval, value)
 
     def __delitem__(self, key: _TBKEY):
         del self.dictionary[key]
@@ -176,3 +328,166 @@ class DictFacade(Generic[_TBKEY, _TBVALUE]):
 
     def keys(self) -> Iterator[_TBKEY]:
         return iter(self.dictionary.keys())
+
+
+_GKEY = TypeVar("_GKEY")
+
+
+class _GroupSum:
+    __slots__ = "count", "sums", "partials", "plugins", "intervals"
+
+    def __init__(self, num_values: int):
+        self.count = 0
+
+        # the sum of each data value, while only integers have been added
+        self.sums: List[float] = [0] * num_values
+
+        # once a float is added, the sum of each data value as the list of
+        # non-overlapping partial sums kept by math.fsum(), which adds and
+        # subtracts exactly, so that sums return to zero
+        self.partials: Optional[List[List[float]]] = None
+
+        self.plugins: Counter[Optional[str]] = collections.Counter()
+        self.intervals: Counter[float] = collections.Counter()
+
+    def add(self, values: Sequence[float]) -> None:
+        if self.partials is None and float not in map(type, values):
+            self.sums = list(map(operator.add, self.sums, values))
+        else:
+            for partial, value in zip(self._partials(), values):
+                _add_partial(partial, value)
+
+    def subtract(self, values: Sequence[float]) -> None:
+        if self.partials is None and float not in map(type, values):
+            self.sums = list(map(operator.sub, self.sums, values))
+        else:
+            for partial, value in zip(self._partials(), values):
+                _add_partial(partial, -value)
+
+    def _partials(self) -> List[List[float]]:
+        if self.partials is None:
+            self.partials = [[sum_] for sum_ in self.sums]
+        return self.partials
+
+    def summary(self) -> Tuple[Optional[str], float, List[float]]:
+        plugins = self.plugins
+        if len(plugins) == 1:
+            (plugin,) = plugins
+        else:
+            plugin = None
+        intervals = self.intervals
+        if len(intervals) == 1:
+            (interval,) = intervals
+        else:
+            interval = intervals.most_common(1)[0][0]
+        if self.partials is None:
+            sums = self.sums
+        else:
+            sums = [math.fsum(partial) for partial in self.partials]
+        return plugin, interval, sums
+
+
+class GroupSums(Generic[_GKEY]):
+    """Running sums of the data values of the Values in each of a set of
+    groups.
+
+    Values are added to a group as they're received and removed when
+    they're replaced or expire, so that the sum for each group is at hand
+    without visiting every Values in it.  A group is discarded when its
+    last Values is removed.  Sums are kept exactly, so that those of
+    float values, such as the weighted counts of sampled histograms,
+    don't drift from the sum of the Values in the group.
+
+    The groups added to or removed from since the last call to
+    :meth:`.pop_changed` are tracked, so that what's derived from the sums
+    need only be rebuilt for those.
+
+    """
+
+    __slots__ = ("groups", "changed")
+
+    groups: Dict[_GKEY, _GroupSum]
+    changed: Set[_GKEY]
+
+    def __init__(self):
+        self.groups = {}
+        self.changed = set()
+
+    def add(self, group: _GKEY, values_obj: protocol.Values) -> None:
+        entry = self.groups.get(group)
+        if entry is None:
+            entry = self.groups[group] = _GroupSum(len(values_obj.values))
+        entry.count += 1
+        entry.add(values_obj.values)
+        entry.plugins[values_obj.plugin] += 1
+        entry.intervals[values_obj.interval] += 1
+        self.changed.add(group)
+
+    def remove(self, group: _GKEY, values_obj: protocol.Values) -> None:
+        entry = self.groups[group]
+        self.changed.add(group)
+        entry.count -= 1
+        if not entry.count:
+            del self.groups[group]
+            return
+        entry.subtract(values_obj.values)
+        _decrement(entry.plugins, values_obj.plugin)
+        _decrement(entry.intervals, values_obj.interval)
+
+    def pop_changed(self) -> Set[_GKEY]:
+        """Return the groups changed since the last call, and start
+        tracking anew."""
+        changed = self.changed
+        self.changed = set()
+        return changed
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    def get(
+        self, group: _GKEY
+    ) -> Optional[Tuple[Optional[str], float, List[float]]]:
+        """Return (plugin, interval, sums) for a group, or None if the
+        group has no Values.
+
+        plugin is None if the Values of the group have more than one
+        plugin name, as with :meth:`.Values.sum`; interval is the one most
+        commonly given.
+
+        """
+        entry = self.groups.get(group)
+        if entry is None:
+            return None
+        return entry.summary()
+
+    def sums(
+        self,
+    ) -> Iterator[Tuple[_GKEY, Optional[str], float, List[float]]]:
+        """Yield (group, plugin, interval, sums) for each group, as with
+        :meth:`.get`."""
+        for group, entry in self.groups.items():
+            yield (group,) + entry.summary()
+
+
+def _add_partial(partials: List[float], value: float) -> None:
+    # add a value to the partial sums of Shewchuk's algorithm, as in
+    # math.fsum()
+    i = 0
+    for partial in partials:
+        if abs(value) < abs(partial):
+            value, partial = partial, value
+        hi = value + partial
+        lo = partial - (hi - value)
+        if lo:
+            partials[i] = lo
+            i += 1
+        value = hi
+    partials[i:] = [value]
+
+
+def _decrement(counter: Counter[Any], key: Any) -> None:
+    count = counter[key] - 1
+    if count:
+        counter[key] = count
+    else:
+        del counter[key]
@@ -0,0 +1,73 @@
+from .. import histogram
+from .. import testing
+
+
+class HistogramTest(testing.TestBase):
+    def test_bucket_for(self):
+        self.assertEqual(histogram.bucket_for(0), 0)
+        self.assertEqual(histogram.bucket_for(0.00005), 0)
+        self.assertEqual(histogram.bucket_for(0.0001), 1)
+        self.assertEqual(histogram.bucket_for(0.00019), 1)
+        self.assertEqual(histogram.bucket_for(0.0002), 2)
+        self.assertEqual(histogram.bucket_for(0.1), 10)
+        self.assertEqual(
+            histogram.bucket_for(100000), histogram.NUM_BUCKETS - 1
+        )
+
+    def test_bucket_bounds(self):
+        for idx, bound in enumerate(histogram.BUCKET_BOUNDS):
+            self.assertEqual(histogram.bucket_for(bound * 0.99), idx)
+            self.assertEqual(histogram.bucket_for(bound), idx + 1)
+
+    def test_snapshot_and_reset(self):
+        hist = histogram.Histogram()
+        hist.record(0.00005)
+        hist.record(0.00005)
+        hist.record(0.3)
+
+        snapshot = hist.snapshot_and_reset()
+        self.assertEqual(snapshot[0], 2)
+        self.assertEqual(snapshot[histogram.bucket_for(0.3)], 1)
+        self.assertEqual(sum(snapshot), 3)
+        self.assertEqual(hist.counts, [0] * histogram.NUM_BUCKETS)
+
+    def test_weighted(self):
+        hist = histogram.Histogram()
+        hist.record(0.00005, 10)
+        hist.record(0.3)
+
+        snapshot = hist.snapshot_and_reset()
+        self.assertEqual(snapshot[0], 10)
+        self.assertEqual(sum(snapshot), 11)
+
+    def test_percentiles_empty(self):
+        self.assertEqual(
+            histogram.percentiles([0] * histogram.NUM_BUCKETS),
+            [0.0, 0.0, 0.0],
+        )
+
+    def test_percentiles_negative_total(self):
+        # a float sum of weighted counts left slightly below zero
+        counts = [0.0] * histogram.NUM_BUCKETS
+        counts[10] = -3.55e-15
+        self.assertEqual(histogram.percentiles(counts), [0.0, 0.0, 0.0])
+
+    def test_percentiles(self):
+        counts = [0] * histogram.NUM_BUCKETS
+
+        # 90 values in [0.0001, 0.0002), 10 values in [0.0512, 0.1024)
+        counts[1] = 90
+        counts[10] = 10
+
+        p50, p95, p99 = histogram.percentiles(counts)
+        assert 0.0001 <= p50 < 0.0002
+        assert 0.0512 <= p95 < 0.1024
+        assert p95 < p99 < 0.1024
+
+    def test_percentiles_last_bucket(self):
+        counts = [0] * histogram.NUM_BUCKETS
+        counts[-1] = 5
+        self.assertEqual(
+            histogram.percentiles(counts, [0.5]),
+            [histogram.BUCKET_BOUNDS[-1]],
+        )
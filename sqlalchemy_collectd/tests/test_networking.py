@@ -0,0 +1,209 @@
+import asyncio
+import socket
+from unittest import mock
+
+import pytest
+
+from .. import networking
+from .. import protocol
+from .. import testing
+
+
+class NetworkingTest(testing.TestBase):
+    type_ = protocol.Type("my_type", ("some_val", protocol.VALUE_GAUGE))
+
+    def _values(self, count):
+        value = protocol.Values(
+            type="my_type",
+            host="somehost",
+            plugin="someplugin",
+            plugin_instance="someplugininstance",
+            type_instance="sometypeinstance",
+            time=1517607042,
+        )
+        return [value.build(values=[i]) for i in range(count)]
+
+    def test_send_many(self):
+        connection = mock.Mock(spec=networking.SyncSender, log=mock.Mock())
+        sender = networking.NetworkSender(connection, [self.type_])
+
+        values = self._values(3)
+        sender.send_many(values)
+
+        self.assertEqual(
+            connection.send.mock_calls,
+            [mock.call(packet) for packet in sender.pack_many(values)],
+        )
+        self.assertEqual(len(connection.send.mock_calls), 1)
+
+    def test_receive_multi_value_packet(self):
+        values = self._values(3)
+        packer = protocol.MessagePacker([self.type_], mock.Mock())
+        packets = [(packet, "addr") for packet in packer.pack_many(values)]
+        packets.append((b"", "addr"))
+
+        connection = mock.Mock(
+            log=mock.Mock(),
+            receive_async=mock.AsyncMock(side_effect=packets),
+        )
+        receiver = networking.AsyncNetworkReceiver(connection, [self.type_])
+
+        async def go():
+            return [await receiver.receive_async() for i in range(4)]
+
+        self.assertEqual(asyncio.run(go()), values + [None])
+        self.assertEqual(len(connection.receive_async.mock_calls), 2)
+
+    def test_receive_values(self):
+        values = self._values(3)
+        packer = protocol.MessagePacker([self.type_], mock.Mock())
+        (packet,) = packer.pack_many(values)
+
+        connection = mock.Mock(
+            log=mock.Mock(),
+            receive_async=mock.AsyncMock(return_value=(packet, "addr")),
+        )
+        receiver = networking.AsyncNetworkReceiver(connection, [self.type_])
+
+        async def go():
+            return list(await receiver.receive_values_async())
+
+        self.assertEqual(asyncio.run(go()), values)
+        self.assertEqual(
+            connection.debug_receive_message.mock_calls,
+            [mock.call(value) for value in values],
+        )
+
+    def test_receive_batch(self):
+        values = self._values(5)
+        packer = protocol.MessagePacker([self.type_], mock.Mock())
+        packets = [
+            (packer.pack_values(value), "addr") for value in values[0:2]
+        ] + [(b"", "addr")]
+        (packet,) = packer.pack_many(values[2:])
+        packets.append((packet, "addr"))
+
+        connection = mock.Mock(
+            log=mock.Mock(),
+            receive_many_async=mock.AsyncMock(return_value=packets),
+        )
+        receiver = networking.AsyncNetworkReceiver(connection, [self.type_])
+
+        self.assertEqual(asyncio.run(receiver.receive_batch_async()), values)
+        self.assertEqual(len(connection.receive_many_async.mock_calls), 1)
+
+    def test_server_receiver_drains_datagrams(self):
+        protocol_ = networking.UDPServerReceiver._ServerReceiverProtocol(
+            mock.Mock()
+        )
+
+        async def go():
+            waiting = asyncio.ensure_future(protocol_.recvfrom_many())
+            await asyncio.sleep(0)
+
+            # datagrams delivered before the receiver runs again are all
+            # returned at once
+            for i in range(3):
+                protocol_.datagram_received(b"msg%d" % i, ("host", 1))
+            first = await waiting
+
+            protocol_.datagram_received(b"msg3", ("host", 1))
+            protocol_.datagram_received(b"msg4", ("host", 1))
+            second = await protocol_.recvfrom()
+            third = await protocol_.recvfrom_many()
+
+            protocol_.connection_lost(None)
+            with pytest.raises(IOError):
+                await protocol_.recvfrom_many()
+            return first, second, third
+
+        first, second, third = asyncio.run(go())
+        addr = str(("host", 1))
+        self.assertEqual(
+            first, [(b"msg0", addr), (b"msg1", addr), (b"msg2", addr)]
+        )
+        self.assertEqual(second, (b"msg3", addr))
+        self.assertEqual(third, [(b"msg4", addr)])
+
+    def _fill_receiver_protocol(self, drop_policy):
+        protocol_ = networking.UDPServerReceiver._ServerReceiverProtocol(
+            mock.Mock(), buffer_size=3, drop_policy=drop_policy
+        )
+        for i in range(5):
+            protocol_.datagram_received(b"msg%d" % i, ("host", 1))
+        received = asyncio.run(protocol_.recvfrom_many())
+        return protocol_, [data for data, addr in received]
+
+    def test_receiver_drop_oldest(self):
+        protocol_, received = self._fill_receiver_protocol(
+            networking.DROP_OLDEST
+        )
+        self.assertEqual(received, [b"msg2", b"msg3", b"msg4"])
+        self.assertEqual(protocol_.num_dropped, 2)
+
+    def test_receiver_drop_newest(self):
+        protocol_, received = self._fill_receiver_protocol(
+            networking.DROP_NEWEST
+        )
+        self.assertEqual(received, [b"msg0", b"msg1", b"msg2"])
+        self.assertEqual(protocol_.num_dropped, 2)
+
+    def test_client_receiver_drops(self):
+        protocol_ = networking.UDPClientReceiver._ClientReceiverProtocol(
+            mock.Mock(), buffer_size=1
+        )
+        protocol_.datagram_received(b"msg0", ("host", 1))
+        protocol_.datagram_received(b"msg1", ("host", 1))
+        self.assertEqual(
+            asyncio.run(protocol_.recvfrom()), (b"msg1", str(("host", 1)))
+        )
+        self.assertEqual(protocol_.num_dropped, 1)
+
+    def test_receiver_bad_drop_policy(self):
+        with pytest.raises(ValueError):
+            networking.UDPServerReceiver._ServerReceiverProtocol(
+                mock.Mock(), drop_policy="drop_some"
+            )
+
+    def test_server_receiver_loopback(self):
+        values = self._values(10)
+        packer = protocol.MessagePacker([self.type_], mock.Mock())
+
+        async def go():
+            connection = (
+                await networking.UDPServerReceiver.receive_from_send_clients(
+                    "127.0.0.1", 0, mock.Mock()
+                )
+            )
+            receiver = networking.AsyncNetworkReceiver(
+                connection, [self.type_]
+            )
+            addr = connection._transport.get_extra_info("sockname")
+
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                for value in values:
+                    sock.sendto(packer.pack_values(value), addr)
+
+            received = []
+            while len(received) < len(values):
+                received.extend(await receiver.receive_batch_async())
+            connection._transport.close()
+            return received
+
+        self.assertEqual(asyncio.run(go()), values)
+
+    def test_send_many_async(self):
+        connection = mock.Mock(
+            spec=networking.AsyncSender,
+            log=mock.Mock(),
+            send_async=mock.AsyncMock(),
+        )
+        sender = networking.AsyncNetworkSender(connection, [self.type_])
+
+        values = self._values(3)
+        asyncio.run(sender.send_many_async(values))
+
+        self.assertEqual(
+            connection.send_async.mock_calls,
+            [mock.call(packet) for packet in sender.pack_many(values)],
+        )
@@ -1,5 +1,9 @@
+import pickle
+import random
 from unittest import mock
 
+import pytest
+
 from .. import protocol
 from .. import testing
 
@@ -14,6 +18,56 @@ class CollectDProtocolTest(testing.TestBase):
 
         self.assertEqual(self.value_block, type_._encode_values(25.809, 450))
 
+    def test_encode_mixed_byte_order(self):
+        type_ = protocol.Type(
+            "my_type",
+            ("g1", protocol.VALUE_GAUGE),
+            ("d1", protocol.VALUE_DERIVE),
+            ("c1", protocol.VALUE_COUNTER),
+            ("g2", protocol.VALUE_GAUGE),
+            ("g3", protocol.VALUE_GAUGE),
+            ("a1", protocol.VALUE_ABSOLUTE),
+        )
+        values = [1.5, -20, 30, 2.5, 3.5, 40]
+
+        # one struct per run of values with the same byte order
+        self.assertEqual(
+            [struct_.format for _, struct_, _, _ in type_._value_runs],
+            ["<d", "!qQ", "<dd", "!Q"],
+        )
+
+        expected = type_._message_template + b"".join(
+            format_.pack(value)
+            for format_, value in zip(type_._value_formats, values)
+        )
+        self.assertEqual(type_._encode_values(*values), expected)
+        self.assertEqual(len(expected), type_.values_size)
+
+    def test_header_cache_bounded(self):
+        type_ = protocol.Type("my_type", ("some_val", protocol.VALUE_GAUGE))
+        packer = protocol.MessagePacker([type_], mock.Mock())
+        packer.header_cache_size = 10
+
+        value = protocol.Values(
+            type="my_type",
+            host="somehost",
+            plugin="someplugin",
+            plugin_instance="someplugininstance",
+            time=1517607042,
+            values=[5],
+        )
+        for i in range(25):
+            message = packer.pack_values(
+                value.build(type_instance="instance%d" % i)
+            )
+            assert len(packer._header_cache) <= 10
+            self.assertEqual(
+                protocol.MessageUnpacker([type_], mock.Mock()).unpack_bytes(
+                    message
+                ),
+                value.build(type_instance="instance%d" % i, interval=10),
+            )
+
     value_block = (
         b"\x00\x06"  # TYPE_VALUES
         b"\x00\x18"  # part length
@@ -35,6 +89,23 @@ class CollectDProtocolTest(testing.TestBase):
         b"\x00\x05\x00\x15sometypeinstance\x00"  # TYPE_TYPE_INSTANCE
     ) + value_block
 
+    # as sent by the client, with whole second and high resolution time and
+    # interval
+    message_hr = (
+        b"\x00\x00\x00\rsomehost\x00"  # TYPE_HOST
+        b"\x00\x01\x00\x0c\x00\x00\x00\x00Zt\xd8\x82"  # TYPE_TIME
+        b"\x00\x08\x00\x0c\x16\x9d6 \xbdkf\x00"  # TYPE_TIME_HR
+        b"\x00\x02\x00\x0fsomeplugin\x00"  # TYPE_PLUGIN
+        # TYPE_PLUGIN_INSTANCE
+        b"\x00\x03\x00\x17someplugininstance\x00"
+        b"\x00\x04\x00\x0cmy_type\x00"  # TYPE_TYPE
+        # TYPE_INTERVAL
+        b"\x00\x07\x00\x0c\x00\x00\x00\x00\x00\x00\x00\n"
+        # TYPE_INTERVAL_HR
+        b"\x00\x09\x00\x0c\x00\x00\x00\x02\x80\x00\x00\x00"
+        b"\x00\x05\x00\x15sometypeinstance\x00"  # TYPE_TYPE_INSTANCE
+    ) + value_block
+
     def test_values_sum(self):
         value = protocol.Values(
             type="my_type",
@@ -102,6 +173,59 @@ class CollectDProtocolTest(testing.TestBase):
             ),
         )
 
+    def test_values_immutable(self):
+        value = protocol.Values(type="my_type", time=50)
+
+        with pytest.raises(AttributeError):
+            value.time = 70
+
+        self.assertEqual(value.interval, protocol.DEFAULT_INTERVAL)
+        self.assertEqual(
+            value.build(interval=None).interval, protocol.DEFAULT_INTERVAL
+        )
+        self.assertEqual(value.build(interval=5).interval, 5)
+        self.assertEqual(value.time, 50)
+
+    def test_values_not_equal_to_tuple(self):
+        value = protocol.Values(type="my_type", values=[1])
+
+        assert value != tuple(value)
+        assert value == protocol.Values._make(tuple(value))
+
+    def test_values_bulk_sum(self):
+        value = protocol.Values(
+            type="my_type",
+            host="somehost",
+            plugin="someplugin",
+            plugin_instance="someplugininstance",
+            type_instance="sometypeinstance",
+            time=50,
+            interval=5,
+        )
+
+        self.assertEqual(
+            protocol.Values.sum(
+                [
+                    value.build(values=[5, 10]),
+                    value.build(values=[25, 8]),
+                    value.build(values=[11, 7]),
+                ]
+            ),
+            value.build(values=[41, 25]),
+        )
+
+        self.assertEqual(
+            protocol.Values.sum(
+                [
+                    value.build(type_instance="one", values=[5, 10]),
+                    value.build(time=60, interval=10, values=[25, 8]),
+                ]
+            ),
+            value.build(
+                type_instance=None, time=None, interval=None, values=[30, 18]
+            ),
+        )
+
     def test_message_construct(self):
         type_ = protocol.Type(
             "my_type",
@@ -123,7 +247,90 @@ class CollectDProtocolTest(testing.TestBase):
             value.build(time=1517607042.95968, values=[25.809, 450])
         )
 
-        self.assertEqual(self.message, byteval)
+        self.assertEqual(self.message_hr, byteval)
+
+    def test_decode_packet_hr(self):
+        type_ = protocol.Type(
+            "my_type",
+            ("some_val", protocol.VALUE_GAUGE),
+            ("some_other_val", protocol.VALUE_DERIVE),
+        )
+
+        network_receiver = protocol.MessageUnpacker([type_], mock.Mock())
+        result = network_receiver.unpack_bytes(self.message_hr)
+        self.assertEqual(
+            protocol.Values(
+                type="my_type",
+                host="somehost",
+                plugin="someplugin",
+                plugin_instance="someplugininstance",
+                type_instance="sometypeinstance",
+                values=[25.809, 450],
+                interval=10,
+                time=1517607042.95968,
+            ),
+            result,
+        )
+
+    def test_decode_packet_hr_any_order(self):
+        type_ = protocol.Type(
+            "my_type",
+            ("some_val", protocol.VALUE_GAUGE),
+            ("some_other_val", protocol.VALUE_DERIVE),
+        )
+        time_ = b"\x00\x01\x00\x0c\x00\x00\x00\x00Zt\xd8\x82"
+        time_hr = b"\x00\x08\x00\x0c\x16\x9d6 \xbdkf\x00"
+        interval = b"\x00\x07\x00\x0c\x00\x00\x00\x00\x00\x00\x00\n"
+        interval_hr = b"\x00\x09\x00\x0c\x00\x00\x00\x02\x80\x00\x00\x00"
+        assert time_ + time_hr in self.message_hr
+        assert interval + interval_hr in self.message_hr
+
+        network_receiver = protocol.MessageUnpacker([type_], mock.Mock())
+
+        # the high resolution parts are used when they come first
+        result = network_receiver.unpack_bytes(
+            self.message_hr.replace(time_ + time_hr, time_hr + time_).replace(
+                interval + interval_hr, interval_hr + interval
+            )
+        )
+        self.assertEqual(
+            (result.time, result.interval), (1517607042.95968, 10)
+        )
+
+        # as decoded by servers that skip the high resolution parts
+        result = network_receiver.unpack_bytes(
+            self.message_hr.replace(time_hr, b"").replace(interval_hr, b"")
+        )
+        self.assertEqual((result.time, result.interval), (1517607042, 10))
+
+    def test_sub_second_interval(self):
+        type_ = protocol.Type("my_type", ("some_val", protocol.VALUE_GAUGE))
+        value = protocol.Values(
+            type="my_type",
+            host="somehost",
+            plugin="someplugin",
+            plugin_instance="someplugininstance",
+            type_instance="sometypeinstance",
+            time=1517607042.25,
+            interval=0.5,
+            values=[5],
+        )
+        message = protocol.MessagePacker([type_], mock.Mock()).pack_values(
+            value
+        )
+        result = protocol.MessageUnpacker([type_], mock.Mock()).unpack_bytes(
+            message
+        )
+        self.assertEqual(result.time, 1517607042.25)
+        self.assertEqual(result.interval, 0.5)
+
+        # the whole second interval is rounded up
+        self.assertEqual(
+            protocol.long_.unpack_from(
+                message, message.index(b"\x00\x07\x00\x0c") + 4
+            ),
+            (1,),
+        )
 
     def test_decode_packet(self):
         type_ = protocol.Type(
@@ -148,6 +355,24 @@ class CollectDProtocolTest(testing.TestBase):
             result,
         )
 
+    def test_type_pickle(self):
+        type_ = protocol.Type(
+            "my_type",
+            ("some_val", protocol.VALUE_GAUGE),
+            ("some_other_val", protocol.VALUE_DERIVE),
+        )
+        value = protocol.Values(type="my_type", time=50, values=[25.809, 450])
+
+        type_copy = pickle.loads(pickle.dumps(type_))
+        self.assertEqual(type_copy.name, "my_type")
+        self.assertEqual(type_copy.names, ["some_val", "some_other_val"])
+        self.assertEqual(
+            protocol.MessagePacker([type_copy], mock.Mock()).pack_values(
+                value
+            ),
+            protocol.MessagePacker([type_], mock.Mock()).pack_values(value),
+        )
+
     def test_decode_unknown_type(self):
         type_ = protocol.Type(
             "my_type",
@@ -158,14 +383,324 @@ class CollectDProtocolTest(testing.TestBase):
         log = mock.Mock()
         network_receiver = protocol.MessageUnpacker([type_], log)
 
-        result = network_receiver.unpack_bytes(b"asdfjq34kt2n34kjnas")
+        # a part we don't know, followed by nothing else
+        result = network_receiver.unpack_bytes(b"\x01\x00\x00\x08abcd")
         self.assertEqual(result, None)
         self.assertEqual(
             log.mock_calls,
             [
-                mock.call.warn("Message %s not known, skipping", mock.ANY),
+                mock.call.warn("Message %s not known, skipping", 256),
                 mock.call.warn(
                     "Message did not have TYPE_TYPE block, skipping"
                 ),
             ],
         )
+
+    def test_decode_unknown_part_skipped(self):
+        type_ = protocol.Type(
+            "my_type",
+            ("some_val", protocol.VALUE_GAUGE),
+            ("some_other_val", protocol.VALUE_DERIVE),
+        )
+
+        network_receiver = protocol.MessageUnpacker([type_], mock.Mock())
+        result = network_receiver.unpack_bytes(
+            b"\x01\x00\x00\x08abcd" + self.message
+        )
+        self.assertEqual(result.values, [25.809, 450])
+
+    @pytest.mark.parametrize(
+        "packet, reason",
+        [
+            (b"asdfjq34kt2n34kjnas", "overlong_part"),
+            (b"\x00\x00", "truncated"),
+            # zero length part would otherwise never advance
+            (b"\x00\x00\x00\x00", "short_part"),
+            (b"\x00\x00\x00\x02", "short_part"),
+            (message[0:-3], "overlong_part"),
+            (b"\x00\x06\x00\x05\x00" + message, "short_part"),
+            # values part length doesn't match number of values
+            (
+                message.replace(
+                    b"\x00\x06\x00\x18\x00\x02", b"\x00\x06\x00\x18\x00\x03"
+                ),
+                "value_count",
+            ),
+            # no null terminator for host name
+            (message.replace(b"somehost\x00", b"somehostt"), "bad_string"),
+            (message.replace(b"somehost", b"s\xffmehost"), "bad_string"),
+            # time part with a four byte value
+            (
+                b"\x00\x01\x00\x08\x00\x00\x00\x00" + message,
+                "bad_number",
+            ),
+            # values part with a value type that doesn't exist
+            (
+                message.replace(b"\x02\x01\x02\xc9", b"\x02\x01\x09\xc9"),
+                "value_type",
+            ),
+        ],
+    )
+    def test_decode_malformed(self, packet, reason):
+        type_ = protocol.Type(
+            "my_type",
+            ("some_val", protocol.VALUE_GAUGE),
+            ("some_other_val", protocol.VALUE_DERIVE),
+        )
+
+        log = mock.Mock()
+        network_receiver = protocol.MessageUnpacker([type_], log)
+
+        self.assertEqual(network_receiver.unpack_all(packet), [])
+        self.assertEqual(
+            network_receiver.rejects,
+            {
+                reject_reason: 1 if reject_reason == reason else 0
+                for reject_reason in protocol.REJECT_REASONS
+            },
+        )
+
+        # still works after that
+        self.assertEqual(
+            network_receiver.unpack_bytes(self.message).values, [25.809, 450]
+        )
+
+    def test_decode_malformed_after_values(self):
+        type_ = protocol.Type(
+            "my_type",
+            ("some_val", protocol.VALUE_GAUGE),
+            ("some_other_val", protocol.VALUE_DERIVE),
+        )
+        network_receiver = protocol.MessageUnpacker([type_], mock.Mock())
+
+        # values before the malformed part are still produced
+        result = network_receiver.unpack_all(
+            self.message + b"\x00\x06\x00\x05\x00" + self.message
+        )
+        self.assertEqual([v.values for v in result], [[25.809, 450]])
+        self.assertEqual(network_receiver.rejects["short_part"], 1)
+
+    def test_decode_random_bytes(self):
+        type_ = protocol.Type(
+            "my_type",
+            ("some_val", protocol.VALUE_GAUGE),
+            ("some_other_val", protocol.VALUE_DERIVE),
+        )
+        network_receiver = protocol.MessageUnpacker([type_], mock.Mock())
+
+        rand = random.Random(42)
+        for i in range(2000):
+            packet = bytearray(self.message)
+            for j in range(rand.randint(1, 5)):
+                packet[rand.randrange(len(packet))] = rand.randrange(256)
+            packet = packet[0 : rand.randint(0, len(packet))]
+
+            # never raises
+            result = network_receiver.unpack_all(packet)
+            assert len(result) <= 1
+
+    def _multi_values(self, count):
+        type_ = protocol.Type(
+            "my_type",
+            ("some_val", protocol.VALUE_GAUGE),
+            ("some_other_val", protocol.VALUE_DERIVE),
+        )
+        other_type = protocol.Type(
+            "my_other_type", ("some_val", protocol.VALUE_GAUGE)
+        )
+        value = protocol.Values(
+            host="somehost",
+            plugin="someplugin",
+            plugin_instance="someplugininstance",
+            type_instance="sometypeinstance",
+            time=1517607042,
+        )
+        values = []
+        for i in range(count):
+            values.append(value.build(type="my_type", values=[i * 1.5, i]))
+            values.append(
+                value.build(
+                    type="my_other_type",
+                    type_instance="othertypeinstance%d" % i,
+                    values=[i * 2.5],
+                )
+            )
+        return [type_, other_type], values
+
+    def _parts(self, packet):
+        pos = 0
+        parts = []
+        while pos < len(packet):
+            typecode, length = protocol.header.unpack_from(packet, pos)
+            parts.append(typecode)
+            pos += length
+        return parts
+
+    def test_pack_many(self):
+        types, values = self._multi_values(2)
+        packer = protocol.MessagePacker(types, mock.Mock())
+
+        (packet,) = packer.pack_many(values)
+
+        # header parts are packed only when they change
+        self.assertEqual(
+            self._parts(packet),
+            [
+                protocol.TYPE_HOST,
+                protocol.TYPE_TIME,
+                protocol.TYPE_TIME_HR,
+                protocol.TYPE_PLUGIN,
+                protocol.TYPE_PLUGIN_INSTANCE,
+                protocol.TYPE_TYPE,
+                protocol.TYPE_INTERVAL,
+                protocol.TYPE_INTERVAL_HR,
+                protocol.TYPE_TYPE_INSTANCE,
+                protocol.TYPE_VALUES,
+                protocol.TYPE_TYPE,
+                protocol.TYPE_TYPE_INSTANCE,
+                protocol.TYPE_VALUES,
+                protocol.TYPE_TYPE,
+                protocol.TYPE_TYPE_INSTANCE,
+                protocol.TYPE_VALUES,
+                protocol.TYPE_TYPE,
+                protocol.TYPE_TYPE_INSTANCE,
+                protocol.TYPE_VALUES,
+            ],
+        )
+        # the first message is the same as when packed individually
+        assert packet.startswith(packer.pack_values(values[0]))
+
+        unpacker = protocol.MessageUnpacker(types, mock.Mock())
+        self.assertEqual(unpacker.unpack_all(packet), values)
+        self.assertEqual(unpacker.unpack_bytes(packet), values[0])
+
+    def test_iter_values(self):
+        types, values = self._multi_values(3)
+        packer = protocol.MessagePacker(types, mock.Mock())
+        (packet,) = packer.pack_many(values)
+
+        unpacker = protocol.MessageUnpacker(types, mock.Mock())
+        iterator = unpacker.iter_values(packet)
+        self.assertEqual(next(iterator), values[0])
+        self.assertEqual(list(iterator), values[1:])
+
+    def test_iter_values_carries_parts_forward(self):
+        # a packet as collectd's network plugin might send it, where
+        # the values parts pick up header parts from earlier in the packet
+        types, values = self._multi_values(1)
+        packer = protocol.MessagePacker(types, mock.Mock())
+        first = packer.pack_values(values[0])
+        second = packer._pack_string(protocol.TYPE_HOST, "otherhost") + types[
+            0
+        ]._encode_values(7.5, 8)
+
+        unpacker = protocol.MessageUnpacker(types, mock.Mock())
+        self.assertEqual(
+            list(unpacker.iter_values(first + second)),
+            [values[0], values[0].build(host="otherhost", values=[7.5, 8])],
+        )
+
+    def test_pack_many_max_size(self):
+        types, values = self._multi_values(50)
+        packer = protocol.MessagePacker(types, mock.Mock())
+        unpacker = protocol.MessageUnpacker(types, mock.Mock())
+
+        packets = list(packer.pack_many(values))
+        assert len(packets) > 1
+        for packet in packets:
+            assert len(packet) <= protocol.MAX_PACKET_SIZE
+
+            # each packet starts with a full header
+            self.assertEqual(self._parts(packet)[0], protocol.TYPE_HOST)
+
+        self.assertEqual(
+            [
+                values_obj
+                for packet in packets
+                for values_obj in unpacker.unpack_all(packet)
+            ],
+            values,
+        )
+
+    def test_pack_many_empty(self):
+        packer = protocol.MessagePacker([], mock.Mock())
+        self.assertEqual(list(packer.pack_many([])), [])
+
+    def test_unpack_all_unknown_type(self):
+        types, values = self._multi_values(1)
+        packer = protocol.MessagePacker(types, mock.Mock())
+        (packet,) = packer.pack_many(values)
+
+        log = mock.Mock()
+        unpacker = protocol.MessageUnpacker(types[0:1], log)
+        self.assertEqual(unpacker.unpack_all(packet), values[0:1])
+        self.assertEqual(
+            log.mock_calls,
+            [mock.call.warn("Type %s not known, skipping", "my_other_type")],
+        )
+
+    def test_unpack_unknown_type_warns_once(self):
+        types, values = self._multi_values(5)
+        packer = protocol.MessagePacker(types, mock.Mock())
+        (packet,) = packer.pack_many(values)
+
+        log = mock.Mock()
+        unpacker = protocol.MessageUnpacker(types[0:1], log)
+        self.assertEqual(unpacker.unpack_all(packet), values[0::2])
+        self.assertEqual(
+            log.mock_calls,
+            [mock.call.warn("Type %s not known, skipping", "my_other_type")],
+        )
+
+    @pytest.mark.parametrize(
+        "sender_template, reason",
+        [
+            # the sender's idea of the type has different value types
+            (
+                [
+                    ("some_val", protocol.VALUE_DERIVE),
+                    ("some_other_val", protocol.VALUE_GAUGE),
+                ],
+                "value_type",
+            ),
+            # or a different number of values
+            ([("some_val", protocol.VALUE_GAUGE)], "value_count"),
+            (
+                [
+                    ("some_val", protocol.VALUE_GAUGE),
+                    ("some_other_val", protocol.VALUE_DERIVE),
+                    ("a_third_val", protocol.VALUE_DERIVE),
+                ],
+                "value_count",
+            ),
+        ],
+    )
+    def test_unpack_mismatched_values(self, sender_template, reason):
+        sender_type = protocol.Type("my_type", *sender_template)
+        receiver_type = protocol.Type(
+            "my_type",
+            ("some_val", protocol.VALUE_GAUGE),
+            ("some_other_val", protocol.VALUE_DERIVE),
+        )
+        value = protocol.Values(
+            type="my_type",
+            host="somehost",
+            plugin="someplugin",
+            plugin_instance="someplugininstance",
+            type_instance="sometypeinstance",
+            time=1517607042,
+            values=[450, 25, 10][0 : len(sender_template)],
+        )
+        message = protocol.MessagePacker(
+            [sender_type], mock.Mock()
+        ).pack_values(value)
+
+        unpacker = protocol.MessageUnpacker([receiver_type], mock.Mock())
+        self.assertEqual(unpacker.unpack_all(bytearray(message)), [])
+        self.assertEqual(
+            unpacker.rejects,
+            {
+                reject_reason: 1 if reject_reason == reason else 0
+                for reject_reason in protocol.REJECT_REASONS
+            },
+        )
@@ -0,0 +1,155 @@
+import threading
+from unittest import mock
+
+from .. import sketch
+from .. import testing
+
+
+class FingerprintTest(testing.TestBase):
+    def test_literals(self):
+        self.assertEqual(
+            sketch.fingerprint(
+                "SELECT t1.x FROM table1 AS t1 "
+                "WHERE y = 'it''s'   AND z = 5.5 AND w = -3"
+            ),
+            "SELECT t1.x FROM table1 AS t1 WHERE y = ? AND z = ? AND w = ?",
+        )
+
+    def test_in_lists(self):
+        self.assertEqual(
+            sketch.fingerprint("SELECT x FROM t WHERE id IN (?, ?, ?)"),
+            sketch.fingerprint("SELECT x FROM t WHERE id IN (?)"),
+        )
+        self.assertEqual(
+            sketch.fingerprint(
+                "SELECT x FROM t WHERE id IN (%(id_1)s, %(id_2)s)"
+            ),
+            "SELECT x FROM t WHERE id IN (?)",
+        )
+
+    def test_multi_values(self):
+        self.assertEqual(
+            sketch.fingerprint(
+                "INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s), (%s, %s)"
+            ),
+            "INSERT INTO t (a, b) VALUES (?)",
+        )
+
+    def test_digest(self):
+        self.assertEqual(
+            sketch.digest_for_statement("SELECT x FROM t WHERE y = 5"),
+            sketch.digest_for_statement("SELECT x FROM t WHERE y = 10"),
+        )
+        assert sketch.digest_for_statement(
+            "SELECT x FROM t"
+        ) != sketch.digest_for_statement("SELECT y FROM t")
+        self.assertEqual(
+            len(sketch.digest_for_statement("SELECT x FROM t")), 12
+        )
+
+    def test_digest_logged_once(self):
+        with mock.patch.object(sketch, "log") as log:
+            for statement in (
+                "SELECT x FROM logged_once WHERE y IN (1)",
+                "SELECT x FROM logged_once WHERE y IN (1, 2)",
+                "SELECT x FROM logged_once WHERE y IN (1, 2, 3)",
+            ):
+                sketch.digest_for_statement(statement)
+
+        self.assertEqual(
+            log.mock_calls,
+            [
+                mock.call.info(
+                    "statement %s: %s",
+                    sketch.digest_for_statement(
+                        "SELECT x FROM logged_once WHERE y IN (1)"
+                    ),
+                    "SELECT x FROM logged_once WHERE y IN (?)",
+                )
+            ],
+        )
+
+
+class SpaceSavingTest(testing.TestBase):
+    def test_under_capacity(self):
+        sketch_ = sketch.SpaceSaving(3)
+        sketch_.add("a", 1.0)
+        sketch_.add("b", 2.0)
+        sketch_.add("a", 1.5)
+
+        self.assertEqual(
+            sorted(sketch_.snapshot_and_reset()),
+            [("a", 2.5, 2, 0.0), ("b", 2.0, 1, 0.0)],
+        )
+        self.assertEqual(sketch_.snapshot_and_reset(), [])
+
+    def test_eviction(self):
+        sketch_ = sketch.SpaceSaving(2)
+        sketch_.add("heavy", 10.0)
+        sketch_.add("a", 1.0)
+
+        # replaces "a", inheriting its time as error
+        sketch_.add("b", 2.0)
+
+        self.assertEqual(
+            sorted(sketch_.snapshot_and_reset()),
+            [("b", 3.0, 1, 1.0), ("heavy", 10.0, 1, 0.0)],
+        )
+
+    def test_weighted(self):
+        sketch_ = sketch.SpaceSaving(1)
+        sketch_.add("a", 1.0, 10)
+        sketch_.add("a", 0.5, 10)
+
+        self.assertEqual(sketch_.snapshot_and_reset(), [("a", 15.0, 20, 0.0)])
+
+        sketch_.add("a", 1.0, 10)
+        sketch_.add("b", 0.5, 10)
+        self.assertEqual(sketch_.snapshot_and_reset(), [("b", 15.0, 10, 10.0)])
+
+    def test_bounded(self):
+        sketch_ = sketch.SpaceSaving(5)
+        for i in range(1000):
+            sketch_.add("heavy", 1.0)
+            sketch_.add("light%d" % i, 0.01)
+
+        entries = sketch_.snapshot_and_reset()
+        self.assertEqual(len(entries), 5)
+        self.assertEqual(
+            max(entries, key=lambda entry: entry[1])[0:3],
+            ("heavy", 1000.0, 1000),
+        )
+
+    def test_threads(self):
+        sketch_ = sketch.SpaceSaving(5)
+
+        def add(thread):
+            for i in range(2000):
+                sketch_.add("t%d-%d" % (thread, i), 0.01)
+
+        threads = [
+            threading.Thread(target=add, args=(thread,)) for thread in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        entries = sketch_.snapshot_and_reset()
+        self.assertEqual(len(entries), 5)
+        # every add() counted; an evicted entry's time carries over
+        assert abs(sum(entry[1] for entry in entries) - 80.0) < 1e-6
+
+    def test_merge(self):
+        self.assertEqual(
+            sketch.merge(
+                [
+                    ("a", 1.0, 1),
+                    ("b", 5.0, 10),
+                    ("a", 4.5, 3),
+                    ("c", 0.5, 1),
+                ],
+                2,
+            ),
+            [("a", 5.5, 4), ("b", 5.0, 10)],
+        )
@@ -142,3 +142,72 @@ class BreakIntoValuesTest(testing.TestBase):
         for v in data:
             l.extend(translator.break_into_individual_values(v))
         self.assertEqual(l, self._external_stream_one_element())
+
+
+class GroupSumsTest(testing.TestBase):
+    def _values(self, values, plugin="someplugin", interval=10):
+        return protocol.Values(
+            type="sometype",
+            plugin=plugin,
+            interval=interval,
+            values=values,
+        )
+
+    def test_add_remove(self):
+        sums: stream.GroupSums[str] = stream.GroupSums()
+        v1 = self._values([1, 2])
+        v2 = self._values([5, 5])
+        v3 = self._values([3, 0])
+        sums.add("a", v1)
+        sums.add("a", v2)
+        sums.add("b", v3)
+
+        self.assertEqual(
+            list(sums.sums()),
+            [
+                ("a", "someplugin", 10, [6, 7]),
+                ("b", "someplugin", 10, [3, 0]),
+            ],
+        )
+
+        sums.remove("a", v1)
+        sums.remove("b", v3)
+        self.assertEqual(list(sums.sums()), [("a", "someplugin", 10, [5, 5])])
+        self.assertEqual(len(sums), 1)
+
+        sums.remove("a", v2)
+        self.assertEqual(list(sums.sums()), [])
+
+    def test_mixed_fields(self):
+        sums: stream.GroupSums[str] = stream.GroupSums()
+        v1 = self._values([1], plugin="p1", interval=5)
+        sums.add("a", v1)
+        sums.add("a", self._values([1], plugin="p2", interval=10))
+        sums.add("a", self._values([1], plugin="p2", interval=10))
+
+        self.assertEqual(list(sums.sums()), [("a", None, 10, [3])])
+
+        sums.remove("a", v1)
+        self.assertEqual(list(sums.sums()), [("a", "p2", 10, [2])])
+
+    def test_weighted_sums_exact(self):
+        sums: stream.GroupSums[str] = stream.GroupSums()
+
+        # histogram counts weighted by 1 / sample rate
+        weight = 1 / 0.3
+        v1 = self._values([weight * 3, 0])
+        v2 = self._values([weight, weight * 7])
+        v3 = self._values([weight * 2, weight])
+        idle = self._values([0, 0])
+        for values_obj in (v1, v2, v3, idle):
+            sums.add("a", values_obj)
+
+        sums.remove("a", v2)
+        sums.remove("a", v3)
+        self.assertEqual(
+            list(sums.sums()), [("a", "someplugin", 10, [weight * 3, 0])]
+        )
+
+        sums.remove("a", v1)
+        self.assertEqual(list(sums.sums()), [("a", "someplugin", 10, [0, 0])])
+        assert not any(sums.get("a")[2])
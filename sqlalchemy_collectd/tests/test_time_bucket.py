@@ -1,4 +1,8 @@
+from __future__ import annotations
+
 import random
+from typing import Dict
+from typing import Tuple
 
 from .. import stream
 from .. import testing
@@ -44,3 +48,71 @@ class TimeBucketTest(testing.TestBase):
 
         # can't see old value
         self.assertRaises(ValueError, agg.get, 50539, "key")
+
+    def test_sub_second_interval(self) -> None:
+        agg: stream.TimeBucket[str, str] = stream.TimeBucket()
+        agg.put(50530.25, 0.5, "key", "value")
+
+        self.assertEqual(agg.get(50530.5, "key"), "value")
+        self.assertEqual(agg.get(50530.8, "key"), "value")
+
+        # expired after 1.2 intervals, which is less than a second
+        self.assertEqual(agg.get(50530.9, "key"), None)
+
+    def _scan(self, records, timestamp, interval_factor=1.2):
+        """Expire records the way TimeBucket did before its expiry heap,
+        by checking every record."""
+        for k in list(records):
+            ts, b_interval, value = records[k]
+            if ts < timestamp - b_interval * interval_factor:
+                del records[k]
+
+    def test_expiry_matches_scan(self) -> None:
+        agg: stream.TimeBucket[int, int] = stream.TimeBucket()
+        expected: Dict[int, Tuple[int, int, int]] = {}
+        intervals = [1, 2, 5, 10]
+
+        for timestamp in self._generate(10):
+            for i in range(20):
+                key = random.randint(0, 50)
+                interval = random.choice(intervals)
+                agg.put(timestamp, interval, key, timestamp)
+                self._scan(expected, timestamp)
+                expected[key] = (timestamp, interval, timestamp)
+
+            records = agg.get_data(timestamp)
+            self._scan(expected, timestamp)
+            self.assertEqual(
+                {k: records[k] for k in records},
+                {k: value for k, (ts, i, value) in expected.items()},
+            )
+
+    def test_replaced_key_not_expired(self) -> None:
+        agg: stream.TimeBucket[str, str] = stream.TimeBucket()
+        agg.put(100, 10, "key", "value_100")
+        agg.put(110, 10, "key", "value_110")
+
+        # the entry for the first put is due, but the key was replaced
+        self.assertEqual(agg.get(115, "key"), "value_110")
+        self.assertEqual(agg.get(121, "key"), "value_110")
+        self.assertEqual(agg.get(122.5, "key"), None)
+
+    def test_deleted_key_readded(self) -> None:
+        agg: stream.TimeBucket[str, str] = stream.TimeBucket()
+        records = agg.get_data(100, interval=10)
+        records["key"] = "value_100"
+        del records["key"]
+
+        records = agg.get_data(105, interval=10)
+        records["key"] = "value_105"
+        self.assertEqual(agg.get(114, "key"), "value_105")
+        self.assertEqual(agg.get(118, "key"), None)
+
+    def test_change_interval_factor(self) -> None:
+        agg: stream.TimeBucket[str, str] = stream.TimeBucket()
+        agg.put(100, 10, "key", "value")
+        agg.interval_factor = 2
+
+        self.assertEqual(agg.get(115, "key"), "value")
+        self.assertEqual(agg.get(120, "key"), "value")
+        self.assertEqual(agg.get(120.5, "key"), None)
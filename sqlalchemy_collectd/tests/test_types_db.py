@@ -0,0 +1,99 @@
+from unittest import mock
+
+from .. import protocol
+from .. import testing
+from .. import types_db
+
+
+TYPES_DB = """\
+# a comment
+
+absolute                value:ABSOLUTE:0:U
+load                    shortterm:GAUGE:0:5000, midterm:GAUGE:0:5000, \
+longterm:GAUGE:0:5000
+if_octets               rx:DERIVE:0:U, tx:DERIVE:0:U
+counter                 value:COUNTER:U:U
+"""
+
+
+class TypesDBTest(testing.TestBase):
+    def _write(self, tmp_path, name, text):
+        path = tmp_path / name
+        path.write_text(text)
+        return str(path)
+
+    def test_parse(self):
+        types = {t.name: t for t in types_db.parse(TYPES_DB.splitlines())}
+
+        self.assertEqual(
+            sorted(types), ["absolute", "counter", "if_octets", "load"]
+        )
+        self.assertEqual(
+            types["load"].names, ["shortterm", "midterm", "longterm"]
+        )
+        self.assertEqual(types["load"].types, [protocol.VALUE_GAUGE] * 3)
+        self.assertEqual(
+            types["if_octets"].types,
+            [protocol.VALUE_DERIVE, protocol.VALUE_DERIVE],
+        )
+        self.assertEqual(types["counter"].types, [protocol.VALUE_COUNTER])
+        self.assertEqual(types["absolute"].types, [protocol.VALUE_ABSOLUTE])
+
+    def test_parse_skips_bad_lines(self):
+        with mock.patch.object(types_db, "log") as log:
+            types = list(
+                types_db.parse(
+                    [
+                        "bad_type value:NOTATYPE:0:U",
+                        "short_ds value:GAUGE",
+                        "no_ds",
+                        "good value:GAUGE:0:U",
+                    ]
+                )
+            )
+
+        self.assertEqual([t.name for t in types], ["good"])
+        self.assertEqual(len(log.warning.mock_calls), 3)
+
+    def test_load_later_file_replaces(self, tmp_path):
+        default = self._write(tmp_path, "types.db", TYPES_DB)
+        custom = self._write(
+            tmp_path, "custom.db", "load value:GAUGE:0:U\nmine x:DERIVE:0:U\n"
+        )
+
+        types = types_db.load(default, custom)
+        self.assertEqual(types["load"].names, ["value"])
+        self.assertEqual(types["mine"].names, ["x"])
+        self.assertEqual(types["if_octets"].names, ["rx", "tx"])
+
+    def test_load_parses_once(self, tmp_path):
+        path = self._write(tmp_path, "types.db", TYPES_DB)
+
+        with mock.patch.object(
+            types_db, "parse", side_effect=types_db.parse
+        ) as parse:
+            first = types_db.load(path)
+            second = types_db.load(path)
+
+        self.assertEqual(len(parse.mock_calls), 1)
+        assert first["load"] is second["load"]
+
+    def test_unpack_loaded_types(self):
+        types = {t.name: t for t in types_db.parse(TYPES_DB.splitlines())}
+
+        value = protocol.Values(
+            type="if_octets",
+            host="somehost",
+            plugin="interface",
+            plugin_instance="eth0",
+            type_instance="",
+            time=50,
+            interval=10,
+            values=[500, 600],
+        )
+        message = protocol.MessagePacker(
+            list(types.values()), mock.Mock()
+        ).pack_values(value)
+
+        unpacker = protocol.MessageUnpacker(list(types.values()), mock.Mock())
+        self.assertEqual(unpacker.unpack_bytes(message), value)
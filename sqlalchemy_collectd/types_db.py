@@ -0,0 +1,97 @@
+"""Read collectd types.db files into :class:`.protocol.Type` objects.
+
+The format is described at
+https://collectd.org/documentation/manpages/types.db.5.shtml; each line
+names a type followed by its data sources, each of which is
+``name:TYPE:min:max``, e.g.::
+
+    load    shortterm:GAUGE:0:5000, midterm:GAUGE:0:5000, longterm:GAUGE:0:5000
+
+The minimum and maximum of each data source are not used here.
+
+Each file is parsed only once per process; :func:`.load` returns the types
+from a cache after that.
+
+"""
+from __future__ import annotations
+
+import functools
+import logging
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import Tuple
+
+from . import protocol
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TYPES_DB = "/usr/share/collectd/types.db"
+
+_value_types = {
+    "COUNTER": protocol.VALUE_COUNTER,
+    "GAUGE": protocol.VALUE_GAUGE,
+    "DERIVE": protocol.VALUE_DERIVE,
+    "ABSOLUTE": protocol.VALUE_ABSOLUTE,
+}
+
+
+def parse(
+    lines: Iterable[str], filename: str = "<string>"
+) -> Iterator[protocol.Type]:
+    """Yield a :class:`.protocol.Type` for each type in the lines of a
+    types.db file.
+
+    Lines that can't be parsed are logged and skipped, as collectd does.
+
+    """
+    for lineno, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        name, *data_sources = line.replace(",", " ").split()
+        db_template = []
+        for data_source in data_sources:
+            fields = data_source.split(":")
+            if len(fields) != 4 or fields[1].upper() not in _value_types:
+                log.warning(
+                    "%s line %d: can't parse data source %r of type %s, "
+                    "skipping",
+                    filename,
+                    lineno,
+                    data_source,
+                    name,
+                )
+                break
+            db_template.append((fields[0], _value_types[fields[1].upper()]))
+        else:
+            if not db_template:
+                log.warning(
+                    "%s line %d: type %s has no data sources, skipping",
+                    filename,
+                    lineno,
+                    name,
+                )
+                continue
+            yield protocol.Type(name, *db_template)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_file(path: str) -> Tuple[protocol.Type, ...]:
+    with open(path) as file_:
+        return tuple(parse(file_, path))
+
+
+def load(*paths: str) -> Dict[str, protocol.Type]:
+    """Return the types in the given types.db files keyed on name.
+
+    As with collectd's ``TypesDB`` option, a type in a later file replaces
+    a type of the same name in an earlier one.  Defaults to the types.db
+    installed with collectd.
+
+    """
+    types: Dict[str, protocol.Type] = {}
+    for path in paths or (DEFAULT_TYPES_DB,):
+        types.update((type_.name, type_) for type_ in _load_file(path))
+    return types